@@ -10,12 +10,8 @@ APSIN20G_module_version = '1.0.1'
 
 ###############################################################################################
 # imports
-import vxi11 as vx
 import time
 import numpy as np
-import scipy as sc
-from scipy import optimize,signal
-import matplotlib.pylab as plt
 ###############################################################################################
 
 ###############################################################################################
@@ -23,6 +19,7 @@ import matplotlib.pylab as plt
 
 class APSIN20G(object):
     def __init__(self,ip):
+        import vxi11 as vx # only needed once an instrument is opened
         self.v = vx.Instrument(str(ip))
         
     def cmd(self,str1,arg):
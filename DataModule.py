@@ -8,12 +8,36 @@ Version 1.1.0
 
 DataModule_module_version = '1.1.0'
 
+import os
+import json
+import importlib
+import logging
+import threading
+import time
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-import scipy.stats as stat
 import pickle
-from scipy import optimize,signal,interpolate
+
+
+class lazy_module(object):
+    '''Stands in for a module that is imported on first attribute access, so that importing 
+    DataModule (and the instrument modules using it) does not load matplotlib and scipy.'''
+    def __init__(self,name):
+        self.name = name
+        self.module = None
+        
+    def __getattr__(self,attr):
+        if attr in ('name','module'):
+            raise AttributeError(attr)
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module,attr)
+
+plt = lazy_module('matplotlib.pyplot')
+matplotlib = lazy_module('matplotlib')
+optimize = lazy_module('scipy.optimize')
+signal = lazy_module('scipy.signal')
+interpolate = lazy_module('scipy.interpolate')
+ndimage = lazy_module('scipy.ndimage')
 
 ##############################################################################
 # Functions
@@ -66,41 +90,46 @@ def plot_temp_2col(fontname='Arial'):
     return fig,ax
 
 
-def cleandat(x,y):
+def cleandat(x,y,tol=0,singleton_err=0.,full=False):
     """
     This function takes a two row data matrix (x,y) and does the following:
     1- sorts the data in ascending form based on the x row.
     2- finds the unique values of x and put the average of corresponding y in the y column
-    in the future: 3- adds a third row with standard deviation for multiple data (indication of statistical error)
-    """
-    # check data form
+    3- returns the standard error of the mean of every group (singleton_err for groups of a single point)
     
-    # assign variables
-    #x = dat[1,:]
-    #y = dat[2,:]
+    tol: x values less than tol above the previous one join its group (x_uq is then the group mean of x)
+    y can hold several traces: a 2-D y with one trace per row sharing the 1-D x gives one output row
+    per trace, x and y of the same shape are merged into a single output.
+    full=True also returns the variances and the number of points of every group.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y,dtype='float')
+    if x.shape == y.shape:
+        x = x.ravel()
+        y = y.ravel()
     
-    x_sort_idx = np.argsort(x)
+    x_sort_idx = np.argsort(x,kind='stable')
     x_srt = x[x_sort_idx]
-    y_srt = y[x_sort_idx]
-    
-    # finding unique values
-    x_uq,x_uq_idx = np.unique(x_srt,return_index=True)
+    y_srt = y[...,x_sort_idx]
     
-    # the statistic loop
-    l = len(x_uq_idx)
-    y_out = np.ones(l)
-    y_err = np.ones(l)
-    
-
-    for i in np.arange(l-1):
-        y_out[i] = np.mean(y_srt[x_uq_idx[i]:x_uq_idx[i+1]])
-        #y_err[i] = np.std(y_srt[x_uq_idx[i]:x_uq_idx[i+1]])
-        y_err[i] = stat.sem(y_srt[x_uq_idx[i]:x_uq_idx[i+1]])
+    # groups of (nearly) equal x
+    starts = np.flatnonzero(np.concatenate(([True],np.diff(x_srt) > tol)))
+    counts = np.diff(np.append(starts,len(x_srt)))
+    if tol > 0:
+        x_uq = np.add.reduceat(x_srt,starts)/counts
+    else:
+        x_uq = x_srt[starts]
     
-    y_out[-1] = np.mean(y_srt[x_uq_idx[-1]:])
-    #y_err[-1] = np.std(y_srt[x_uq_idx[-1]:])
-    y_err[-1] = stat.sem(y_srt[x_uq_idx[-1]:])
+    # the statistics of all groups at once
+    y_out = np.add.reduceat(y_srt,starts,axis=-1)/counts
+    dev = y_srt - np.repeat(y_out,counts,axis=-1)
+    y_var = np.add.reduceat(dev**2,starts,axis=-1)/np.maximum(counts-1,1)
+    y_err = np.sqrt(y_var/counts)
+    y_var = np.where(counts > 1,y_var,0.)
+    y_err = np.where(counts > 1,y_err,singleton_err)
     
+    if full:
+        return x_uq, y_out, y_err, y_var, counts
     return x_uq, y_out, y_err
 
 
@@ -111,71 +140,774 @@ def parity(number):
         print("Even!")
 
 
+def sort_info(vector):
+    """Returns (is_sorted, sort permutation, sorted vector) of a 1-D axis, the permutation and 
+    the sorted copy are None for axes that are already in ascending order. Data objects keep 
+    this so that repeated range selections do not sort again."""
+    x = np.asarray(vector).ravel()
+    if len(x) < 2 or np.all(x[1:] >= x[:-1]):
+        return True,None,None
+    sorter = np.argsort(x,kind='stable')
+    return False,sorter,x[sorter]
+
+def merge_ranges(lo,hi):
+    """Merges overlapping intervals [lo_i,hi_i], returns the sorted disjoint intervals."""
+    keep = hi >= lo
+    lo = lo[keep]
+    hi = hi[keep]
+    order = np.argsort(lo,kind='stable')
+    lo = lo[order]
+    hi = np.maximum.accumulate(hi[order])
+    # a new interval starts where lo exceeds the running end of the previous ones
+    start = np.concatenate(([True],lo[1:] > hi[:-1])) if len(lo) else np.zeros(0,dtype=bool)
+    last = np.concatenate((np.flatnonzero(start)[1:]-1,[len(lo)-1])) if len(lo) else np.zeros(0,dtype=int)
+    return lo[start],hi[last]
+
+def select_ranges(vector,range_vector,info=None):
+    """Returns the index of the elements of vector that fall within the ranges 
+    [lo_0,hi_0,lo_1,hi_1,...] (bounds included).
+    Sorted axes are resolved with np.searchsorted: a single contiguous run is returned as a 
+    slice (indexing gives a view), several runs as an integer array. For unsorted axes the 
+    sort permutation from info (see sort_info) is used, the result is an integer array in the 
+    original order. Without info the merged ranges are tested point by point."""
+    x = np.asarray(vector).ravel()
+    ranges = np.array(range_vector,dtype='float').ravel()
+    if (len(ranges) & 1):
+        raise Exception('Number of range elements must be even.')
+    lo,hi = merge_ranges(ranges[0::2],ranges[1::2])
+    
+    if info is None:
+        if len(x) < 2 or np.all(x[1:] >= x[:-1]):
+            info = (True,None,None)
+        else:
+            mask = np.zeros(len(x),dtype=bool)
+            for l,h in zip(lo,hi):
+                mask |= (x >= l) & (x <= h)
+            return np.flatnonzero(mask)
+    
+    is_sorted,sorter,x_srt = info
+    if is_sorted:
+        x_srt = x
+    a = np.searchsorted(x_srt,lo,side='left')
+    b = np.searchsorted(x_srt,hi,side='right')
+    if is_sorted and len(a) <= 1:
+        return slice(int(a[0]),int(b[0])) if len(a) else slice(0,0)
+    idx = np.concatenate([np.arange(i,j) for i,j in zip(a,b)]) if len(a) else np.zeros(0,dtype=int)
+    if is_sorted:
+        return idx
+    return np.sort(sorter[idx])
+
 def split(vector,range_vector):
     """This function gets a list (array) of ranges (must have even members) and returns 
-    the data in x that fall within those ranges.  """
+    the data in x that fall within those ranges: (boolean index, selected data).
+    See select_ranges for the faster index/slice form used by the data classes."""
+    idx = np.zeros(len(np.asarray(vector).ravel()),dtype=bool)
+    idx[select_ranges(vector,range_vector)] = True
+    return idx,vector[idx]
+
+def full_range(rng):
+    """True for the 'select everything' range arguments ([0,0] or None)."""
+    return rng is None or (len(np.ravel(rng)) == 2 and not np.any(np.ravel(rng)))
+
+def smooth_window(y,nnb,axis=-1,mode='shrink',kernel='box',polyorder=2,sigma=None):
+    """Smooths y along 'axis' with a window of the point and its 'nnb' neighbours on each side
+    (2*nnb+1 points). Works on N-D arrays, all rows are processed at once.
+    kernel: 'box'      moving average (cumulative sums, O(n) for any window width)
+            'gaussian' gaussian weights with standard deviation sigma (default nnb/3 points)
+            'savgol'   Savitzky-Golay polynomial of order polyorder
+    mode: edge handling
+            'shrink'   the window is truncated at the ends (the average of the available points,
+                       as smooth() always did; for 'savgol' the edge polynomial is used)
+            'reflect'  the data are mirrored at the ends (d c b a | a b c d | d c b a)
+            'nearest'  the end values are repeated
+            'valid'    only points with a full window are returned (2*nnb points shorter)"""
+    y = np.asarray(y,dtype='float')
+    axis = axis % y.ndim
+    n = y.shape[axis]
+    w = 2*nnb+1
+    if nnb <= 0:
+        return y.copy()
     
-    # Convert input to row vectors
-    x = np.array(vector).ravel()
-    ranges = np.array(range_vector).ravel()
+    def along(arr,sl):
+        idx = [slice(None)]*arr.ndim
+        idx[axis] = sl
+        return arr[tuple(idx)]
     
-    # initialize variables
-    idx = np.ma.zeros(len(x)) 
+    def weights():
+        s = nnb/3. if sigma is None else sigma
+        k = np.exp(-0.5*(np.arange(-nnb,nnb+1)/s)**2)
+        return k/k.sum()
     
-    # check if "ranges" has even elements
-    if (len(range_vector) & 1):
-        raise Exception('Number of range elements must be even.')
-    else:
-        # Making the new index and output
-        for i in range(int(len(ranges)/2)):
-            idx_tmp = np.logical_and(x>=ranges[2*i],x<=ranges[2*i+1])
-            idx = np.logical_or(idx,idx_tmp)
-        return idx,vector[idx]
+    def cumsum0(yp):
+        # cumulative sum along axis with a leading zero
+        shp = list(yp.shape)
+        shp[axis] += 1
+        c = np.zeros(shp)
+        np.cumsum(yp,axis=axis,out=along(c,slice(1,None)))
+        return c
+    
+    def valid(yp):
+        # filter output for the points of yp that have a full window
+        if kernel == 'box':
+            c = cumsum0(yp)
+            return (along(c,slice(w,None)) - along(c,slice(0,-w)))/w
+        if kernel == 'gaussian':
+            return along(ndimage.correlate1d(yp,weights(),axis=axis,mode='constant'),slice(nnb,-nnb))
+        if kernel == 'savgol':
+            return along(signal.savgol_filter(yp,w,polyorder,axis=axis,mode='interp'),slice(nnb,-nnb))
+        raise ValueError('Unknown kernel: '+str(kernel))
+    
+    if mode == 'valid':
+        return valid(y)
+    if mode in ('reflect','nearest'):
+        pad = [(0,0)]*y.ndim
+        pad[axis] = (nnb,nnb)
+        return valid(np.pad(y,pad,mode='symmetric' if mode == 'reflect' else 'edge'))
+    if mode != 'shrink':
+        raise ValueError('Unknown mode: '+str(mode))
+    
+    shape = [1]*y.ndim
+    shape[axis] = n
+    if kernel == 'box':
+        c = cumsum0(y)
+        if n < w:
+            i = np.arange(n)
+            lo = np.maximum(i-nnb,0)
+            hi = np.minimum(i+nnb+1,n)
+            return (np.take(c,hi,axis=axis) - np.take(c,lo,axis=axis))/(hi-lo).reshape(shape)
+        out = np.empty_like(y)
+        # full windows in the middle, truncated ones at both ends
+        along(out,slice(nnb,n-nnb))[...] = (along(c,slice(w,None)) - along(c,slice(0,n+1-w)))/w
+        along(out,slice(0,nnb))[...] = (along(c,slice(nnb+1,w)) - along(c,slice(0,1)))/np.arange(nnb+1,w).reshape(shape[:axis]+[nnb]+shape[axis+1:])
+        along(out,slice(n-nnb,n))[...] = (along(c,slice(n,n+1)) - along(c,slice(n-2*nnb,n-nnb)))/np.arange(w-1,nnb,-1).reshape(shape[:axis]+[nnb]+shape[axis+1:])
+        return out
+    if kernel == 'gaussian':
+        # normalised convolution: the weights of the missing points are left out
+        k = weights()
+        norm = ndimage.correlate1d(np.ones(n),k,mode='constant')
+        return ndimage.correlate1d(y,k,axis=axis,mode='constant')/norm.reshape(shape)
+    if kernel == 'savgol':
+        return signal.savgol_filter(y,min(w,n-(1-n%2)),polyorder,axis=axis,mode='interp')
+    raise ValueError('Unknown kernel: '+str(kernel))
 
-def smooth(x,y,nnb):
+def smooth(x,y,nnb,mode='shrink',kernel='box',**kwargs):
     """This is a very simple smoothing function that for each point in x, takes
     the average value of corresponding y and its 'nnb' neighbors on each side.
     WARNING: the 'nnb' points at the beginning and the end should be handled with care as
-    they are averaged on a non-symmetric window.    
+    they are averaged on a non-symmetric window (see smooth_window for the other edge modes 
+    and kernels).
     
     This example takes average on a 21-point window.(10 on each side and the point itself)
     y_smth = smooth(x,y,10)  """
-    def lo_lim(i):
-        return i if i > 0 else 0
-    def hi_lim(i):
-        return i+1 if i < len(x)-1 else len(x)
-    
-    yy = np.zeros(np.shape(y))
-    
-    for i in np.arange(len(x)):
-        msk = np.arange(lo_lim(i-nnb),hi_lim(i+nnb))
-        yy[i] = np.mean(y[msk])
-    
-    return yy
+    return smooth_window(y,nnb,axis=-1,mode=mode,kernel=kernel,**kwargs)
         
 
     
-def smooth_vec(x,y,nnb):
+def smooth_vec(x,y,nnb,mode='shrink',kernel='box',**kwargs):
     """This is a very simple smoothing function that for each point in x, takes
     the average value of corresponding y and its 'nnb' neighbors on each side.
     WARNING: the 'nnb' points at the beginning and the end should be handled with care as
-    they are averaged on a non-symmetric window.    
+    they are averaged on a non-symmetric window (see smooth_window for the other edge modes 
+    and kernels).
     
-    This example takes average on a 21-point window.(10 on each side and the point itself)
-    y_smth = smooth(x,y,10)  """
-    def lo_lim(i):
-        return i if i > 0 else 0
-    def hi_lim(i):
-        return i+1 if i < len(x)-1 else len(x)
-    
-    yy = np.zeros(np.shape(y))
+    Here y is 2-D and every row is smoothed along x (axis 1).
+    y_smth = smooth_vec(x,y,10)  """
+    return smooth_window(y,nnb,axis=1,mode=mode,kernel=kernel,**kwargs)
+	
+##############################################################################
+# Minima
+##############################################################################
+def local_minima(y,order=1,axis=-1,threshold=None):
+    """Boolean mask of the strict local minima of y along axis: points lower than their 'order'
+    neighbors on each side (as signal.argrelextrema(y,np.less,order), the first and last point
+    are never minima) and, optionally, lower than threshold. Works on any number of traces at
+    once, e.g. every row of a data_3d map."""
+    y = np.asarray(y,dtype='float')
+    axis = axis % y.ndim
+    def part(a,sl):
+        idx = [slice(None)]*y.ndim
+        idx[axis] = sl
+        return a[tuple(idx)]
+    # minima of y[i:i+order] and y[i-order+1:i+1], moved by one point so that y[i] is excluded
+    fwd = ndimage.minimum_filter1d(y,order,axis=axis,origin=-(order//2),mode='nearest')
+    bwd = ndimage.minimum_filter1d(y,order,axis=axis,origin=(order-1)//2,mode='nearest')
+    right = np.concatenate((part(fwd,slice(1,None)),part(y,slice(-1,None))),axis=axis)
+    left = np.concatenate((part(y,slice(0,1)),part(bwd,slice(None,-1))),axis=axis)
+    mask = (y < right) & (y < left)
+    if threshold is not None:
+        mask &= y < threshold
+    return mask
+
+def minima_index(y,prominence=None,width=None,threshold=None,distance=None,wlen=None):
+    """Indices and find_peaks properties of the minima of y."""
+    height = None if threshold is None else -threshold
+    return signal.find_peaks(-np.asarray(y,dtype='float'),height=height,distance=distance,wlen=wlen,
+                             prominence=(0 if prominence is None else prominence),
+                             width=(0 if width is None else width))
+
+def minima_table(x,y,idx,props):
+    ip = np.arange(len(x))
+    w = np.abs(np.interp(props['right_ips'],ip,x) - np.interp(props['left_ips'],ip,x))
+    return np.vstack((x[idx],y[idx],props['prominences'],w))
+
+def find_minima(x,y,prominence=None,width=None,threshold=None,distance=None,wlen=None):
+    """Minima of y with signal.find_peaks: returns a (4,n) array of x, y, prominence and full
+    width at half prominence (in x units) of every minimum. threshold: only minima below it,
+    width and distance in points."""
+    x = np.asarray(x,dtype='float')
+    y = np.asarray(y,dtype='float')
+    idx,props = minima_index(y,prominence,width,threshold,distance,wlen)
+    return minima_table(x,y,idx,props)
+
+
+class minfinder(object):
+    """Streaming minimum (resonance) finder: feed the trace in chunks as they arrive, e.g.
+    the segments of collect_scan, and get the minima of every chunk as soon as they are
+    final. Only the last 2*overlap points are kept between chunks; prominence and width are
+    evaluated within +-overlap points of a minimum (find_peaks wlen), so the result is the
+    same as find_minima(...,wlen=2*overlap+1) on the whole trace.
+
+    mf = minfinder(overlap=200,prominence=3,threshold=-20)
+    dat = vna.collect_scan(f_range_mat,callback=mf.callback)
+    mf.flush()
+    res = mf.minima      # (4,n): x, y, prominence, width
+    """
+    def __init__(self,overlap=100,prominence=None,width=None,threshold=None,distance=None):
+        self.overlap = int(overlap)
+        self.kw = dict(prominence=prominence,width=width,threshold=threshold,distance=distance,
+                       wlen=2*self.overlap+1)
+        self.reset()
+
+    def reset(self):
+        self.xbuf = np.zeros(0)
+        self.ybuf = np.zeros(0)
+        self.offset = 0 # index of xbuf[0] in the whole trace
+        self.done = 0 # the minima before this index have been reported
+        self.found = []
+
+    @property
+    def minima(self):
+        return np.hstack(self.found) if self.found else np.zeros((4,0))
+
+    def report(self,stop):
+        # minima of the buffer with an index in [done,stop) of the whole trace
+        idx,props = minima_index(self.ybuf,**self.kw)
+        keep = (idx + self.offset >= self.done) & (idx + self.offset < stop)
+        new = minima_table(self.xbuf,self.ybuf,idx,props)[:,keep]
+        self.done = max(self.done,stop)
+        self.found.append(new)
+        return new
+
+    def push(self,x,y):
+        ''' Adds a chunk, returns the (4,n) array of the minima that became final.'''
+        self.xbuf = np.concatenate((self.xbuf,np.asarray(x,dtype='float').ravel()))
+        self.ybuf = np.concatenate((self.ybuf,np.asarray(y,dtype='float').ravel()))
+        new = self.report(self.offset + len(self.xbuf) - self.overlap)
+        drop = max(0,len(self.xbuf) - 2*self.overlap)
+        self.offset += drop
+        self.xbuf = self.xbuf[drop:]
+        self.ybuf = self.ybuf[drop:]
+        return new
+
+    def flush(self):
+        ''' End of the trace: reports the remaining minima.'''
+        return self.report(self.offset + len(self.xbuf))
+
+    def callback(self,i,x,y):
+        ''' collect_scan callback for segment i.'''
+        return self.push(x,y)
+
+
+##############################################################################
+# Parallel execution
+##############################################################################
+def parallel_map(func,tasks,processes=1):
+    """Yields func(*args) for every args in tasks, in order. processes=1 (default) runs them in 
+    this process; more processes is opt-in and runs them in a ProcessPoolExecutor with at most 
+    2*processes tasks in flight, so results are consumed as they come. func and the arguments 
+    must be picklable (module level functions), and on platforms that start the workers with 
+    'spawn' (Windows, macOS) the calling script needs an if __name__ == '__main__': guard. If 
+    they cannot be pickled, the tasks run in this process and a warning is logged."""
+    tasks = list(tasks)
+    processes = max(1,min(int(processes),len(tasks)))
+    if processes > 1:
+        try:
+            pickle.dumps((func,tasks[0]))
+        except Exception:
+            logging.getLogger(__name__).warning('parallel_map: %r or its arguments cannot be pickled, '
+                                                'running in this process.',func)
+            processes = 1
+    if processes == 1:
+        for args in tasks:
+            yield func(*args)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(processes) as pool:
+        pending = []
+        for args in tasks:
+            pending.append(pool.submit(func,*args))
+            if len(pending) >= 2*processes:
+                yield pending.pop(0).result()
+        for f in pending:
+            yield f.result()
+
+
+##############################################################################
+# Fitting
+##############################################################################
+def fit_residual(fitfunc,y):
+    """Residual p,x -> fitfunc(p,x)-y for leastsq, complex data give [real, imag]."""
+    if np.iscomplexobj(y):
+        def res(p,x):
+            r = fitfunc(p,x) - y
+            return np.concatenate((r.real,r.imag))
+    else:
+        res = lambda p,x: fitfunc(p,x) - y
+    return res
+
+def fit_jacobian(jac,y):
+    """Jacobian p,x -> (npoints,nparams) matching fit_residual (None: finite differences)."""
+    if jac is None:
+        return None
+    if np.iscomplexobj(y):
+        def dres(p,x):
+            J = jac(p,x)
+            return np.vstack((J.real,J.imag))
+        return dres
+    return lambda p,x: np.asarray(jac(p,x),dtype='float')
+
+def fit_trace(fitfunc,p0,x,y,jac=None,maxfev=0):
+    """Least-squares fit of one trace with optimize.leastsq.
+    fitfunc(p,x) returns the model (may be complex), jac(p,x) its derivatives with respect to p 
+    as an (len(x),len(p)) array, None uses finite differences. Models with jac and guess 
+    methods (see ResonatorModule) provide both, p0 = None then uses fitfunc.guess(x,y); their 
+    canonical and valid methods also normalize the result and check it for success.
+    Returns (p_fit, covariance, sum of squared residuals, number of function calls, success)."""
+    y = np.asarray(y)
+    if p0 is None:
+        p0 = fitfunc.guess(x,y)
+    if jac is None:
+        jac = getattr(fitfunc,'jac',None)
+    res = fit_residual(fitfunc,y)
+    out = optimize.leastsq(res,np.array(p0,dtype='float'),args=(x,),Dfun=fit_jacobian(jac,y),
+                           full_output=1,maxfev=maxfev)
+    p,cov,info,ier = out[0],out[1],out[2],out[4]
+    p = np.atleast_1d(p)
+    success = ier in (1,2,3,4) and cov is not None and bool(np.all(np.isfinite(p)))
+    if hasattr(fitfunc,'canonical'):
+        p = fitfunc.canonical(p)
+        success = success and fitfunc.valid(p,x)
+    ss = np.sum(info['fvec']**2)
+    dof = len(info['fvec']) - len(p)
+    if cov is None or dof <= 0:
+        cov = np.full((len(p),len(p)),np.nan)
+    else:
+        cov = cov*ss/dof
+    return p,cov,ss,info['nfev'],success
+
+def fit_block(fitfunc,p0,x,Y,jac,warm_start,maxfev):
+    """Fits the rows of Y in order, see fit_batch."""
+    n = len(Y)
+    npar = len(p0[0]) if p0.ndim == 2 else len(p0)
+    params = np.empty((n,npar))
+    cov = np.empty((n,npar,npar))
+    ss = np.empty(n)
+    nfev = np.empty(n,dtype=int)
+    success = np.empty(n,dtype=bool)
+    for i in range(n):
+        if warm_start and i > 0 and success[i-1]:
+            p_start = params[i-1]
+        else:
+            p_start = p0[i] if p0.ndim == 2 else p0
+        params[i],cov[i],ss[i],nfev[i],success[i] = fit_trace(fitfunc,p_start,x,Y[i],jac,maxfev)
+    return params,cov,ss,nfev,success
+
+def fit_batch(fitfunc,p0,x,Y,jac=None,warm_start=True,processes=1,maxfev=0):
+    """Fits every row of Y (e.g. data_3d.zsel) to fitfunc(p,x), see fit_trace.
+    p0: initial parameters, one set for all rows, one set per row ((nrows,nparams) array), a 
+        function p0(x,y) estimating them per row or None for fitfunc.guess.
+    warm_start: every fit starts from the result of the previous row, which is usually close 
+        for the rows of a power or flux sweep.
+    processes: number of worker processes (default 1: fits in this process). With more, the 
+        rows are split in contiguous blocks, one per process, and warm started within a block; 
+        see parallel_map for the requirements (picklable fitfunc and jac, __main__ guard).
+    Returns a dict with 'params' (nrows,nparams), 'cov' (nrows,nparams,nparams), 'residual' 
+    (sum of squares per row), 'nfev' and 'success'.
     
-    for i in np.arange(len(x)):
-        msk = np.arange(lo_lim(i-nnb),hi_lim(i+nnb))
-        yy[:,i] = np.mean(y[:,msk],axis=1)
+    res = fit_batch(model,[7e9,1e4,0],d3.xsel,d3.zsel,jac=model_jac)
+    plt.plot(d3.ysel,res['params'][:,0])"""
+    Y = np.atleast_2d(Y)
+    x = np.asarray(x)
+    if p0 is None:
+        p0 = fitfunc.guess
+    if callable(p0):
+        p0 = np.array([p0(x,Y[i]) for i in range(len(Y))],dtype='float')
+    else:
+        p0 = np.array(p0,dtype='float')
     
-    return yy
+    processes = max(1,min(processes,len(Y)))
+    bounds = np.linspace(0,len(Y),processes+1).astype(int)
+    tasks = [(fitfunc,p0[a:b] if p0.ndim == 2 else p0,x,np.asarray(Y[a:b]),jac,warm_start,maxfev)
+             for a,b in zip(bounds[:-1],bounds[1:])]
+    out = list(parallel_map(fit_block,tasks,processes))
+    keys = ('params','cov','residual','nfev','success')
+    return dict((k,np.concatenate([o[j] for o in out])) for j,k in enumerate(keys))
+
+def plot_fit(x,y,fitfunc,p_fit,p_init=None,figuresize=(16,9)):
+    """Plots the data with the fitted (and initial) model, complex data are plotted as magnitude."""
+    yplt = np.abs if np.iscomplexobj(y) else np.asarray
+    plt.figure(figsize=figuresize)
+    if p_init is not None:
+        plt.plot(x, yplt(y), "bo", x, yplt(fitfunc(p_init, x)), "g-", x, yplt(fitfunc(p_fit, x)), "r-",linewidth=2) # Plot of the data and the fit
+        plt.legend(('Data', 'Init', 'fit'))
+    else:
+        plt.plot(x, yplt(y), "bo", x, yplt(fitfunc(p_fit, x)), "r-",linewidth=2) # Plot of the data and the fit
+        plt.legend(('Data', 'fit'))
+    plt.title("Fitting to a given function",fontsize=20)
+    plt.xlabel("X",fontsize=14)
+    plt.ylabel("Y",fontsize=14)
+    plt.gca().get_xaxis().get_major_formatter().set_useOffset(False)
+    plt.gca().get_yaxis().get_major_formatter().set_useOffset(False)
 	
+##############################################################################
+# Resampling
+##############################################################################
+spline_order = {'nearest':0,'linear':1,'cubic':3}
+
+def ascending(axis,z,dim):
+    """Returns axis and z flipped along dim if axis is descending."""
+    axis = np.asarray(axis,dtype='float')
+    if len(axis) > 1 and axis[0] > axis[-1]:
+        return axis[::-1],np.flip(z,dim)
+    return axis,z
+
+def nearest_index(axis,new):
+    """Index of the point of the ascending axis closest to every element of new."""
+    if len(axis) == 1:
+        return np.zeros(np.shape(new),dtype=int)
+    i = np.clip(np.searchsorted(axis,new),1,len(axis)-1)
+    return np.where(new-axis[i-1] <= axis[i]-new,i-1,i)
+
+def outside(axis,new):
+    """True for the elements of new outside the range of the ascending axis."""
+    return (new < axis[0]) | (new > axis[-1])
+
+def window_slice(axis,new,margin=4):
+    """Slice of the ascending axis covering new plus 'margin' points on each side."""
+    s = index_range(axis,[np.min(new),np.max(new)])
+    lo = np.searchsorted(axis,np.min(new)) if s.start == s.stop else s.start
+    return slice(max(lo-margin,0),min(max(s.stop,lo)+margin,len(axis)))
+
+
+class resampler(object):
+    """Interpolator of a trace z(x) or of a map z(y,x) given on a rectangular grid (as measured
+    by the VNA), kind: 'nearest', 'linear' or 'cubic'. The splines are built once, calls only
+    evaluate them; maps are evaluated in tiles of 'tile' output rows to bound the memory.
+    Complex data are interpolated as real and imaginary part. Points outside the grid are set
+    to fill_value (NaN by default), fill_value=None extrapolates the splines.
+
+    f = resampler(d3.xsel,d3.zsel,d3.ysel,'cubic')
+    znew = f(xnew,ynew)"""
+    def __init__(self,x,z,y=None,kind='cubic'):
+        if kind not in spline_order:
+            raise ValueError('kind must be one of '+', '.join(spline_order))
+        self.kind = kind
+        z = np.asarray(z)
+        self.x,z = ascending(x,z,z.ndim-1)
+        self.y = None
+        if y is not None:
+            self.y,z = ascending(y,z,0)
+        self.z = z
+        k = spline_order[kind]
+        if k == 0:
+            return
+        if y is None:
+            self.spline = interpolate.make_interp_spline(self.x,z,k=min(k,len(self.x)-1),axis=-1)
+        else:
+            parts = (z.real,z.imag) if np.iscomplexobj(z) else (z,)
+            self.spline = [interpolate.RectBivariateSpline(self.y,self.x,part,kx=min(k,len(self.y)-1),
+                                                           ky=min(k,len(self.x)-1),s=0) for part in parts]
+
+    def __call__(self,xnew,ynew=None,tile=256,fill_value=np.nan):
+        xnew = np.asarray(xnew,dtype='float')
+        if self.y is None:
+            if self.kind == 'nearest':
+                out = self.z[...,nearest_index(self.x,xnew)]
+            else:
+                out = self.spline(xnew)
+            return self.fill(out,fill_value,outside(self.x,xnew))
+
+        ynew = np.asarray(ynew,dtype='float')
+        if self.kind == 'nearest':
+            out = self.z[np.ix_(nearest_index(self.y,ynew),nearest_index(self.x,xnew))]
+            return self.fill(out,fill_value,outside(self.y,ynew)[:,None] | outside(self.x,xnew))
+        # the grid evaluation needs ascending coordinates
+        xo = np.argsort(xnew,kind='stable')
+        yo = np.argsort(ynew,kind='stable')
+        out = np.empty((len(ynew),len(xnew)),dtype=self.z.dtype if np.iscomplexobj(self.z) else 'float')
+        for a in range(0,len(ynew),tile):
+            rows = yo[a:a+tile]
+            block = self.spline[0](ynew[rows],xnew[xo])
+            if len(self.spline) > 1:
+                block = block + 1j*self.spline[1](ynew[rows],xnew[xo])
+            out[np.ix_(rows,xo)] = block
+        return self.fill(out,fill_value,outside(self.y,ynew)[:,None] | outside(self.x,xnew))
+
+    @staticmethod
+    def fill(out,fill_value,mask):
+        if fill_value is None or not np.any(mask):
+            return out
+        return np.where(mask,fill_value,out)
+
+
+def resample_1d(x,y,xnew,kind='linear',fill_value=np.nan):
+    """Interpolates the trace y(x) at xnew, see resampler."""
+    return resampler(x,y,kind=kind)(xnew,fill_value=fill_value)
+
+def resample_2d(x,y,z,xnew,ynew,kind='cubic',tile=256,fill_value=np.nan):
+    """Interpolates the map z(y,x) at the grid (ynew,xnew), see resampler. Only the part of the
+    map around the output window is used to build the splines."""
+    xa,z = ascending(x,np.asarray(z),1)
+    ya,z = ascending(y,z,0)
+    xs = window_slice(xa,xnew)
+    ys = window_slice(ya,ynew)
+    return resampler(xa[xs],z[ys,xs],ya[ys],kind)(xnew,ynew,tile,fill_value)
+
+
+##############################################################################
+# Rendering
+##############################################################################
+def lut_cmap(cmap,n):
+    """cmap (name or Colormap) resampled to n colors."""
+    if isinstance(cmap,str):
+        cmap = plt.get_cmap(cmap)
+    return cmap.resampled(n) if hasattr(cmap,'resampled') else plt.cm.get_cmap(cmap,n)
+
+def block_reduce(z,axis,mode):
+    """Halves z along axis by combining pairs of points with mode 'mean', 'min' or 'max' (an odd
+    last point is paired with itself)."""
+    z = np.asarray(z)
+    if z.shape[axis] & 1:
+        z = np.concatenate((z,np.take(z,[-1],axis=axis)),axis=axis)
+    a = np.take(z,np.arange(0,z.shape[axis],2),axis=axis)
+    b = np.take(z,np.arange(1,z.shape[axis],2),axis=axis)
+    if mode == 'mean':
+        return (a+b)/2
+    return np.minimum(a,b) if mode == 'min' else np.maximum(a,b)
+
+def minmax_envelope(x,y,nbins):
+    """Decimates a trace to the minimum and maximum of each of nbins bins, in their original
+    order, so that a line plot of the 2*nbins points looks like the plot of all points."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 2*nbins:
+        return x,y
+    bs = -(-n//nbins)
+    nb = -(-n//bs)
+    idx = np.minimum(np.arange(nb*bs),n-1).reshape(nb,bs)
+    yb = y[idx]
+    imin = idx[np.arange(nb),np.argmin(yb,axis=1)]
+    imax = idx[np.arange(nb),np.argmax(yb,axis=1)]
+    keep = np.sort(np.column_stack((imin,imax)),axis=1).ravel()
+    return x[keep],y[keep]
+
+
+class pyramid(object):
+    """Image pyramid of a map: level (kx,ky) is z reduced 2**kx times along x and 2**ky times
+    along y with mode 'mean', 'min' (keeps dips such as resonances visible) or 'max'. Levels
+    are built on first use from the next finer one and kept. The extremes of z are computed
+    once, for color scales."""
+    def __init__(self,z,mode='mean'):
+        self.mode = mode
+        self.levels = {(0,0):np.asarray(z)}
+        self.zmin = np.nanmin(self.levels[(0,0)])
+        self.zmax = np.nanmax(self.levels[(0,0)])
+
+    @property
+    def shape(self):
+        return self.levels[(0,0)].shape
+
+    def level(self,kx,ky):
+        if (kx,ky) not in self.levels:
+            if kx > 0:
+                self.levels[(kx,ky)] = block_reduce(self.level(kx-1,ky),1,self.mode)
+            else:
+                self.levels[(kx,ky)] = block_reduce(self.level(kx,ky-1),0,self.mode)
+        return self.levels[(kx,ky)]
+
+    @staticmethod
+    def factor(npoints,npixels):
+        """Number of halvings that keep at least one point per pixel."""
+        return int(max(0,np.floor(np.log2(max(npoints,1)/max(npixels,1)))))
+
+
+class lod_view(object):
+    """Level-of-detail rendering of a map on an axes: shows the coarsest pyramid level that
+    still has a point per screen pixel for the visible part of the map and refines it when the
+    axis limits change (zoom, pan). draw(z,r0,r1,c0,c1) renders a block of rows r0:r1 and
+    columns c0:c1 (in points of the full map), limits() returns the visible block."""
+    def __init__(self,ax,pyr,draw,limits):
+        self.ax = ax
+        self.pyr = pyr
+        self.draw = draw
+        self.limits = limits
+        self.current = None
+        ax.callbacks.connect('xlim_changed',self.update)
+        ax.callbacks.connect('ylim_changed',self.update)
+
+    def update(self,ax=None):
+        r0,r1,c0,c1 = self.limits()
+        bbox = self.ax.get_window_extent()
+        kx = pyramid.factor(c1-c0,bbox.width)
+        ky = pyramid.factor(r1-r0,bbox.height)
+        # whole blocks of the level, with one block of margin for panning
+        fx,fy = 2**kx,2**ky
+        c0 = max(c0//fx-1,0)*fx
+        r0 = max(r0//fy-1,0)*fy
+        c1 = min((-(-c1//fx)+1)*fx,self.pyr.shape[1])
+        r1 = min((-(-r1//fy)+1)*fy,self.pyr.shape[0])
+        key = (kx,ky,r0,r1,c0,c1)
+        if key == self.current:
+            return
+        self.current = key
+        z = self.pyr.level(kx,ky)[r0//fy:-(-r1//fy),c0//fx:-(-c1//fx)]
+        self.draw(z,r0,r1,c0,c1)
+        self.ax.figure.canvas.draw_idle()
+
+
+class liveplot(object):
+    """Live view of an acquisition. Trace mode shows a growing trace (segments of collect_scan),
+    map mode a data_3d map filled row by row (nrows rows, y: optional outer axis values).
+    push(i,x,y) only stores the data and returns at once, so it can be called from the
+    acquisition thread; the figure is updated at most max_fps times per second by blitting the
+    changed artist (set_data + canvas.blit), from a canvas timer or, when pushed from the main
+    thread, from push itself. The whole figure is only redrawn when the axis limits or the
+    color scale have to grow.
+
+    live = liveplot('trace')
+    dat = vna.collect_scan(f_range_mat,callback=live.callback)
+    live.finish()
+
+    live = liveplot('map',nrows=101,y=pump_freqs)
+    pipe = ExperimentModule.AcquisitionPipeline(vna,callback=live.callback)"""
+    def __init__(self,mode='trace',nrows=None,y=None,ax=None,max_fps=10.,xlab='X',ylab='Y',cmap='viridis',figure_size=(16,9)):
+        if mode not in ('trace','map'):
+            raise ValueError("mode must be 'trace' or 'map'")
+        if mode == 'map' and nrows is None and y is None:
+            raise ValueError('map mode needs nrows or y')
+        if ax is None:
+            fig,ax = plt.subplots(figsize=figure_size)
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.mode = mode
+        self.yaxis = None if y is None else np.asarray(y,dtype='float')
+        self.nrows = len(self.yaxis) if nrows is None and y is not None else nrows
+        self.cmap = cmap
+        self.min_interval = 1./max_fps
+        self.last = 0.
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.segments = {}
+        self.Z = None
+        self.background = None
+        ax.set_xlabel(xlab,fontsize=14)
+        ax.set_ylabel(ylab,fontsize=14)
+        ax.get_xaxis().get_major_formatter().set_useOffset(False)
+        ax.get_yaxis().get_major_formatter().set_useOffset(False)
+        if mode == 'trace':
+            self.artist, = ax.plot([],[],animated=True)
+        else:
+            self.artist = None # created with the first row, which gives the x axis
+        self.canvas.mpl_connect('draw_event',self.on_draw)
+        self.timer = self.canvas.new_timer(interval=int(1000*self.min_interval))
+        self.timer.add_callback(self.refresh)
+        self.timer.start()
+
+    def on_draw(self,event):
+        # a full draw (also resizing) invalidates the saved background
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        if self.artist is not None:
+            self.ax.draw_artist(self.artist)
+
+    def push(self,i,x,y):
+        ''' Stores segment/row i, never waits for the figure.'''
+        with self.lock:
+            self.pending[i] = (np.array(x,dtype='float'),np.array(y,dtype='float'))
+        if threading.current_thread() is threading.main_thread():
+            self.refresh()
+
+    callback = push
+
+    def take(self):
+        with self.lock:
+            pending,self.pending = self.pending,{}
+        return pending
+
+    def update_trace(self,pending):
+        self.segments.update(pending)
+        keys = sorted(self.segments)
+        x = np.concatenate([self.segments[k][0] for k in keys])
+        y = np.concatenate([self.segments[k][1] for k in keys])
+        self.artist.set_data(x,y)
+        (x0,x1),(y0,y1) = self.ax.get_xlim(),self.ax.get_ylim()
+        lo = np.array([np.nanmin(x),np.nanmin(y)])
+        hi = np.array([np.nanmax(x),np.nanmax(y)])
+        if len(self.segments) == len(pending) or lo[0] < x0 or hi[0] > x1 or lo[1] < y0 or hi[1] > y1:
+            margin = 0.05*(hi-lo)
+            self.ax.set_xlim(lo[0],hi[0] if hi[0] > lo[0] else lo[0]+1)
+            self.ax.set_ylim(lo[1]-margin[1],hi[1]+margin[1] if hi[1] > lo[1] else lo[1]+1)
+            return True
+        return False
+
+    def update_map(self,pending):
+        full = False
+        if self.Z is None:
+            x = next(iter(pending.values()))[0]
+            self.Z = np.full((self.nrows,len(x)),np.nan)
+            y = np.arange(self.nrows) if self.yaxis is None else self.yaxis
+            self.artist = self.ax.imshow(self.Z,cmap=self.cmap,aspect='auto',interpolation='nearest',
+                                         origin='lower',animated=True,
+                                         extent=[np.min(x),np.max(x),np.min(y),np.max(y)])
+            self.colorbar = self.ax.figure.colorbar(self.artist,ax=self.ax)
+            full = True
+        for i,(x,row) in pending.items():
+            self.Z[i] = row
+        zmin,zmax = np.nanmin(self.Z),np.nanmax(self.Z)
+        vmin,vmax = self.artist.get_clim()
+        if full or zmin < vmin or zmax > vmax:
+            self.artist.set_clim(zmin,zmax if zmax > zmin else zmin+1)
+            full = True
+        self.artist.set_data(self.Z)
+        return full
+
+    def refresh(self,force=False):
+        ''' Draws the stored data if there is any and the last frame is older than 1/max_fps.'''
+        if not self.pending or (not force and time.perf_counter()-self.last < self.min_interval):
+            return
+        pending = self.take()
+        if self.mode == 'trace':
+            full = self.update_trace(pending)
+        else:
+            full = self.update_map(pending)
+        if full or self.background is None:
+            self.canvas.draw() # on_draw saves the new background
+        else:
+            self.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.artist)
+            self.canvas.blit(self.ax.bbox)
+        self.canvas.flush_events()
+        self.last = time.perf_counter()
+
+    def finish(self):
+        ''' Draws what is left and turns the view into a normal (static) figure.'''
+        self.timer.stop()
+        self.refresh(force=True)
+        if self.artist is not None:
+            self.artist.set_animated(False)
+        self.canvas.draw_idle()
+
+
 ##############################################################################
 # Classes        
 ##############################################################################
@@ -186,11 +918,27 @@ class data_2d(object):
         self.y = []
         
         self.comments = ''
+        self.settings = {} # instrument settings, stored with the data by the binary format
+        self.units = {}
         
         self.xsel = []
         self.ysel = []
+        self.sort_cache = {}
+        self.resampler_cache = None
     
-    def load(self,fname):
+    def load(self,fname,xrng=None):
+        ''' Loads a text file (two columns) or a binary dataset directory (see save). For 
+        datasets only the points within xrng=[x_lo,x_hi] are read from disk.'''
+        if os.path.isdir(fname):
+            ds = dataset(fname)
+            cols = slice(None) if xrng is None else index_range(ds.x,xrng)
+            self.x,y,z = ds.read(cols=cols)
+            self.y = z[0]
+            self.comments = ds.meta['comments']
+            self.settings = ds.meta['settings']
+            self.units = ds.meta['units']
+            self.select()
+            return
         self.dat = np.genfromtxt(fname)
         self.x = self.dat[:,0]
         self.y = self.dat[:,1]
@@ -203,7 +951,16 @@ class data_2d(object):
         self.y = y
         self.select()
         
-    def save(self,fname):
+    def save(self,fname,compress=False):
+        ''' Saves the selected data. A name ending in '.dset' creates a binary dataset 
+        (see 'dataset') that keeps comments, settings and units, otherwise a text file is written.
+        An existing file or dataset of that name is replaced.'''
+        if fname.endswith('.dset'):
+            ds = dataset(fname,'w',x=self.xsel,compress=compress,comments=self.comments,
+                         settings=self.settings,units=self.units,overwrite=True)
+            ds.append(self.ysel)
+            ds.close()
+            return
         dat_sav = np.hstack((self.xsel[:,None],self.ysel[:,None]))
         np.savetxt(fname,dat_sav) 
         
@@ -211,44 +968,93 @@ class data_2d(object):
         with open(fname, "wb") as f:
             pickle.dump(self, f)
 
+    # attributes that are rebuilt on demand and not pickled
+    transient = ('sort_cache','resampler_cache')
+
+    def __getstate__(self):
+        return {k:v for k,v in self.__dict__.items() if k not in self.transient}
+
+    def __setstate__(self,state):
+        # objects pickled by older versions (save_OBJ) lack the attributes added since, and 
+        # may carry caches
+        self.__init__()
+        self.__dict__.update({k:v for k,v in state.items() if k not in self.transient})
+
+    def __setattr__(self,name,value):
+        # a new x or y array makes its sort information stale, see range_index
+        if name in ('x','y'):
+            self.__dict__.get('sort_cache',{}).pop(name,None)
+        object.__setattr__(self,name,value)
+
+    def invalidate(self):
+        ''' Forgets the cached sort information and interpolator. Needed after x or y were 
+        changed in place (d.x[:] = ..., d.x.sort()), assigning a new array does it already.'''
+        self.sort_cache = {}
+        self.resampler_cache = None
+
+    def range_index(self,name,rng):
+        ''' Index of the points of axis 'name' within rng (see select_ranges). The sort 
+        information of the axis is kept until the axis is assigned again or invalidate() 
+        is called, a call only checks that it is still the same array of the same shape.'''
+        data = getattr(self,name)
+        axis = np.asarray(data)
+        cached = self.sort_cache.get(name)
+        if cached is None or cached[0] is not data or cached[1] != axis.shape:
+            cached = (data,axis.shape,sort_info(axis))
+            self.sort_cache[name] = cached
+        return select_ranges(axis,rng,cached[2])
+    
     def select(self,xrng = [0,0]):
-        x_rng = []
-        
-        if  xrng == [0,0]:
-            x_rng = [self.x[0],self.x[-1]]
+        ''' Selects the data within the x ranges [lo_0,hi_0,lo_1,hi_1,...], everything by default.
+        A single range on a sorted axis gives views of x and y.'''
+        if full_range(xrng):
+            xsel_idx = slice(None)
         else:
-            x_rng = xrng
-                        
-        xsel_idx,self.xsel = split(self.x,x_rng)
-        self.ysel = self.y[xsel_idx]
+            xsel_idx = self.range_index('x',xrng)
+        self.xsel = np.asarray(self.x)[xsel_idx]
+        self.ysel = np.asarray(self.y)[xsel_idx]
 
         
-    def plot(self,figure_size=(16,9),xlab = 'X', ylab = 'Y' ):
+    def plot(self,figure_size=(16,9),xlab = 'X', ylab = 'Y', decimate=False):
+        ''' Plots the selected data. decimate=True draws the min/max envelope with two points per 
+        screen pixel instead of every point (multi-million point traces) and recomputes it for 
+        the visible x range when zooming.'''
         plt.figure(figsize=figure_size)
         plt.xlabel(xlab,fontsize=14)
         plt.ylabel(ylab,fontsize=14)
-        plt.plot(self.xsel,self.ysel)
         plt.gca().get_xaxis().get_major_formatter().set_useOffset(False)
         plt.gca().get_yaxis().get_major_formatter().set_useOffset(False)
-    
-    def fit(self,fitfunc1,fit1_p_init,plot=True,plot_init=True,figuresize=(16,9)):
+        if not decimate:
+            return plt.plot(self.xsel,self.ysel)[0]
         
-        errfunc1 = lambda p, x: fitfunc1(p, x) - self.ysel # Distance to the target function
-        fit1_p_fit, success1 = optimize.leastsq(errfunc1, fit1_p_init[:], args=(self.xsel))
+        ax = plt.gca()
+        x = np.asarray(self.xsel)
+        y = np.asarray(self.ysel)
+        npx = lambda: max(int(ax.get_window_extent().width),1)
+        line, = ax.plot(*minmax_envelope(x,y,npx()))
+        ax.set_xlim(np.nanmin(x),np.nanmax(x))
+        order = None if np.all(np.diff(x) >= 0) else np.argsort(x,kind='stable')
+        def update(ax):
+            lo,hi = sorted(ax.get_xlim())
+            xs = x if order is None else x[order]
+            a = max(np.searchsorted(xs,lo)-1,0)
+            b = min(np.searchsorted(xs,hi,side='right')+1,len(xs))
+            idx = slice(a,b) if order is None else np.sort(order[a:b])
+            line.set_data(*minmax_envelope(x[idx],y[idx],npx()))
+        ax.callbacks.connect('xlim_changed',update)
+        return line
+    
+    def fit(self,fitfunc1,fit1_p_init=None,plot=True,plot_init=True,figuresize=(16,9),jac=None,full=False):
+        ''' Fits the selected data to fitfunc1(p,x), jac(p,x) optionally gives the analytic 
+        derivatives (see fit_trace), for models of ResonatorModule fit1_p_init = None uses the 
+        model's initial guess. Returns (p_fit, sum of squared residuals), with full=True 
+        (p_fit, covariance, sum of squared residuals).'''
+        if fit1_p_init is None:
+            fit1_p_init = fitfunc1.guess(self.xsel,self.ysel)
+        fit1_p_fit,cov,ss = fit_trace(fitfunc1,fit1_p_init,self.xsel,self.ysel,jac)[:3]
         
         if plot is True:
-            plt.figure(figsize=figuresize)
-            if plot_init is True:
-                plt.plot(self.xsel, self.ysel, "bo", self.xsel, fitfunc1(fit1_p_init, self.xsel), "g-", self.xsel, fitfunc1(fit1_p_fit, self.xsel), "r-",linewidth=2) # Plot of the data and the fit
-                plt.legend(('Data', 'Init', 'fit'))
-            else:
-                plt.plot(self.xsel, self.ysel, "bo", self.xsel, fitfunc1(fit1_p_fit, self.xsel), "r-",linewidth=2) # Plot of the data and the fit
-                plt.legend(('Data', 'fit'))
-            plt.title("Fitting to a given function",fontsize=20)
-            plt.xlabel("X",fontsize=14)
-            plt.ylabel("Y",fontsize=14)
-            plt.gca().get_xaxis().get_major_formatter().set_useOffset(False)
-            plt.gca().get_yaxis().get_major_formatter().set_useOffset(False)
+            plot_fit(self.xsel,self.ysel,fitfunc1,fit1_p_fit,fit1_p_init if plot_init else None,figuresize)
 
         #ax = plt.axes()
         #plt.text(0.2, 0.4,
@@ -257,28 +1063,45 @@ class data_2d(object):
         #     horizontalalignment='center',
         #     verticalalignment='center',
         #     transform=ax.transAxes)
-        return fit1_p_fit, np.sum(errfunc1(fit1_p_fit,self.xsel)**2)
+        if full:
+            return fit1_p_fit, cov, ss
+        return fit1_p_fit, ss
         
     def localmin(self,min_threshold, npoints =1):
-        msk = self.ysel < min_threshold
-        xx = self.xsel[msk]        
-        yy = self.ysel[msk]        
-        min_idx = signal.argrelextrema(yy, np.less, order = npoints)
-        return np.vstack((np.frombuffer(xx[min_idx]),np.frombuffer(yy[min_idx])))
+        ''' Local minima below min_threshold (lower than their npoints neighbors on each side), 
+        returns a (2,n) array of x and y.'''
+        idx = local_minima(self.ysel,npoints,threshold=min_threshold)
+        return np.vstack((self.xsel[idx],self.ysel[idx]))
+    
+    def minima(self,prominence=None,width=None,threshold=None,distance=None):
+        ''' Minima with their prominence and width, see find_minima.'''
+        return find_minima(self.xsel,self.ysel,prominence,width,threshold,distance)
     
-    def smooth(self,nnb):
-        self.ysel = smooth(self.xsel,self.ysel,nnb)
+    def smooth(self,nnb,mode='shrink',kernel='box',**kwargs):
+        ''' Smooths the selected data, see smooth_window for modes and kernels.'''
+        self.ysel = smooth(self.xsel,self.ysel,nnb,mode,kernel,**kwargs)
+        if mode == 'valid':
+            self.xsel = self.xsel[nnb:len(self.xsel)-nnb]
         
-    def interp(self,xnew):
-        ''' This method interpolates the data to the new x and y coordinates.
+    def interp(self,xnew,kind='linear',fill_value=np.nan):
+        ''' This method interpolates the data to the new x coordinates, kind: 'nearest', 
+        'linear' or 'cubic' (see resampler). Points of xnew outside the selected data are 
+        set to fill_value, fill_value=None extrapolates.
         Example (assuming "d2" object contains our data): 
         
         xnew = linspace(d2.x.min(),d2.x.max(),100)
         d2.interp(xnew)
         d2.plot()      '''
-        f = interpolate.interp1d(self.xsel, self.ysel)
+        self.ysel = self.interpolator(kind)(xnew,fill_value=fill_value)
         self.xsel = xnew
-        self.ysel = f(xnew)
+    
+    def interpolator(self,kind='linear'):
+        ''' resampler of the selected data, kept until the selection changes.'''
+        data = (self.xsel,self.ysel)
+        cached = self.resampler_cache
+        if cached is None or cached[1] != kind or any(a is not b for a,b in zip(cached[0],data)):
+            self.resampler_cache = (data,kind,resampler(self.xsel,self.ysel,kind=kind))
+        return self.resampler_cache[2]
         
 
 ##############################################################################
@@ -289,15 +1112,40 @@ class data_3d(object):
         self.z = []
         
         self.comments = ''
+        self.settings = {} # instrument settings, stored with the data by the binary format
+        self.units = {}
+        self.store = None # dataset receiving the rows added by append_row
+        self.zbuf = None
+        self.ybuf = None
         
         self.xsel = []
         self.ysel = []
         self.zsel = []
+        self.sort_cache = {}
+        self.resampler_cache = None
+        self.pyramid_cache = None
     
     
-    def load(self,fname,x=None,y=None):
+    def load(self,fname,x=None,y=None,xrng=None,yrng=None,mmap=False):
+        ''' Loads a text map or a binary dataset directory (see save). For datasets only the 
+        block within xrng=[x_lo,x_hi] and yrng=[y_lo,y_hi] is read from disk.
+        mmap=True keeps z as a memory map of an (uncompressed) dataset instead of reading it:
+        opening is immediate, and select() on contiguous ranges only touches the selected 
+        window when zsel is used.'''
+        if os.path.isdir(fname):
+            ds = dataset(fname)
+            cols = slice(None) if xrng is None else index_range(ds.x,xrng)
+            rows = slice(None) if yrng is None else index_range(ds.y,yrng)
+            self.comments = ds.meta['comments']
+            self.settings = ds.meta['settings']
+            self.units = ds.meta['units']
+            if mmap:
+                self.load_var(ds.x[cols],ds.y[rows],ds.memmap()[rows,cols])
+            else:
+                self.load_var(*ds.read(rows,cols))
+            return
         self.dat = np.genfromtxt(fname)
-        if x == None and y == None:
+        if x is None and y is None:
             self.x = self.dat[0,1:]
             self.y = self.dat[1:,0]
             self.z = self.dat[1:,1:]
@@ -306,7 +1154,7 @@ class data_3d(object):
             self.ysel = self.dat[1:,0]
             self.zsel = self.dat[1:,1:]
             
-        elif x != None and y != None:
+        elif x is not None and y is not None:
             self.x = x
             self.y = y
             self.z = self.dat
@@ -315,7 +1163,7 @@ class data_3d(object):
             self.ysel = y
             self.zsel = self.dat
             
-        elif x == None and y != None:
+        elif x is None and y is not None:
             self.x = self.dat[0,:]
             self.y = y
             self.z = self.dat[1:,:]
@@ -324,7 +1172,7 @@ class data_3d(object):
             self.ysel = y
             self.zsel = self.dat[1:,:]
             
-        elif x != None and y == None:
+        elif x is not None and y is None:
             self.x = x
             self.y = self.dat[:,0]
             self.z = self.dat[:,1:]
@@ -339,19 +1187,65 @@ class data_3d(object):
         self.y = y
         self.z = z
         self.select()
+    
+    def append_row(self,zrow,yval):
+        ''' Adds a row to the map, e.g. one VNA trace per bias point during an acquisition.
+        Rows are kept in a buffer that grows by doubling, and are also appended to self.store 
+        when a dataset is attached:
+        
+        d3 = data_3d()
+        d3.store = dataset('map.dset','w',x=freq)
+        for v in bias:
+            d3.append_row(vna.collect_single(...).y,v)
+        d3.store.close()'''
+        zrow = np.asarray(zrow,dtype='float').ravel()
+        n = len(self.y)
+        if self.zbuf is None or not np.shares_memory(self.z,self.zbuf) or (n == 0 and self.zbuf.shape[1] != len(zrow)):
+            # new buffer, holding the rows present so far
+            self.zbuf = np.empty((max(2*n,4),len(zrow)))
+            self.ybuf = np.empty(max(2*n,4))
+            if n:
+                self.zbuf[:n] = self.z
+                self.ybuf[:n] = self.y
+        elif n == len(self.ybuf):
+            self.zbuf = np.concatenate((self.zbuf,np.empty_like(self.zbuf)))
+            self.ybuf = np.concatenate((self.ybuf,np.empty_like(self.ybuf)))
+        self.zbuf[n] = zrow
+        self.ybuf[n] = yval
+        if len(self.x) != len(zrow):
+            self.x = np.arange(len(zrow))
+        self.y = self.ybuf[:n+1]
+        self.z = self.zbuf[:n+1]
+        # the whole map stays selected, select() would copy it on every row
+        self.xsel = self.x
+        self.ysel = self.y
+        self.zsel = self.z
+        if self.store is not None:
+            self.store.append(zrow,yval)
 
     
-    def save(self,fname,x=None,y=None):
-        if x == None and y == None:
+    def save(self,fname,x=None,y=None,compress=False,chunk_rows=64):
+        ''' Saves the selected map. A name ending in '.dset' creates a binary dataset 
+        (see 'dataset') that keeps comments, settings and units and can be read partially 
+        and appended to, otherwise a text file is written. An existing file or dataset of that 
+        name is replaced.'''
+        if fname.endswith('.dset'):
+            ds = dataset(fname,'w',x=self.xsel,chunk_rows=chunk_rows,compress=compress,
+                         comments=self.comments,settings=self.settings,units=self.units,overwrite=True)
+            for i in range(len(self.ysel)):
+                ds.append(self.zsel[i],self.ysel[i])
+            ds.close()
+            return
+        if x is None and y is None:
             dat_sav = np.hstack((np.vstack((0,self.ysel[:,None])),np.vstack((self.xsel,self.zsel))))
             np.savetxt(fname,dat_sav)
-        elif x != None and y != None:
+        elif x is not None and y is not None:
             #
             x=0
-        elif x == None and y != None:
+        elif x is None and y is not None:
             #
             x=0
-        elif x != None and y == None:
+        elif x is not None and y is None:
             #
             x=0
 
@@ -360,97 +1254,216 @@ class data_3d(object):
         with open(fname, "wb") as f:
             pickle.dump(self, f)        
 
+    # attributes that are rebuilt on demand or cannot be pickled: the caches, the row buffers
+    # of append_row (y and z are views of them) and the attached dataset
+    transient = ('sort_cache','resampler_cache','pyramid_cache','zbuf','ybuf','store')
+    __getstate__ = data_2d.__getstate__
+
+    def __setstate__(self,state):
+        # objects pickled by older versions (save_OBJ) hold zsel in __dict__ and lack the 
+        # attributes added since, start from the defaults and move zsel behind the property
+        self.__init__()
+        state = {k:v for k,v in state.items() if k not in self.transient}
+        if 'zsel' in state:
+            state['_zsel'] = state.pop('zsel')
+        self.__dict__.update(state)
+
     
-    def imshow(self,figure_size=(16,9),colormap = plt.cm.hsv, lev = 'Default',xlab = 'X', ylab = 'Y', norm = 'Default'):
-        plt.figure(figsize=figure_size)
+    def image_pyramid(self,mode='mean'):
+        ''' Image pyramid of zsel (see pyramid), kept until the selection changes.'''
+        cached = self.pyramid_cache
+        if cached is None or cached[0] is not self.zsel or cached[1] != mode:
+            self.pyramid_cache = (self.zsel,mode,pyramid(self.zsel,mode))
+        return self.pyramid_cache[2]
+    
+    def color_scale(self,lev,norm,lod):
+        ''' levels and norm of imshow/contourf, the extremes of zsel are computed once.'''
+        if lod:
+            zmin,zmax = self.image_pyramid(lod).zmin,self.image_pyramid(lod).zmax
+        else:
+            zmin,zmax = np.nanmin(self.zsel),np.nanmax(self.zsel)
+        zabs = max(abs(zmin),abs(zmax))
         
         if lev == 'Default':
-            levels = np.linspace(self.zsel.min(),self.zsel.max(), 10) 
+            levels = np.linspace(zmin,zmax, 10) 
         else:
             levels = lev
             
         if norm == 'Default':
-            normal = plt.cm.colors.Normalize(vmax=abs(self.zsel).max(), vmin=-abs(self.zsel).max())
+            normal = plt.cm.colors.Normalize(vmax=zabs, vmin=-zabs)
         else:
             normal = norm
-            
-        
-        #norm = plt.cm.colors.Normalize(vmax=self.zsel.max(), vmin=-abs(self.zsel).max())
-        cmap = colormap
+        return levels,normal
+    
+    def axes_template(self,figure_size,xlab,ylab):
+        plt.figure(figsize=figure_size)
         plt.xlabel(xlab,fontsize=18)
         plt.ylabel(ylab,fontsize=18)
         plt.gca().get_xaxis().get_major_formatter().set_useOffset(False)
         plt.gca().get_yaxis().get_major_formatter().set_useOffset(False)
-        ax = plt.subplot()
+        ax = plt.gca()
         for item in (ax.get_xticklabels() + ax.get_yticklabels()):
             item.set_fontsize(14)
-        plt.imshow(self.zsel,
-                    cmap=plt.cm.get_cmap(cmap, len(levels)-1),
-                    norm=normal,
-                    interpolation=None,
-                    aspect='auto',
-                    extent=[self.xsel.min(),
-                            self.xsel.max(),
-                            self.ysel.min(),
-                            self.ysel.max()])
+        return ax
+    
+    def imshow(self,figure_size=(16,9),colormap = 'hsv', lev = 'Default',xlab = 'X', ylab = 'Y', norm = 'Default', lod = False):
+        ''' Image of the selected map. lod='mean', 'min' or 'max' shows a level of an image 
+        pyramid (see pyramid) matching the screen resolution instead of every point and refines 
+        it when zooming; 'min' keeps narrow dips visible.'''
+        levels,normal = self.color_scale(lev,norm,lod)
+        ax = self.axes_template(figure_size,xlab,ylab)
+        
+        #norm = plt.cm.colors.Normalize(vmax=self.zsel.max(), vmin=-abs(self.zsel).max())
+        cmap = colormap
+        extent = [np.min(self.xsel),np.max(self.xsel),np.min(self.ysel),np.max(self.ysel)]
+        if not lod:
+            im = plt.imshow(self.zsel,
+                        cmap=lut_cmap(cmap, len(levels)-1),
+                        norm=normal,
+                        interpolation=None,
+                        aspect='auto',
+                        extent=extent)
+            plt.colorbar()
+            return im
+        
+        pyr = self.image_pyramid(lod)
+        ny,nx = pyr.shape
+        xmin,xmax,ymin,ymax = extent
+        wx = (xmax-xmin)/nx
+        hy = (ymax-ymin)/ny
+        # rows run from the top (ymax) to the bottom (ymin), as in the full image
+        k = pyramid.factor(max(nx,ny),64)
+        im = plt.imshow(pyr.level(k,k),cmap=lut_cmap(cmap, len(levels)-1),norm=normal,
+                        interpolation=None,aspect='auto',extent=extent)
+        ax.set_xlim(xmin,xmax)
+        ax.set_ylim(ymin,ymax)
+        ax.set_autoscale_on(False)
         plt.colorbar()
         
-    def contourf(self,figure_size=(16,9),colormap = plt.cm.hsv, lev = 'Default',xlab = 'X', ylab = 'Y', norm = 'Default'):
-        plt.figure(figsize=figure_size)
+        def limits():
+            xlo,xhi = sorted(ax.get_xlim())
+            ylo,yhi = sorted(ax.get_ylim())
+            c0 = int(np.clip(np.floor((xlo-xmin)/wx),0,nx-1))
+            c1 = int(np.clip(np.ceil((xhi-xmin)/wx),c0+1,nx))
+            r0 = int(np.clip(np.floor((ymax-yhi)/hy),0,ny-1))
+            r1 = int(np.clip(np.ceil((ymax-ylo)/hy),r0+1,ny))
+            return r0,r1,c0,c1
+        def draw(z,r0,r1,c0,c1):
+            im.set_data(z)
+            im.set_extent([xmin+c0*wx,xmin+c1*wx,ymax-r1*hy,ymax-r0*hy])
+        im.lod = lod_view(ax,pyr,draw,limits)
+        im.lod.update()
+        return im
         
-        if lev == 'Default':
-            levels = np.linspace(self.zsel.min(),self.zsel.max(), 10) 
-        else:
-            levels = lev
-            
-        if norm == 'Default':
-            normal = plt.cm.colors.Normalize(vmax=abs(self.zsel).max(), vmin=-abs(self.zsel).max())
-        else:
-            normal = norm
-            
+    def contourf(self,figure_size=(16,9),colormap = 'hsv', lev = 'Default',xlab = 'X', ylab = 'Y', norm = 'Default', lod = False):
+        ''' Filled contours of the selected map. lod='mean', 'min' or 'max' contours a pyramid 
+        level matching the screen resolution (see imshow) and redraws it when zooming.'''
+        levels,normal = self.color_scale(lev,norm,lod)
+        ax = self.axes_template(figure_size,xlab,ylab)
         
         #norm = plt.cm.colors.Normalize(vmax=self.zsel.max(), vmin=-abs(self.zsel).max())
         cmap = colormap
-        plt.xlabel(xlab,fontsize=18)
-        plt.ylabel(ylab,fontsize=18)
-        plt.gca().get_xaxis().get_major_formatter().set_useOffset(False)
-        plt.gca().get_yaxis().get_major_formatter().set_useOffset(False)
-        ax = plt.subplot()
-        for item in (ax.get_xticklabels() + ax.get_yticklabels()):
-            item.set_fontsize(14)
-        plt.contourf(self.xsel,self.ysel,self.zsel,levels,cmap=plt.cm.get_cmap(cmap, len(levels)-1),norm=normal,)
-        plt.colorbar()
+        if not lod:
+            cs = plt.contourf(self.xsel,self.ysel,self.zsel,levels,cmap=lut_cmap(cmap, len(levels)-1),norm=normal,)
+            plt.colorbar()
+            return cs
         
+        pyr = self.image_pyramid(lod)
+        x = np.asarray(self.xsel,dtype='float')
+        y = np.asarray(self.ysel,dtype='float')
+        axes = {('x',0):x,('y',0):y}
+        def coords(name,k):
+            # block averaged axis matching pyramid level k
+            if (name,k) not in axes:
+                axes[(name,k)] = block_reduce(coords(name,k-1),0,'mean')
+            return axes[(name,k)]
+        ax.set_xlim(np.min(x),np.max(x))
+        ax.set_ylim(np.min(y),np.max(y))
+        ax.set_autoscale_on(False)
+        state = {}
         
-    def select(self,xrng=[0,0],yrng=[0,0]):
-        x_rng = []
-        y_rng = []
+        def limits():
+            xlo,xhi = sorted(ax.get_xlim())
+            ylo,yhi = sorted(ax.get_ylim())
+            ix = np.flatnonzero((x >= xlo) & (x <= xhi))
+            iy = np.flatnonzero((y >= ylo) & (y <= yhi))
+            c0,c1 = (ix[0],ix[-1]+1) if len(ix) else (0,len(x))
+            r0,r1 = (iy[0],iy[-1]+1) if len(iy) else (0,len(y))
+            return r0,r1,c0,c1
+        def draw(z,r0,r1,c0,c1):
+            kx,ky = state['view'].current[:2]
+            xk = coords('x',kx)[c0>>kx:][:z.shape[1]]
+            yk = coords('y',ky)[r0>>ky:][:z.shape[0]]
+            if 'cs' in state:
+                state['cs'].remove()
+            state['cs'] = ax.contourf(xk,yk,z,levels,cmap=lut_cmap(cmap, len(levels)-1),norm=normal)
+        state['view'] = lod_view(ax,pyr,draw,limits)
+        state['view'].update()
+        plt.colorbar(state['cs'])
+        return state['cs']
         
-        if  xrng == [0,0]:
-            x_rng = [self.x[0],self.x[-1]]
-        else:
-            x_rng = xrng
-                    
-        if yrng == [0,0]:
-            y_rng = [self.y[0],self.y[-1]]
-        else:
-            y_rng = yrng
         
-        xsel_idx,self.xsel = split(self.x,x_rng)
-        ysel_idx,self.ysel = split(self.y,y_rng)
-        #
-        #self.zsel = self.z[ysel_idx,:] ; self.zsel = self.zsel[:,xsel_idx]
-        zsel_tmp = self.z[ysel_idx,:]
-        self.zsel = zsel_tmp[:,xsel_idx]
+    __setattr__ = data_2d.__setattr__
+    range_index = data_2d.range_index
+    
+    def invalidate(self):
+        ''' Forgets the cached sort information, interpolator and image pyramid. Needed after 
+        x, y or z were changed in place.'''
+        data_2d.invalidate(self)
+        self.pyramid_cache = None
+    
+    def select(self,xrng=[0,0],yrng=[0,0]):
+        ''' Selects the map within the x and y ranges [lo_0,hi_0,lo_1,hi_1,...], everything by 
+        default. Single ranges on sorted axes are slices, zsel is then a view of z (also of a 
+        memory-mapped z).'''
+        self.xsel_idx = slice(None) if full_range(xrng) else self.range_index('x',xrng)
+        self.ysel_idx = slice(None) if full_range(yrng) else self.range_index('y',yrng)
+        self.xsel = np.asarray(self.x)[self.xsel_idx]
+        self.ysel = np.asarray(self.y)[self.ysel_idx]
+        self.zsel = None # computed on first access
+    
+    @property
+    def zsel(self):
+        ''' Selected part of z, computed on first access after select().'''
+        if self._zsel is None:
+            self._zsel = self.z[self.ysel_idx][:,self.xsel_idx]
+        return self._zsel
+    
+    @zsel.setter
+    def zsel(self,value):
+        self._zsel = value
+        
+    def fit_rows(self,fitfunc,p0,jac=None,warm_start=True,processes=1,plot=False,figuresize=(16,9)):
+        ''' Fits every selected row (zsel vs xsel) to fitfunc(p,x), see fit_batch. With plot=True 
+        the fitted parameters are plotted against ysel with their standard errors.'''
+        res = fit_batch(fitfunc,p0,self.xsel,self.zsel,jac,warm_start,processes)
+        if plot is True:
+            err = np.sqrt(np.abs(np.diagonal(res['cov'],axis1=1,axis2=2)))
+            fig,axs = plt.subplots(res['params'].shape[1],1,sharex=True,figsize=figuresize,squeeze=False)
+            for k,ax in enumerate(axs[:,0]):
+                ax.errorbar(self.ysel,res['params'][:,k],err[:,k],fmt='o')
+                ax.set_ylabel('p[%d]' % k,fontsize=14)
+            axs[-1,0].set_xlabel('Y',fontsize=14)
+        return res
         
-    def smoothx(self,nnb):
-        return smooth_vec(self.xsel,self.zsel,nnb)
+    def localmin(self,min_threshold=None, npoints=1, axis=1):
+        ''' Local minima of zsel along x (axis=1, every row) or y (axis=0) in one vectorized 
+        pass, see local_minima. Returns a (3,n) array of x, y and z of the minima, ordered by 
+        row, which makes it easy to follow resonances through a sweep.'''
+        z = np.asarray(self.zsel)
+        iy,ix = np.nonzero(local_minima(z,npoints,axis,min_threshold))
+        return np.vstack((np.asarray(self.xsel)[ix],np.asarray(self.ysel)[iy],z[iy,ix]))
+    
+    def smoothx(self,nnb,mode='shrink',kernel='box',**kwargs):
+        return smooth_window(self.zsel,nnb,axis=1,mode=mode,kernel=kernel,**kwargs)
 
-    def smoothy(self,nnb):
-        return smooth_vec(self.ysel,self.zsel.transpose(),nnb).transpose()
+    def smoothy(self,nnb,mode='shrink',kernel='box',**kwargs):
+        return smooth_window(self.zsel,nnb,axis=0,mode=mode,kernel=kernel,**kwargs)
 
-    def interp(self,xnew,ynew):
-        ''' This method interpolates the data to the new x and y coordinates.
+    def interp(self,xnew,ynew,kind='cubic',tile=256,fill_value=np.nan):
+        ''' This method interpolates the data to the new x and y coordinates, kind: 'nearest', 
+        'linear' or 'cubic' (see resampler). Points outside the selected map are set to 
+        fill_value, fill_value=None extrapolates.
         Example (assuming "d3" object contains our data): 
         
         xnew = linspace(d2.x.min(),d2.x.max(),100)
@@ -459,9 +1472,193 @@ class data_3d(object):
         d3.contourf()        
         
         '''
-        f = interpolate.interp2d(self.xsel, self.ysel, self.zsel, kind='cubic')
+        self.zsel = self.interpolator(kind)(xnew,ynew,tile,fill_value)
         self.xsel = xnew
         self.ysel = ynew
-        self.zsel = f(xnew,ynew)
+    
+    def interpolator(self,kind='cubic'):
+        ''' resampler of the selected map, kept until the selection changes.'''
+        data = (self.xsel,self.ysel,self.zsel)
+        cached = self.resampler_cache
+        if cached is None or cached[1] != kind or any(a is not b for a,b in zip(cached[0],data)):
+            self.resampler_cache = (data,kind,resampler(self.xsel,self.zsel,self.ysel,kind))
+        return self.resampler_cache[2]
+        
         
-        
\ No newline at end of file
+
+##############################################################################
+# Binary storage
+##############################################################################
+def json_default(obj):
+    if hasattr(obj,'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+def index_range(vector,rng):
+    '''Returns the slice of indices spanning the elements of vector within rng=[lo,hi].'''
+    idx = np.nonzero((vector >= rng[0]) & (vector <= rng[1]))[0]
+    if len(idx) == 0:
+        return slice(0,0)
+    return slice(idx[0],idx[-1]+1)
+
+
+class dataset(object):
+    ''' Chunked, appendable binary container for data_3d maps. A dataset is a directory:
+    
+        name.dset/meta.json    comments, instrument settings, axis units, shape, dtype
+        name.dset/x.npy        column axis
+        name.dset/y.bin        row axis (one float64 per row, raw little-endian)
+        name.dset/z.bin        rows of z, raw C-order (uncompressed datasets)
+        name.dset/z_00000.npz  blocks of chunk_rows rows (compressed datasets)
+    
+    Rows are appended one at a time and written to disk every chunk_rows rows, so a map can 
+    grow during the acquisition. A flush only appends to y.bin and z.bin (compressed datasets 
+    rewrite at most the last chunk). y.bin is written last and holds the number of complete rows, 
+    meta.json is written on creation and by close(). read() loads only the requested block of 
+    rows and columns. Mode 'w' refuses to replace an existing dataset unless overwrite=True.
+    Example:
+    
+    ds = dataset('map.dset','w',x=freq,units={'x':'Hz','y':'V','z':'dB'})
+    for v in bias:
+        ds.append(vna.collect_single(...).y,v)
+    ds.close()
+    x,y,z = dataset('map.dset').read(rows=slice(100,200))
+    '''
+    def __init__(self,fname,mode='r',x=None,chunk_rows=64,compress=False,dtype='float64',
+                 comments='',settings=None,units=None,overwrite=False):
+        self.fname = fname
+        self.mode = mode
+        self.buf = []
+        self.ybuf = []
+        if mode == 'w':
+            if x is None:
+                raise ValueError('The column axis x is needed to create a dataset.')
+            if not os.path.isdir(fname):
+                os.makedirs(fname)
+            files = [f for f in os.listdir(fname) if f in ('meta.json','x.npy','y.npy','y.bin','z.bin') 
+                     or (f.startswith('z_') and f.endswith('.npz'))]
+            if files and not overwrite:
+                raise IOError('Dataset '+fname+' exists, use overwrite=True to replace it.')
+            for f in files:
+                os.remove(os.path.join(fname,f))
+            self.x = np.asarray(x)
+            self.y = np.zeros(0)
+            self.meta = {'version':2,'dtype':np.dtype(dtype).str,'ncols':len(self.x),'nrows':0,
+                         'chunk_rows':int(chunk_rows),'compress':bool(compress),'comments':comments,
+                         'settings':settings or {},'units':units or {}}
+            np.save(os.path.join(fname,'x.npy'),self.x)
+            open(os.path.join(fname,'y.bin'),'wb').close()
+            self.write_meta()
+        else:
+            with open(os.path.join(fname,'meta.json')) as f:
+                self.meta = json.load(f)
+            self.x = np.load(os.path.join(fname,'x.npy'))
+            if self.meta['version'] < 2:
+                self.y = np.load(os.path.join(fname,'y.npy'))
+            else:
+                self.y = np.fromfile(os.path.join(fname,'y.bin'),dtype='<f8')
+            # rows are complete once their y is stored
+            self.meta['nrows'] = len(self.y)
+            if mode == 'a':
+                self.prepare_append()
+    
+    def prepare_append(self):
+        # datasets written by version 1 keep y in y.npy
+        if self.meta['version'] < 2:
+            self.y.astype('<f8').tofile(os.path.join(self.fname,'y.bin'))
+            os.remove(os.path.join(self.fname,'y.npy'))
+            self.meta['version'] = 2
+            self.write_meta()
+        # z of rows whose y was never written (interrupted flush)
+        if not self.meta['compress']:
+            size = self.meta['nrows']*self.meta['ncols']*np.dtype(self.meta['dtype']).itemsize
+            with open(os.path.join(self.fname,'z.bin'),'ab') as f:
+                f.truncate(size)
+    
+    @property
+    def nrows(self):
+        return self.meta['nrows'] + len(self.buf)
+    
+    @property
+    def shape(self):
+        return (self.nrows,self.meta['ncols'])
+    
+    def chunk_name(self,i):
+        return os.path.join(self.fname,'z_%05d.npz' % i)
+    
+    def read_chunk(self,i):
+        with np.load(self.chunk_name(i)) as f:
+            return f['z']
+    
+    def write_meta(self):
+        with open(os.path.join(self.fname,'meta.json'),'w') as f:
+            json.dump(self.meta,f,indent=1,default=json_default)
+    
+    def append(self,row,y=None):
+        ''' Adds one row of z (and its row-axis value, default: row number).'''
+        if self.mode == 'r':
+            raise IOError('Dataset is opened read-only.')
+        row = np.asarray(row,dtype=self.meta['dtype']).ravel()
+        if len(row) != self.meta['ncols']:
+            raise ValueError('Row has '+str(len(row))+' elements, the dataset has '+str(self.meta['ncols'])+' columns.')
+        self.buf.append(row)
+        self.ybuf.append(self.nrows-1 if y is None else y)
+        if self.nrows % self.meta['chunk_rows'] == 0:
+            self.flush()
+    
+    def flush(self):
+        ''' Writes the buffered rows to disk.'''
+        if not self.buf:
+            return
+        block = np.vstack(self.buf)
+        if self.meta['compress']:
+            # chunks are full except for the last one; a partial last chunk (written by an 
+            # earlier flush or read) is completed with the new rows and rewritten
+            n = self.meta['chunk_rows']
+            first = self.meta['nrows']//n
+            if self.meta['nrows'] % n:
+                block = np.vstack((self.read_chunk(first)[:self.meta['nrows'] % n],block))
+            for i in range(0,len(block),n):
+                np.savez_compressed(self.chunk_name(first+i//n),z=block[i:i+n])
+        else:
+            with open(os.path.join(self.fname,'z.bin'),'ab') as f:
+                block.tofile(f)
+        ynew = np.asarray(self.ybuf,dtype='<f8')
+        with open(os.path.join(self.fname,'y.bin'),'ab') as f:
+            ynew.tofile(f)
+        self.y = np.concatenate((self.y,ynew))
+        self.meta['nrows'] += len(self.buf)
+        self.buf = []
+        self.ybuf = []
+    
+    def close(self):
+        if self.mode != 'r':
+            self.flush()
+            self.write_meta()
+    
+    def memmap(self):
+        ''' Returns z as a read-only np.memmap (uncompressed datasets only). Nothing is read 
+        from disk until the elements are accessed.'''
+        if self.meta['compress']:
+            raise ValueError('Compressed datasets cannot be memory-mapped, use read().')
+        dtype = np.dtype(self.meta['dtype'])
+        if self.meta['nrows'] == 0:
+            return np.zeros((0,self.meta['ncols']),dtype=dtype)
+        return np.memmap(os.path.join(self.fname,'z.bin'),dtype=dtype,mode='r',
+                         shape=(self.meta['nrows'],self.meta['ncols']))
+    
+    def read(self,rows=slice(None),cols=slice(None)):
+        ''' Returns x[cols], y[rows], z[rows,cols] reading only the chunks that hold the rows.
+        rows and cols are slices.'''
+        if self.mode != 'r':
+            self.flush()
+        nrows = self.meta['nrows']
+        r0,r1,step = rows.indices(nrows)
+        dtype = np.dtype(self.meta['dtype'])
+        if not self.meta['compress']:
+            z = np.array(self.memmap()[rows,cols])
+        else:
+            n = self.meta['chunk_rows']
+            blocks = [self.read_chunk(i) for i in range(r0//n,(max(r1,r0+1)-1)//n+1)] if r1 > r0 else []
+            z = np.vstack(blocks)[r0-(r0//n)*n:r1-(r0//n)*n:step,cols] if blocks else np.zeros((0,len(self.x[cols])),dtype=dtype)
+        return self.x[cols],self.y[rows],z
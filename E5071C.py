@@ -7,10 +7,10 @@ Created on Fri Mar 28 09:43:05 2014
 Module for communicating with ENA E5071C and analysing data
 """
 E5071C_module_version = '2.0.0'
-print('E5071C module version: ',E5071C_module_version)
 
-import vxi11 as vx
+import logging
 import DataModule as dm
+import VNAModule as vm
 import time
 import numpy as np
 
@@ -18,37 +18,34 @@ import numpy as np
 # Constants
 def_ip = '192.168.0.103'
 
+logging.getLogger(__name__).info('E5071C module version: %s',E5071C_module_version)
+
+###############################################################################################
+def decode_trace(raw):
+    '''Converts a raw FDATa response (see VNA.trace_read_raw) to the float array of the 
+    primary trace values.'''
+    return np.asarray(raw.strip().split(b','),dtype='float')[0::2]
+
 ###############################################################################################
-class VNA(object):
-    def __init__(self,ip):
+class VNA(vm.VNAbase):
+    def __init__(self,ip,cache = False):
+        import vxi11 as vx # only needed once an instrument is opened
         self.v = vx.Instrument(str(ip))
+        
+        # command batching and state cache, see VNAModule.VNAbase
+        self.init_cache(cache)
+    
+    def send(self,msg):
+        self.v.write(''.join([msg,'\n']))
     
-    def cmd(self,str1,arg):
-        self.v.write(''.join([str(str1),' ',str(arg),'\n']))
-
     def query(self,str1):
+        self.flush()
         return self.v.ask(''.join([str(str1),'?\n']))
-        
-    def cmd_only(self,str1,arg):
-        if arg == '?':
-            raise ValueError('No queries allowed. This is only a command.')
-        else:
-            self.cmd(str1,arg)
-    
-    def query_only(self,str1,arg='?'):
-        if arg == '?':
-            return (self.query(str1))
-        else:
-            raise ValueError('No arguments allowed. This is only a query.')
-        
-    def cmd_query(self,str1,arg='?'):
-        if arg == '?':
-            return self.query(str1)
-        else:
-            self.cmd(str1,arg)
     
     # Close connection
     def close(self):
+        self.flush()
+        self.shadow = {}
         self.v.close()
     
     
@@ -61,6 +58,11 @@ class VNA(object):
         """ Turns RF output power on/off."""
         str1 = ':OUTPut'
         return self.cmd_query(str1,arg)
+    
+    def initiate_cont(self,arg='?'): # arg = ON|OFF|1|0
+        """ Continuous sweeping on/off. OFF holds the last measured trace."""
+        str1 = ':INITiate:CONTinuous'
+        return self.cmd_query(str1,arg)
         
         
     #POWER settings
@@ -112,6 +114,12 @@ class VNA(object):
         str1 = ''.join(['CALCulate',str(channel),':TRACe:DATA:FDATa'])
         dat = self.query(str1).split(',')
         return dat[0::2],dat[1::2]
+    
+    def trace_read_raw(self,channel=''):
+        '''Reads the trace as the undecoded response bytes, see decode_trace.'''
+        str1 = ''.join(['CALCulate',str(channel),':TRACe:DATA:FDATa'])
+        self.flush()
+        return self.v.ask_raw(''.join([str1,'?\n']).encode('UTF-8'))
         
     # Setting the IF bandwidth
     # This command sets/gets the IF bandwidth of selected channel (Ch).
@@ -127,18 +135,7 @@ class VNA(object):
         power = RF_out power in dB
         wait =  data collection time in seconds
         BW = IF bandwidth'''
-        self.IFBW(BW)
-        self.freq_npoints(npoints)    
-        self.freq_start(f_range[0])
-        self.freq_stop(f_range[1])
-        self.power(power)
-        if (navg==0):
-            self.average_state(0)
-        else:
-            self.average_state(1)
-            self.average_count(navg)
-            
-        self.average_reset()
+        self.configure(f_range,npoints,navg,power,BW)
         time.sleep(wait) # delay
         x = np.asarray(self.freq_read(),dtype='float')
         y = np.asarray(self.trace_read()[0],dtype='float') 
@@ -147,35 +144,6 @@ class VNA(object):
         dat.load_var(x,y)
         return dat
 
-    def collect_scan(self,f_range_mat,npoints_v=[1601],navg_v = [999],power_v=[-50],wait_v=[1],BW_v=[1e3]):
-        x = []
-        y = []
-        range_mat = np.array(f_range_mat)
-        len_loop = len(range_mat[:,0])
-
-        def vector_handling(vector):
-            if len(vector) == 1:
-                out = vector[0]*np.ones(len_loop)
-            else:
-                out = vector
-            return out            
-    
-        npoints = vector_handling(npoints_v)
-        navg = vector_handling(npoints_v)
-        power = vector_handling(power_v)
-        wait = vector_handling(wait_v)
-        BW = vector_handling(BW_v)
-    
-        for i in np.arange(len_loop):
-            f_range = range_mat[i,:]           
-            dat_tmp = self.collect_single(f_range,npoints[i],navg[i],power[i],wait[i],BW[i])   
-            x = np.hstack((x,dat_tmp.x))
-            y = np.hstack((y,dat_tmp.y)) 
-        
-        dat = dm.data_2d()  
-        dat.load_var(x,y)   
-        return dat
-
     def collect_single_correct(self,f_range,npoints=1601,navg=999,power=-50,corr_power=-10,wait=10,corr_wait=1,BW=1e3):
             dat_cor = self.collect_single(f_range,npoints,navg,corr_power,corr_wait,BW)        
             dat_mes = self.collect_single(f_range,npoints,navg,power,wait,BW)        
@@ -184,9 +152,12 @@ class VNA(object):
             dat.load_var(dat_mes.x,dat_mes.y-dat_cor.y)
             return dat
 
-    def collect_scan_correct(self,f_range_mat,npoints_v=[1601],navg_v = [999],power_v=[-50],corr_power_v=[-10],wait_v=[10],corr_wait_v=[1],BW_v=[1e3]):
+    def collect_scan_correct(self,f_range_mat,npoints_v=[1601],navg_v = [999],power_v=[-50],corr_power_v=[-10],wait_v=[10],corr_wait_v=[1],BW_v=[1e3],callback=None):
             dat_cor = self.collect_scan(f_range_mat,npoints_v,navg_v,corr_power_v,corr_wait_v,BW_v)        
-            dat_mes = self.collect_scan(f_range_mat,npoints_v,navg_v,power_v,wait_v,BW_v)        
+            # the live view (callback) gets the corrected segments
+            seg = dat_cor.segments
+            corrected = None if callback is None else (lambda i,x,y: callback(i,x,y-dat_cor.y[seg['start'][i]:seg['stop'][i]]))
+            dat_mes = self.collect_scan(f_range_mat,npoints_v,navg_v,power_v,wait_v,BW_v,callback=corrected)        
         
             dat = dm.data_2d()
             dat.load_var(dat_mes.x,dat_mes.y-dat_cor.y)
@@ -10,11 +10,8 @@ E5173B_module_version = '1.0.0'
 
 ###############################################################################################
 # imports
-import vxi11 as vx
 import time
 import numpy as np
-import scipy as sc
-from scipy import optimize,signal
 ###############################################################################################
 
 ###############################################################################################
@@ -22,6 +19,7 @@ from scipy import optimize,signal
 
 class E5173B(object):
     def __init__(self,ip):
+        import vxi11 as vx # only needed once an instrument is opened
         self.v = vx.Instrument(str(ip))
         
     def cmd(self,str1,arg):
@@ -95,5 +93,4 @@ class E5173B(object):
 ###############################################################################################
 # Constants
 def_ip = '192.168.0.107'
-def_instr = E5173B(def_ip)
 ###############################################################################################
@@ -5,22 +5,333 @@ Created on Fri May 16 11:49:04 2014
 
 Experiment control module.
 """
-EXP_module_version = '1.0.0'
-print('Experiment module version: ',EXP_module_version)
+EXP_module_version = '1.1.0'
+
+import asyncio
+import functools
+import logging
+import queue
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 import DataModule as d_m
 import E5071C as vna_m
-import APSIN20G as sig_m
+import N5232A as pna_m
+
+logging.getLogger(__name__).info('Experiment module version: %s',EXP_module_version)
+
+
+
+
+
+def VNA_read(fstart,fstop,power=-60,wait=60,vna=None):
+    '''Measures one trace. Without vna a connection to the E5071C is opened for the call 
+    and closed again.'''
+    if vna is not None:
+        return vna.collect_single([fstart,fstop],power=power,wait=wait)
+    vna = vna_m.VNA(vna_m.def_ip)
+    try:
+        return vna.collect_single([fstart,fstop],power=power,wait=wait)
+    finally:
+        vna.close()
+
+
+##############################################################################
+# Asynchronous acquisition
+##############################################################################
+def vna_measure(vna,f_range,npoints=1601,navg=999,power=-50,wait=1,BW=1e3,**kwargs):
+    '''Configures the VNA, lets it sweep for 'wait' seconds and then holds the trace,
+    so that the other instruments can be changed while the trace is transferred.'''
+    vna.configure(f_range,npoints,navg,power,BW)
+    vna.initiate_cont('ON')
+    time.sleep(wait)
+    vna.initiate_cont('OFF')
+
+def vna_freq(vna,Name='CH1_S21',Trace=1,Spar='S21',**kwargs):
+    '''Selects the measurement (N5232A) and returns the frequency axis as delivered by the driver.'''
+    if isinstance(vna,pna_m.VNA):
+        vna.cmd('CALC'+str(Trace)+':PAR:EXT','\''+Name+'\', \''+Spar+'\'')
+        return vna.freq_read(Name)
+    return vna.freq_read()
+
+def vna_fetch(vna,**kwargs):
+    '''Transfers the held trace, returns the raw (x,y) as delivered by the driver.'''
+    x = vna_freq(vna,**kwargs)
+    if isinstance(vna,pna_m.VNA):
+        return x,vna.trace_read()
+    return x,vna.trace_read()[0]
+
+def trace_decoder(vna):
+    '''Returns the function converting raw trace bytes of this VNA to a float array.'''
+    if isinstance(vna,pna_m.VNA):
+        return functools.partial(pna_m.decode_trace,dtype=vna.dtype)
+    return vna_m.decode_trace
+
+def parse_trace(raw):
+    return np.asarray(raw[0],dtype='float'),np.asarray(raw[1],dtype='float')
+
+def apply_settings(instrument,settings):
+    '''Calls instrument.<method>(value) for every item of settings, e.g. {'frequency':5e9,'power':-10}.'''
+    for method,value in settings.items():
+        getattr(instrument,method)(value)
+
+
+class SweepPlan(object):
+    '''Outer loop over generator settings with one VNA sweep per outer point.
+    steps: list with one {instrument: {method: value}} dict per outer point
+    vna: settings of the VNA sweep (f_range, npoints, navg, power, wait, BW and, for the
+         N5232A, Name, Trace, Spar)
+    settle: seconds to wait after the generators have been set
+    y: outer axis of the resulting map (default: step index)
+
+    Example, VNA trace for every pump frequency of a signal generator:
+    plan = SweepPlan.grid(gen,'frequency',np.linspace(5e9,6e9,101),settle=0.2,
+                          f_range=[7e9,7.1e9],npoints=1601,navg=10,wait=2)'''
+    def __init__(self,steps,vna,settle=0.,y=None):
+        self.steps = list(steps)
+        self.vna = dict(vna)
+        self.settle = settle
+        self.y = np.arange(len(self.steps)) if y is None else np.asarray(y)
+
+    @classmethod
+    def grid(cls,instrument,method,values,settle=0.,**vna):
+        return cls([{instrument:{method:v}} for v in values],vna,settle,values)
+
+
+class AcquisitionEngine(object):
+    '''Runs a SweepPlan with the instruments working concurrently. Every instrument has its own
+    worker thread, so its commands stay in order, while asyncio overlaps the instruments: the
+    generators are set and settle for the next point while the VNA trace of the current point
+    is transferred and parsed.
+
+    engine = AcquisitionEngine(vna,[gen])
+    dat = engine.run(plan)    # data_3d, one row per outer point
+    print(engine.stats)'''
+    def __init__(self,vna,generators=()):
+        self.vna = vna
+        self.generators = list(generators)
+        self.workers = {}
+        self.parser = ThreadPoolExecutor(1)
+        self.stats = {}
+
+    def worker(self,instrument):
+        if id(instrument) not in self.workers:
+            self.workers[id(instrument)] = ThreadPoolExecutor(1)
+        return self.workers[id(instrument)]
+
+    async def call(self,executor,stage,func,*args,**kwargs):
+        t = time.perf_counter()
+        out = await asyncio.get_running_loop().run_in_executor(executor,functools.partial(func,*args,**kwargs))
+        self.stats[stage] += time.perf_counter() - t
+        return out
+
+    async def settle(self,step,settle):
+        await asyncio.gather(*[self.call(self.worker(g),'settle',apply_settings,g,settings) for g,settings in step.items()])
+        await asyncio.sleep(settle)
+
+    async def transfer(self,plan):
+        raw = await self.call(self.worker(self.vna),'transfer',vna_fetch,self.vna,**plan.vna)
+        return await self.call(self.parser,'parse',parse_trace,raw)
+
+    async def run_async(self,plan):
+        '''Coroutine version of run, for use inside a running event loop (e.g. Jupyter).'''
+        self.stats = {'settle':0.,'measure':0.,'transfer':0.,'parse':0.}
+        begin = time.perf_counter()
+
+        settling = asyncio.ensure_future(self.settle(plan.steps[0],plan.settle))
+        transfers = []
+        for i in range(len(plan.steps)):
+            await settling
+            await self.call(self.worker(self.vna),'measure',vna_measure,self.vna,**plan.vna)
+            if i+1 < len(plan.steps):
+                settling = asyncio.ensure_future(self.settle(plan.steps[i+1],plan.settle))
+            transfers.append(asyncio.ensure_future(self.transfer(plan)))
+        rows = await asyncio.gather(*transfers)
+
+        x = rows[0][0]
+        z = np.vstack([r[1] for r in rows])
+        self.stats['elapsed'] = time.perf_counter() - begin
+        self.stats['points'] = z.size
+        self.stats['points_per_s'] = z.size/self.stats['elapsed']
+
+        dat = d_m.data_3d()
+        dat.load_var(x,plan.y,z)
+        return dat
+
+    def run(self,plan):
+        '''Runs the plan and returns a data_3d (x: VNA frequency, y: plan.y). Timing of the
+        stages and the achieved points/second are left in self.stats.'''
+        return asyncio.run(self.run_async(plan))
+
+    def close(self):
+        for executor in list(self.workers.values())+[self.parser]:
+            executor.shutdown()
+        self.workers = {}
+
+
+##############################################################################
+# Pipelined acquisition
+##############################################################################
+class AcquisitionPipeline(object):
+    '''Repeated VNA sweeps with transfer, decoding and storage overlapped:
+
+    reader thread  -- raw trace bytes -->  decoder threads  -- arrays -->  writer thread
+    (sweep + transfer)    (bounded queue)    (nworkers)        (bounded queue)   (store)
+
+    The reader starts the next sweep as soon as a raw buffer is queued. The queues hold at
+    most maxsize items, a slow stage therefore stalls the stages in front of it instead of
+    filling the memory (backpressure). Rows are written in sweep order.
+    store: None (rows are kept in memory), a file name (a new DataModule.dataset with the
+           frequency axis, y: sweep index, and the settings, e.g. 'scan.dset') or any object
+           with append(row) and optionally close(), e.g. a DataModule.dataset opened for appending.
+    callback: called as callback(i,x,row) by the writer for every stored row, e.g. the
+              callback of a DataModule.liveplot in map mode.
+
+    pipe = AcquisitionPipeline(vna,'scan.dset')
+    pipe.run(500,f_range=[4e9,8e9],npoints=1601,navg=1,wait=0.5)
+    print(pipe.stats)    # per stage: items, busy time, time blocked on input/output'''
+    def __init__(self,vna,store=None,nworkers=2,maxsize=4,callback=None):
+        self.vna = vna
+        self.store = store
+        self.callback = callback
+        self.nworkers = nworkers
+        self.maxsize = maxsize
+        self.stats = {}
+
+    def stage_stats(self):
+        return {'items':0,'busy':0.,'wait_in':0.,'wait_out':0.}
+
+    def put(self,q,item,stage):
+        t = time.perf_counter()
+        while not self.failed.is_set():
+            try:
+                q.put(item,timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        # the decoder threads share their stage statistics
+        with self.lock:
+            self.stats[stage]['wait_out'] += time.perf_counter() - t
+
+    def get(self,q,stage):
+        t = time.perf_counter()
+        while not self.failed.is_set():
+            try:
+                item = q.get(timeout=0.1)
+                break
+            except queue.Empty:
+                pass
+        else:
+            item = None
+        with self.lock:
+            self.stats[stage]['wait_in'] += time.perf_counter() - t
+        return item
+
+    def guarded(self,func,*args):
+        try:
+            func(*args)
+        except Exception as e:
+            self.errors.append(e)
+            self.failed.set()
+
+    def reader(self,nsweeps,settings):
+        st = self.stats['reader']
+        for i in range(nsweeps):
+            if self.failed.is_set():
+                return
+            t = time.perf_counter()
+            vna_measure(self.vna,**settings)
+            if i == 0:
+                self.x = np.asarray(vna_freq(self.vna,**settings),dtype='float')
+            raw = self.vna.trace_read_raw()
+            st['busy'] += time.perf_counter() - t
+            st['items'] += 1
+            self.put(self.raw,(i,raw),'reader')
+        for k in range(self.nworkers):
+            self.put(self.raw,None,'reader')
 
+    def decoder(self,decode):
+        st = self.stats['decoder']
+        while True:
+            item = self.get(self.raw,'decoder')
+            if item is None:
+                self.put(self.decoded,None,'decoder')
+                return
+            t = time.perf_counter()
+            row = decode(item[1])
+            with self.lock:
+                st['busy'] += time.perf_counter() - t
+                st['items'] += 1
+            self.put(self.decoded,(item[0],row),'decoder')
 
+    def writer(self,append):
+        st = self.stats['writer']
+        waiting = {}
+        next_idx = 0
+        finished = 0
+        while finished < self.nworkers:
+            item = self.get(self.decoded,'writer')
+            if item is None:
+                finished += 1
+                continue
+            waiting[item[0]] = item[1]
+            t = time.perf_counter()
+            while next_idx in waiting:
+                row = waiting.pop(next_idx)
+                append(row)
+                if self.callback is not None:
+                    self.callback(next_idx,self.x,row)
+                next_idx += 1
+                st['items'] += 1
+            st['busy'] += time.perf_counter() - t
 
+    def run(self,nsweeps,**settings):
+        '''Takes nsweeps traces with the given vna_measure settings. Returns a data_3d
+        (y: sweep index) when rows are kept in memory, otherwise the number of rows written.'''
+        self.stats = {'reader':self.stage_stats(),'decoder':self.stage_stats(),'writer':self.stage_stats()}
+        self.raw = queue.Queue(self.maxsize)
+        self.decoded = queue.Queue(self.maxsize)
+        self.lock = threading.Lock()
+        self.failed = threading.Event()
+        self.errors = []
 
+        self.x = np.zeros(0)
+        rows = []
+        ds = None
+        if self.store is None:
+            append = rows.append
+        elif isinstance(self.store,str):
+            # created with the first row, when the frequency axis is known
+            def append(row):
+                nonlocal ds
+                if ds is None:
+                    ds = d_m.dataset(self.store,'w',x=self.x,settings=settings,units={'x':'Hz'})
+                ds.append(row)
+        else:
+            append = self.store.append
 
-def VNA_read(fstart,fstop,power=-60,wait=60):
-    x, y = vna_m.collect_sparam(fstart,fstop,power,wait)  
-        
-    dat = d_m.data_2d()
-    dat.load_var(x,y)
-    
-    return dat
+        begin = time.perf_counter()
+        threads = [threading.Thread(target=self.guarded,args=(self.reader,nsweeps,settings))]
+        threads += [threading.Thread(target=self.guarded,args=(self.decoder,trace_decoder(self.vna))) for k in range(self.nworkers)]
+        threads += [threading.Thread(target=self.guarded,args=(self.writer,append))]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        if ds is not None:
+            ds.close()
+        elif hasattr(self.store,'close'):
+            self.store.close()
+        self.stats['elapsed'] = time.perf_counter() - begin
+        self.stats['sweeps_per_s'] = self.stats['writer']['items']/self.stats['elapsed']
+        if self.errors:
+            raise self.errors[0]
 
+        if self.store is None:
+            z = np.vstack(rows) if rows else np.zeros((0,len(self.x)))
+            dat = d_m.data_3d()
+            dat.load_var(self.x,np.arange(len(rows)),z)
+            return dat
+        return self.stats['writer']['items']
@@ -6,10 +6,142 @@ Created on Sep 18, 2014
 
 #import numpy as np
 import numpy as np
-import scipy.optimize as opt
+import DataModule as dm
 
 
-class junction():
+def param(value):
+    '''Scalars are kept as they are, sequences become float arrays that broadcast with the other 
+    parameters.'''
+    return value if np.isscalar(value) else np.asarray(value,dtype='float')
+
+def grid(*vectors):
+    '''Open grid of parameter vectors for sweeps: every output has the length of its vector along 
+    its own axis and 1 along the others, so that the models broadcast them to the full grid.
+    
+    Area, T = grid(np.linspace(1e-13,1e-12,200), np.linspace(10e-3,300e-3,100))
+    j = junction(1.23, T, Area, 1300e-12, 50e-3, 30e-18)
+    j.F0    # (200,100) array'''
+    return np.meshgrid(*[np.asarray(v,dtype='float') for v in vectors],indexing='ij',sparse=True)
+
+
+# load terms of the even and odd loaded mode equations (array.calcModesLoaded)
+load_even = 1020.0*np.sqrt(2)
+load_odd = 0.000490196078431373*np.sqrt(2)
+
+
+def chandrupatla(f,a,b,xtol=2e-12,rtol=4*np.finfo(float).eps,maxiter=100):
+    '''Solves f(x) = 0 for arrays of brackets [a,b] at once (f must change sign on every 
+    bracket). Chandrupatla's method: inverse quadratic interpolation where it is safe, bisection 
+    otherwise, so it converges like Brent's/Ridder's method with one vectorized call of f per 
+    iteration. An element is done when its bracket is narrower than xtol + rtol*|x| (the 
+    tolerances of scipy.optimize.ridder). Brackets that are not finite give NaN.'''
+    x1 = np.array(b,dtype='float')
+    x2 = np.array(a,dtype='float')
+    x1,x2 = np.broadcast_arrays(x1,x2)
+    x1,x2 = x1.copy(),x2.copy()
+    f1 = f(x1)
+    f2 = f(x2)
+    x3,f3 = x2.copy(),f2.copy()
+    t = np.full(x1.shape,0.5)
+    done = ~(np.isfinite(x1) & np.isfinite(x2))
+    xm = np.where(done,np.nan,x1)
+    for i in range(maxiter):
+        xt = x1 + t*(x2-x1)
+        ft = f(xt)
+        same = np.sign(ft) == np.sign(f1)
+        x3 = np.where(same,x1,x2)
+        f3 = np.where(same,f1,f2)
+        x2 = np.where(same,x2,x1)
+        f2 = np.where(same,f2,f1)
+        x1,f1 = xt,ft
+        
+        better = np.abs(f1) < np.abs(f2)
+        xm = np.where(done,xm,np.where(better,x1,x2))
+        fm = np.where(better,f1,f2)
+        tol = xtol + rtol*np.abs(xm)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            tl = tol/np.abs(x2-x1)
+            done |= (tl > 0.5) | (fm == 0)
+            if done.all():
+                break
+            xi = (x1-x2)/(x3-x2)
+            phi = (f1-f2)/(f3-f2)
+            iqi = (phi**2 < xi) & ((1-phi)**2 < 1-xi)
+            t = np.where(iqi,f1/(f2-f1)*f3/(f2-f3) + (x3-x1)/(x2-x1)*f1/(f3-f1)*f2/(f3-f2),0.5)
+        t = np.clip(np.nan_to_num(t,nan=0.5),np.minimum(tl,0.5),1-np.minimum(tl,0.5))
+    return xm
+
+
+class parameter(object):
+    '''Input of a model. Assigning it stores param(value) (the value itself with convert=None) 
+    and makes the derived quantities that depend on it stale.'''
+    def __init__(self,convert=param):
+        self.convert = convert
+        
+    def __set_name__(self,owner,name):
+        self.name = name
+        
+    def __get__(self,obj,cls=None):
+        if obj is None:
+            return self
+        return obj.__dict__[self.name]
+    
+    def __set__(self,obj,value):
+        obj.__dict__[self.name] = value if self.convert is None else self.convert(value)
+        obj.versions[self.name] = obj.versions.get(self.name,0) + 1
+        obj.revision += 1
+
+
+class derived(object):
+    '''Derived quantity of a model, computed on first access and kept until one of its inputs 
+    (parameter names) is assigned again. An input that is itself a model (array.j) counts as 
+    changed whenever one of its own inputs changes.
+    
+    @derived('Area','RnUnit')
+    def Rn(self): ...'''
+    def __init__(self,*inputs):
+        self.inputs = inputs
+        
+    def __call__(self,func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+        return self
+        
+    def __get__(self,obj,cls=None):
+        if obj is None:
+            return self
+        key = obj.inputState(self.inputs)
+        hit = obj.memo.get(self.name)
+        if hit is None or hit[0] != key:
+            hit = (key,self.func(obj))
+            obj.memo[self.name] = hit
+        return hit[1]
+
+
+class cachedModel(object):
+    '''Bookkeeping of the parameter versions and memoized quantities of junction and array. 
+    Note that changing an input array in place is not seen, assign a new value instead.'''
+    def initCache(self):
+        self.versions = {}
+        self.memo = {}
+        self.revision = 0
+        
+    def inputState(self,inputs):
+        return tuple((self.versions[name],getattr(getattr(self,name),'revision',None)) for name in inputs)
+    
+
+class junction(cachedModel):
+    ''' Josephson junction. The inputs (Tc, T, Area, RnUnit, CjUnit, Cground) may be scalars or 
+    arrays (see grid); the derived quantities (Delta, Rn, Cj, Ic, Ej, Ec, Lj, F0) are computed on 
+    first access and kept until one of their inputs changes.'''
+    Tc = parameter()  # critical temperature in kelvin
+    T = parameter()  # junction temperature in kelvin
+    Area = parameter()  # junction area (m^2)
+    RnUnit = parameter()  # normal state resistance of the junction per unit area (ohm)
+    CjUnit = parameter()  # junction capacitance per unit area (Farads)
+    Cground = parameter()
+    
     def __init__(self, Tc, T, Area, RnUnit,
                  CjUnit, Cground):
         
@@ -27,20 +159,18 @@ class junction():
         self.Phi0_ = self.h_/(2*self.ec_)  # magnetic flux quanta (Wb)
         
         # Defining junction constants from parameters passed to the object
-        self.Tc = Tc  # critical temperature in kelvin
-        self.T = T  # junction temperature in kelvin
-        self.Area = Area  # junction area (m^2)
-        self.RnUnit = RnUnit  # normal state resistance of the junction per unit area (ohm)
-        self.CjUnit = CjUnit  # junction capacitance per unit area (Farads)
+        # (every parameter may also be an array, see grid)
+        self.initCache()
+        self.Tc = Tc
+        self.T = T
+        self.Area = Area
+        self.RnUnit = RnUnit
+        self.CjUnit = CjUnit
         self.Cground = Cground
         
-        # Calculating junction properties
-        self.update()
-        
-        
-    
     
     def update(self, Tc=None, T=None, Area=None, RnUnit=None, CjUnit=None, Cground=None):
+        ''' Sets the given inputs, the derived quantities follow on their next access.'''
         if not Tc is None :
             self.Tc = Tc
         if not T is None :
@@ -53,19 +183,44 @@ class junction():
             self.CjUnit = CjUnit
         if not Cground is None :
             self.Cground = Cground
-        
-            
-        self.Delta0 = self.calcDelta0(self.Tc)
-        self.Delta = self.calcDelta(self.T, self.Tc, self.Delta0)
-        self.Rn = self.calcRn(self.Area, self.RnUnit)
-        self.Cj = self.calcCj(self.Area, self.CjUnit)
-        self.Ic = self.calcIc(self.Rn,self.Delta,self.T)
-        self.Ej = self.calcEj(self.Ic)
-        self.Ec = self.calcEc(self.Cj)
+    
+    @derived('Tc')
+    def Delta0(self):
+        return self.calcDelta0(self.Tc)
+    
+    @derived('Tc','T')
+    def Delta(self):
+        return self.calcDelta(self.T, self.Tc, self.Delta0)
+    
+    @derived('Area','RnUnit')
+    def Rn(self):
+        return self.calcRn(self.Area, self.RnUnit)
+    
+    @derived('Area','CjUnit')
+    def Cj(self):
+        return self.calcCj(self.Area, self.CjUnit)
+    
+    @derived('Tc','T','Area','RnUnit')
+    def Ic(self):
+        return self.calcIc(self.Rn,self.Delta,self.T)
+    
+    @derived('Tc','T','Area','RnUnit')
+    def Ej(self):
+        return self.calcEj(self.Ic)
+    
+    @derived('Area','CjUnit')
+    def Ec(self):
+        return self.calcEc(self.Cj)
+    
+    @derived('Tc','T','Area','RnUnit')
+    def Lj(self):
         # in the following case, the junction current is assumed to be a thousand 
         # times smaller than the critical current
-        self.Lj = self.calcLj_lowCurr(self.Ic, self.Ic*1e-3)  
-        self.F0 = self.calcF0(self.Lj, self.Cj)
+        return self.calcLj_lowCurr(self.Ic, self.Ic*1e-3)  
+    
+    @derived('Tc','T','Area','RnUnit','CjUnit')
+    def F0(self):
+        return self.calcF0(self.Lj, self.Cj)
         
 
     def calcDelta0(self,Tc):
@@ -100,7 +255,6 @@ class junction():
         return 1/(2*np.pi*np.sqrt(Lj*Cj))
     
     def junctionInfo(self,PrintInfo=True):
-        self.update()
         txt = ('\n\nJunction Information: \n' +
               '\n=================================================================' +
               '\n* F0 = ' + '%0.2f' % (self.F0/1e9) + ' GHz   Plasma frequency ' +
@@ -125,31 +279,69 @@ class junction():
 
 
     
-class array():
+class array(cachedModel):
+    ''' Array of N identical junctions with shunt capacitance Cs. N, Cs and the parameters of 
+    the junction may be arrays (see grid): slipRate and thermalPop then have the broadcast 
+    shape, the mode spectra have one more (last) axis over the mode index, padded with NaN 
+    where N is smaller than the largest N. Like the junction quantities, slipRate, thermalPop 
+    and the mode spectra are computed on first access and recomputed only after N, Cs or the 
+    junction (also one of its inputs) changed.'''
+    j = parameter(convert=None)
+    Cs = parameter()
+    N = parameter()
+    
     def __init__(self, junction, Cs, N):
         self.h_ = 6.62606957e-34  # planck constant (J.s)
         self.kb_ = 1.3806488e-23  # Boltzman coefficient (J.K^-1)
         
+        self.initCache()
         self.j = junction
-        self.Cs = Cs        
+        self.Cs = Cs
         self.N = N
         
-        self.update()
-        
             
     def update(self, junction = None, N = None, Cs = None):
-        
+        ''' Sets the given inputs, the derived quantities follow on their next access.'''
         if not junction is None :
             self.j = junction
         if not N is None :
             self.N = N 
         if not Cs is None :
             self.Cs = Cs 
-            
-        self.slipRate = self.calcSlipRate(self.j.Ej,self.j.Ec,self.N)
-        self.unloadedModes = self.calcModesUnloaded(self.j.F0, np.arange(1,np.floor(self.N/2)), self.N, self.j.Cj, self.j.Cground)
-        self.loadedModes = self.calcModesLoaded(self.j.F0, np.arange(1,np.floor(self.N/2)), self.N, self.j.Cj, self.j.Cground,self.Cs,self.j.Ec,self.j.Ej)
-        self.thermalPop = self.calcThermalPop(self.slipRate, self.j.T)
+    
+    @derived('j','N')
+    def slipRate(self):
+        return self.calcSlipRate(self.j.Ej,self.j.Ec,self.N)
+    
+    @derived('j','N')
+    def thermalPop(self):
+        return self.calcThermalPop(self.slipRate, self.j.T)
+    
+    def modeGrid(self):
+        ''' Broadcast shape of the parameters and, for array-valued parameters, the mode indices 
+        up to the largest N and the mask of the modes that exist for every N.'''
+        shape = np.broadcast(self.j.F0,self.j.Cj,self.j.Cground,self.j.Ec,self.j.Ej,self.N,self.Cs).shape
+        if shape == ():
+            return shape,np.arange(1,np.floor(self.N/2)),None
+        n = np.arange(1,np.floor(np.max(self.N)/2))
+        return shape,n,n < np.floor(np.broadcast_to(self.N,shape)/2)[...,None]
+    
+    @derived('j','N')
+    def unloadedModes(self):
+        shape,n,valid = self.modeGrid()
+        if shape == ():
+            return self.calcModesUnloaded(self.j.F0, n, self.N, self.j.Cj, self.j.Cground)
+        ex = lambda v: np.broadcast_to(v,shape)[...,None]
+        return np.where(valid,self.calcModesUnloaded(ex(self.j.F0),n,ex(self.N),ex(self.j.Cj),ex(self.j.Cground)),np.nan)
+    
+    @derived('j','N','Cs')
+    def loadedModes(self):
+        shape,n,valid = self.modeGrid()
+        if shape == ():
+            return self.calcModesLoaded(self.j.F0, n, self.N, self.j.Cj, self.j.Cground,self.Cs,self.j.Ec,self.j.Ej)
+        ex = lambda v: np.broadcast_to(v,shape)[...,None]
+        return self.calcModesLoaded(ex(self.j.F0),n,ex(self.N),ex(self.j.Cj),ex(self.j.Cground),ex(self.Cs),
+                                    ex(self.j.Ec),ex(self.j.Ej),self.unloadedModes)
     
     
     def calcSlipRate(self,Ej,Ec,N):
@@ -161,35 +353,42 @@ class array():
     def calcModesUnloaded(self,f0,n,N,Cj,C0):
         return f0*np.sqrt((1-np.cos(np.pi*n/N))/(1-np.cos(np.pi*n/N)+C0/(2*Cj)))
     
-    def calcModesLoaded(self,f0,n_vec,N,C_j,C_0,C_s,E_c,E_j):
+    def modeCoefficients(self,f0,n,N,C_j,C_0,E_c,E_j):
+        ''' Coefficients a (of the tangent argument) and r (of the load term) of the loaded mode 
+        equations, see calcModesLoaded.'''
+        u = 1 - np.cos(np.pi*n/N)
+        v = u + C_0/(2*C_j)
+        with np.errstate(divide='ignore',invalid='ignore'): # u = 0 in the padding of mode grids
+            return np.pi*n/(2*f0*np.sqrt(u/v)),np.sqrt(E_c/(E_j*u*v))
+    
+    def calcModesLoaded(self,f0,n_vec,N,C_j,C_0,C_s,E_c,E_j,unloadedModes=None):
         #eq_even = lambda omega_l: -1020.0*np.sqrt(2)*C_s*omega_l*np.sqrt(E_c/(E_j*(-np.cos(np.pi*n/N) + 1)*(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1))) - np.tan(np.pi*n*omega_l/(2*f0*np.sqrt((-np.cos(np.pi*n/N) + 1)/(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1))))
         #eq_odd = lambda omega_l: -np.tan(np.pi*n*omega_l/(2*f0*np.sqrt((-np.cos(np.pi*n/N) + 1)/(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1)))) + 0.000490196078431373*np.sqrt(2)/(C_s*omega_l*np.sqrt(E_c/(E_j*(-np.cos(np.pi*n/N) + 1)*(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1))))
+        # with u = 1-cos(pi*n/N), v = u + C_0/(2*C_j) both equations read
+        #   even: -b*omega_l - tan(a*omega_l),  odd: b/omega_l - tan(a*omega_l)
+        # and the modes are solved together, every one between the poles of its tangent.
+        # All arguments broadcast, the mode index runs along n_vec.
         
-        sol = np.array([])
         eps = 1e2
-
-        for n in n_vec:
-    
-            if n%2==0: # even numbers
-                #eq = lambda w_l_num: eq_even_num(nn,N_num,C0_num,Cj_num,Cs_num,w0_num,Ec_num,Ej_num,w_l_num)
-                eq = lambda omega_l: -1020.0*np.sqrt(2)*C_s*omega_l*np.sqrt(E_c/(E_j*(-np.cos(np.pi*n/N) + 1)*(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1))) - np.tan(np.pi*n*omega_l/(2*f0*np.sqrt((-np.cos(np.pi*n/N) + 1)/(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1))))
-                sol = np.append(sol,opt.ridder(eq,self.unloadedModes[n-1]*(1-1/n)+eps,self.unloadedModes[n-1]-eps))
-            else:
-                #eq = lambda w_l_num: eq_odd_num(nn,N_num,C0_num,Cj_num,Cs_num,w0_num,Ec_num,Ej_num,w_l_num)
-                eq = lambda omega_l: -np.tan(np.pi*n*omega_l/(2*f0*np.sqrt((-np.cos(np.pi*n/N) + 1)/(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1)))) + 0.000490196078431373*np.sqrt(2)/(C_s*omega_l*np.sqrt(E_c/(E_j*(-np.cos(np.pi*n/N) + 1)*(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1))))
-                if n==1:
-                    sol = np.append(sol,opt.ridder(eq,eps,self.unloadedModes[n-1]-eps))
-                else:
-                    sol = np.append(sol,opt.ridder(eq,self.unloadedModes[n-1]*(1-2/n)+eps,self.unloadedModes[n-1]-eps))
-
-        return sol
+        if unloadedModes is None:
+            unloadedModes = self.unloadedModes
+        n = np.asarray(n_vec,dtype='float')
+        a,r = self.modeCoefficients(f0,n,N,C_j,C_0,E_c,E_j)
+        even = n%2 == 0
+        b = np.where(even,load_even*C_s*r,load_odd/(C_s*r))
+        
+        fu = np.asarray(unloadedModes,dtype='float')
+        lo = np.where(even,fu*(1-1/n)+eps,np.where(n == 1,eps,fu*(1-2/n)+eps))
+        hi = fu - eps
+        def eq(omega_l):
+            return np.where(even,-b*omega_l,b/omega_l) - np.tan(a*omega_l)
+        return chandrupatla(eq,lo,hi)
     
     
     def calcThermalPop(self,slipRate,T):
         return np.exp(-2*slipRate*self.h_/(self.kb_*T))/(1 + np.exp(-2*slipRate*self.h_/(self.kb_*T)))*100
     
     def arrayInfo(self,PrintInfo=True):
-        self.update()
         txt =('\n\nArray Information: \n' +
               '\n=================================================================' +
               '\n* Cs = ' + '%0.3f' % (self.Cs*1e15) + 'fF' +
@@ -206,7 +405,246 @@ class array():
             print(txt)
             
         return txt
+
+
+
+def design(Tc, T, CjUnit, Cground, F0=None, RnUnit=None, EjEc=None, Area=None,
+           slipRate=None, Larray=None, N=None, f1=None, Cs=None):
+    ''' Inverse design: solves the junction and array parameters for target values, in closed 
+    form and for whole arrays of specifications at once (all arguments broadcast).
+    
+    RnUnit from the plasma frequency F0 (F0 does not depend on the area: Ic and Cj both scale 
+           with it), or given
+    Area   from the ratio EjEc = Ej/Ec (Ej ~ Area, Ec ~ 1/Area), or given
+    N      from the phase slip rate slipRate (proportional to N) or the array inductance 
+           Larray = N*Lj, rounded to an integer, or given
+    Cs     from the first loaded array mode f1 (n=1 equation of calcModesLoaded), NaN where f1 
+           is not below the first unloaded mode, or given (may be left None)
+    
+    Returns a dict with RnUnit, Area, N and Cs.
     
+    d = design(1.23, 20e-3, 50e-3, 30e-18, F0=np.linspace(15e9,25e9,1000), EjEc=100, Larray=50e-9, f1=5e9)
+    j = junction(1.23, 20e-3, d['Area'], d['RnUnit'], 50e-3, 30e-18)
+    arr = array(j, d['Cs'], d['N'])'''
+    if (F0 is None) == (RnUnit is None) or (EjEc is None) == (Area is None):
+        raise ValueError('Give exactly one of F0/RnUnit and one of EjEc/Area.')
+    if sum(v is not None for v in (slipRate,Larray,N)) != 1:
+        raise ValueError('Give exactly one of slipRate/Larray/N.')
+    if f1 is not None and Cs is not None:
+        raise ValueError('Give either f1 or Cs.')
     
+    # unit-area junction: Ic, Ej, Lj and Cj per unit area, the constants and model equations
+    j = junction(Tc, T, 1., 1., CjUnit, Cground)
+    Ic1 = j.calcIc(1., j.Delta, j.T) # critical current times RnUnit per unit area
+    if F0 is not None:
+        # F0^2 = Ic*sqrt(1-1e-6)/(2*pi*Phi0*Cj), per unit area
+        icd = 2*np.pi*j.Phi0_*j.CjUnit*np.asarray(F0,dtype='float')**2/np.sqrt(1-1e-6)
+        RnUnit = Ic1/icd
+    RnUnit = param(RnUnit)
+    if EjEc is not None:
+        Area = np.sqrt(np.asarray(EjEc,dtype='float')*j.calcEc(j.CjUnit)/j.calcEj(Ic1/RnUnit))
+    Area = param(Area)
+    j.update(Area=Area, RnUnit=RnUnit)
     
+    arr = array(j, 1., 1.)
+    if slipRate is not None:
+        N = np.rint(np.asarray(slipRate,dtype='float')/arr.calcSlipRate(j.Ej,j.Ec,1.))
+    elif Larray is not None:
+        N = np.rint(np.asarray(Larray,dtype='float')/j.Lj)
+    N = param(N)
+    if f1 is not None:
+        f1 = np.asarray(f1,dtype='float')
+        a,r = arr.modeCoefficients(j.F0,1.,N,j.Cj,j.Cground,j.Ec,j.Ej)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            Cs = np.where((a*f1 > 0) & (a*f1 < np.pi/2),load_odd/(r*f1*np.tan(a*f1)),np.nan)
+    return {'RnUnit':RnUnit,'Area':Area,'N':N,'Cs':None if Cs is None else param(Cs)}
+
+
+
+class runningStats(object):
+    ''' Streaming statistics of a quantity with shape 'shape' (one value per realization): count, 
+    mean and variance (Chan/Welford updates) and a histogram of log(value/ref) with nbins bins 
+    over +-span (values outside are counted in the first/last bin). Nothing but the counters is 
+    kept, and two runningStats of the same quantity can be merged, so batches may come from 
+    different processes.'''
+    def __init__(self,ref,span,nbins=200):
+        self.ref = np.asarray(ref,dtype='float')
+        self.span = span
+        self.edges = np.linspace(-span,span,nbins+1)
+        self.count = 0
+        self.mean = np.zeros(self.ref.shape)
+        self.m2 = np.zeros(self.ref.shape)
+        self.hist = np.zeros(self.ref.shape+(nbins,),dtype='int64')
+        self.nonfinite = np.zeros(self.ref.shape,dtype='int64')
+        
+    def push(self,values):
+        ''' Adds a batch of realizations, values has shape (batch,)+shape.'''
+        values = np.asarray(values,dtype='float')
+        ok = np.isfinite(values)
+        self.nonfinite += (~ok).sum(0)
+        values = values[ok.all(axis=tuple(range(1,values.ndim)))]
+        n = len(values)
+        if n == 0:
+            return
+        other = runningStats(self.ref,self.span,self.hist.shape[-1])
+        other.count = n
+        other.mean = values.mean(0)
+        other.m2 = ((values-other.mean)**2).sum(0)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            bins = np.searchsorted(self.edges,np.log(values/self.ref),side='right')-1
+        bins = np.clip(bins,0,len(self.edges)-2).reshape(n,-1)
+        flat = other.hist.reshape(-1,len(self.edges)-1)
+        for k in range(flat.shape[0]):
+            flat[k] = np.bincount(bins[:,k],minlength=flat.shape[1])
+        self.merge(other)
         
+    def merge(self,other):
+        n = self.count + other.count
+        if other.count:
+            delta = other.mean - self.mean
+            self.mean = self.mean + delta*other.count/n
+            self.m2 = self.m2 + other.m2 + delta**2*self.count*other.count/n
+        self.count = n
+        self.hist += other.hist
+        self.nonfinite += other.nonfinite
+        return self
+    
+    @property
+    def std(self):
+        return np.sqrt(self.m2/max(self.count-1,1))
+    
+    def histogram(self):
+        ''' Bin edges (in units of the quantity, shape (nbins+1,)+shape) and counts.'''
+        edges = self.ref[...,None]*np.exp(self.edges)
+        return np.moveaxis(edges,-1,0),np.moveaxis(self.hist,-1,0)
+    
+    def percentile(self,q):
+        ''' Percentiles q (in %) interpolated in the histogram, shape q.shape+shape.'''
+        q = np.asarray(q,dtype='float')
+        cdf = np.cumsum(self.hist,axis=-1)/np.maximum(self.hist.sum(-1),1)[...,None]
+        cdf = np.concatenate((np.zeros(cdf.shape[:-1]+(1,)),cdf),axis=-1).reshape(-1,len(self.edges))
+        logr = np.array([np.interp(q/100,c,self.edges) for c in cdf]).T
+        return self.ref*np.exp(logr.reshape(q.shape+self.ref.shape))
+
+
+def spreadBatch(nominal,N,sigmaArea,sigmaRnUnit,distribution,nmodes,seed,size):
+    ''' size realizations of an array of N junctions whose Area and RnUnit are drawn per junction 
+    around nominal = (Tc, T, Area, RnUnit, CjUnit, Cground) (see fabricationSpread). Returns the 
+    Ej/Ec of every junction (size,N), the slip rate of the array (sum over the junctions) (size,) 
+    and the lowest nmodes unloaded modes (size,nmodes).'''
+    Tc,T,Area,RnUnit,CjUnit,Cground = nominal
+    rng = np.random.default_rng(seed)
+    if distribution == 'normal':
+        draw = lambda x,s: x*(1 + s*rng.standard_normal((size,N)))
+    elif distribution == 'lognormal':
+        draw = lambda x,s: x*np.exp(s*rng.standard_normal((size,N)))
+    else:
+        raise ValueError("distribution must be 'normal' or 'lognormal'")
+    j = junction(Tc,T,draw(Area,sigmaArea),draw(RnUnit,sigmaRnUnit),CjUnit,Cground)
+    arr = array(j,0.,N)
+    
+    # chain of N junctions between ground and ground, one island (capacitance Cground) between 
+    # neighbouring junctions: K phi = w^2 C phi with the (N-1)x(N-1) tridiagonal inverse inductance 
+    # and capacitance matrices. For identical junctions this gives calcModesUnloaded.
+    g = 1/j.Lj
+    c = j.Cj
+    i = np.arange(N-1)
+    K = np.zeros((size,N-1,N-1))
+    C = np.zeros((size,N-1,N-1))
+    K[:,i,i] = g[:,:-1] + g[:,1:]
+    C[:,i,i] = c[:,:-1] + c[:,1:] + Cground
+    K[:,i[:-1],i[1:]] = K[:,i[1:],i[:-1]] = -g[:,1:-1]
+    C[:,i[:-1],i[1:]] = C[:,i[1:],i[:-1]] = -c[:,1:-1]
+    Li = np.linalg.inv(np.linalg.cholesky(C))
+    w2 = np.linalg.eigvalsh(Li @ K @ Li.swapaxes(-1,-2))
+    modes = np.sqrt(np.clip(w2[:,:nmodes],0,None))/(2*np.pi)
+    return j.Ej/j.Ec,arr.calcSlipRate(j.Ej,j.Ec,1).sum(-1),modes
+
+def spreadStats(nominal,N,sigmaArea,sigmaRnUnit,distribution,nmodes,seed,size,template):
+    ''' Runs spreadBatch and returns only its statistics (runningStats like those of template).'''
+    EjEc,slip,modes = spreadBatch(nominal,N,sigmaArea,sigmaRnUnit,distribution,nmodes,seed,size)
+    stats = dict((k,runningStats(v.ref,v.span,len(v.edges)-1)) for k,v in template.items())
+    stats['EjEcMean'].push(EjEc.mean(-1))
+    stats['EjEcMin'].push(EjEc.min(-1))
+    stats['slipRate'].push(slip)
+    stats['modes'].push(modes)
+    return stats
+
+
+class fabricationSpread(object):
+    ''' Monte-Carlo analysis of junction-to-junction variations: every junction of an array of N 
+    gets its own Area and RnUnit, drawn around the values of 'junction' with relative standard 
+    deviations sigmaArea and sigmaRnUnit ('normal' or 'lognormal'). For every realization the 
+    Ej/Ec of the junctions, the slip rate of the array (sum of the slip rates of the junctions) 
+    and the lowest nmodes unloaded modes (eigenmodes of the disordered chain) are computed, in 
+    batches of realizations at once. The batches run in a process pool with one seed per batch 
+    (SeedSequence.spawn), so the result depends on seed but not on the number of processes, and 
+    only their statistics (runningStats: mean, std, histogram, percentiles) are kept. The 
+    process pool is opt-in (run(processes=...), see DataModule.parallel_map).
+    
+    The loaded modes (Cs) are left out: calcModesLoaded describes identical junctions only.
+    
+    mc = fabricationSpread(junction(1.23, 20e-3, 4e-13, 1300e-12, 50e-3, 30e-18), 100, 0.03, 0.05)
+    stats = mc.run(10000)
+    stats['modes'].percentile([5,50,95])
+    mc.spreadInfo()'''
+    spans = {'EjEcMean':0.5,'EjEcMin':1.,'slipRate':10.,'modes':0.3} # histogram ranges, log(value/nominal)
+    
+    def __init__(self,junction,N,sigmaArea=0.02,sigmaRnUnit=0.02,distribution='normal',nmodes=10):
+        self.nominal = tuple(float(v) for v in (junction.Tc,junction.T,junction.Area,junction.RnUnit,
+                                                 junction.CjUnit,junction.Cground))
+        self.N = int(N)
+        self.sigmaArea = sigmaArea
+        self.sigmaRnUnit = sigmaRnUnit
+        self.distribution = distribution
+        self.nmodes = max(1,min(nmodes,self.N-1))
+        self.stats = None
+        
+        # identical junctions, reference of the histograms
+        EjEc,slip,modes = spreadBatch(self.nominal,self.N,0.,0.,distribution,self.nmodes,0,1)
+        self.reference = {'EjEcMean':EjEc[0,0],'EjEcMin':EjEc[0,0],'slipRate':slip[0],'modes':modes[0]}
+        
+    def emptyStats(self,nbins):
+        return dict((k,runningStats(self.reference[k],self.spans[k],nbins)) for k in self.spans)
+    
+    def run(self,samples,seed=0,batch=None,processes=1,nbins=200):
+        ''' Adds 'samples' realizations to the statistics (repeated runs need different seeds) 
+        and returns them. batch: realizations per batch (default: about 32 MB of chain 
+        matrices), processes: number of worker processes (default 1: runs in this process).'''
+        if batch is None:
+            batch = int(max(1,min(samples,4e6//self.N**2)))
+        sizes = [batch]*(samples//batch) + ([samples%batch] if samples%batch else [])
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        if self.stats is None:
+            self.stats = self.emptyStats(nbins)
+        args = (self.nominal,self.N,self.sigmaArea,self.sigmaRnUnit,self.distribution,self.nmodes)
+        template = self.emptyStats(nbins)
+        
+        # batches merged in order, so the result does not depend on the number of processes
+        for part in dm.parallel_map(spreadStats,[args+(s,n,template) for s,n in zip(seeds,sizes)],processes):
+            self.merge(part)
+        return self.stats
+    
+    def merge(self,part):
+        for k in self.stats:
+            self.stats[k].merge(part[k])
+    
+    def spreadInfo(self,PrintInfo=True):
+        s = self.stats
+        pc = dict((k,s[k].percentile([5,50,95])) for k in s)
+        txt = ('\n\nFabrication Spread: \n' +
+              '\n=================================================================' +
+              '\n* N = ' + str(self.N) + ',  sigma(Area) = ' + '%0.1f' % (100*self.sigmaArea) + ' %,  sigma(RnUnit) = ' + 
+              '%0.1f' % (100*self.sigmaRnUnit) + ' %  (' + self.distribution + '),  ' + str(s['slipRate'].count) + ' realizations' +
+              '\n*----------------------------------------------------------------' +
+              '\n*                      nominal        mean    5%/50%/95%' +
+              '\n* <Ej/Ec>        = ' + '%10.3f  %10.3f    %0.3f / %0.3f / %0.3f' % ((self.reference['EjEcMean'],s['EjEcMean'].mean)+tuple(pc['EjEcMean'])) +
+              '\n* min Ej/Ec      = ' + '%10.3f  %10.3f    %0.3f / %0.3f / %0.3f' % ((self.reference['EjEcMin'],s['EjEcMin'].mean)+tuple(pc['EjEcMin'])) +
+              '\n* slipRate [Hz]  = ' + '%10.2e  %10.2e    %0.2e / %0.2e / %0.2e' % ((self.reference['slipRate'],s['slipRate'].mean)+tuple(pc['slipRate'])) +
+              ''.join('\n* mode ' + '%-2d' % (n+1) + ' [GHz] = ' + '%10.4f  %10.4f    %0.4f / %0.4f / %0.4f' 
+                      % ((1e-9*self.reference['modes'][n],1e-9*s['modes'].mean[n])+tuple(1e-9*pc['modes'][:,n]))
+                      for n in range(self.nmodes)) +
+              '\n================================================================= \n\n')
+        if PrintInfo is True:
+            print(txt)
+        return txt
@@ -7,11 +7,12 @@ Created on Fri Mar 28 09:43:05 2014
 Module for communicating with ENA N5232A and analysing data
 """
 N5232A_module_version = '1.0.0'
-print('N5232A module version: ',N5232A_module_version)
 
 #import vxi11 as vx
+import logging
 import socket
 import DataModule as dm
+import VNAModule as vm
 import time
 import numpy as np
 
@@ -22,89 +23,189 @@ import numpy as np
 # Constants
 def_ip = '192.168.0.134'
 def_port = 5025
+
+logging.getLogger(__name__).info('N5232A module version: %s',N5232A_module_version)
+
+def_timeout = 10 # seconds, deadline for a single response
+
+# binary block transfer: FORMat:DATA REAL,<bits> / FORMat:BORDer NORMal|SWAPped
+data_dtypes = {(32,'NORM'):'>f4', (64,'NORM'):'>f8', (32,'SWAP'):'<f4', (64,'SWAP'):'<f8'}
 ###############################################################################################
 
 
-class VNA(object):
-    def __init__(self,ip = def_ip, port = def_port):
+def sweep_time_estimate(npoints,BW,navg=1):
+    '''Lower estimate (seconds) of the time needed for navg sweeps of npoints at IF bandwidth BW.'''
+    return max(navg,1)*float(npoints)/float(BW)
+
+def decode_trace(raw,dtype=None):
+    '''Converts a raw trace response (see VNA.trace_read_raw) to a float array: a definite-length 
+    block is viewed as dtype without copying, ASCII is parsed as comma separated values.'''
+    if raw[:1] == b'#':
+        ndigits = int(raw[1:2])
+        return np.frombuffer(raw,dtype=dtype,offset=2+ndigits)
+    return np.asarray(raw.split(b','),dtype='float')
+
+class InstrumentTimeout(Exception):
+    '''Raised when the instrument does not complete a response before the deadline.'''
+    pass
+
+
+class VNA(vm.VNAbase):
+    def __init__(self,ip = def_ip, port = def_port, binary = False, cache = False):
         #self.v = vx.Instrument(str(ip))
         self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # small command messages must not wait for Nagle's algorithm
+        self.s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         try:
             self.s.connect((ip, port))
         except socket.error as e:
             print("socket error")    
+        
+        # bytes received but not consumed yet (start of the next message)
+        self.rbuf = bytearray()
+        
+        # command batching and state cache, see VNAModule.VNAbase
+        self.init_cache(cache)
+        
+        # numpy dtype of binary blocks, None means ASCII transfer
+        self.dtype = None
+        # (bits,order) of binary_mode, sent again by restore_transfer
+        self.transfer = None
+        if binary:
+            self.binary_mode()
+    
+    def recv(self,deadline):
+        '''Receives whatever is available into the read buffer, blocking until the deadline.'''
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise InstrumentTimeout('No response from the instrument within the timeout.')
+        self.s.settimeout(remaining)
+        try:
+            data = self.s.recv(65536)
+        except socket.timeout:
+            raise InstrumentTimeout('No response from the instrument within the timeout.')
+        if not data:
+            raise socket.error('Connection closed by the instrument.')
+        self.rbuf += data
+    
+    def read_message(self,timeout=def_timeout):
+        '''Reads one response and returns it (without terminator) as bytes. A response is 
+        complete at the newline terminator or, for a definite-length block, after the announced 
+        number of bytes. Returns as soon as the response is complete, raises InstrumentTimeout 
+        if that does not happen before the deadline.'''
+        deadline = time.monotonic() + timeout
+        pos = 0
+        while True:
+            if self.rbuf[:1] == b'#' and len(self.rbuf) >= 2:
+                ndigits = int(self.rbuf[1:2])
+                if ndigits > 0 and len(self.rbuf) >= 2+ndigits:
+                    pos = max(pos,2+ndigits+int(self.rbuf[2:2+ndigits]))
+            idx = self.rbuf.find(b'\n',pos)
+            if idx >= 0:
+                msg = bytes(self.rbuf[:idx])
+                del self.rbuf[:idx+1]
+                return msg
+            pos = max(pos,len(self.rbuf))
+            self.recv(deadline)
     
-    def recv_timeout(self,timeout=2):
-        #make socket non blocking
-        the_socket=self.s
-        the_socket.setblocking(0)
-         
-        #total data partwise in an array
-        total_data=[];
-        data='';
-         
-        #beginning time
-        begin=time.time()
-        while 1:
-            #if you got some data, then break after timeout
-            if total_data and time.time()-begin > timeout:
-                break
-             
-            #if you got no data at all, wait a little longer, twice the timeout
-            elif time.time()-begin > timeout*2:
-                break
-             
-            #recv something
+    def recv_timeout(self,timeout=def_timeout):
+        '''Reads one response and returns it as a string.'''
+        return self.read_message(timeout).decode('UTF-8').rstrip('\r')
+    
+    def recv_exact(self,nbytes,timeout=def_timeout):
+        '''Reads exactly nbytes (buffered bytes first, then from the socket) and returns them as a uint8 array.'''
+        deadline = time.monotonic() + timeout
+        buf = np.empty(nbytes,dtype=np.uint8)
+        pos = min(nbytes,len(self.rbuf))
+        buf[:pos] = np.frombuffer(self.rbuf,dtype=np.uint8,count=pos)
+        del self.rbuf[:pos]
+        view = memoryview(buf)
+        while pos < nbytes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise InstrumentTimeout('Block transfer did not complete within the timeout.')
+            self.s.settimeout(remaining)
             try:
-                data = the_socket.recv(8192)
-                if data:
-                    total_data.append(str(data)[2:-1])
-                    #change the beginning time for measurement
-                    begin=time.time()
-                else:
-                    #sleep for sometime to indicate a gap
-                    time.sleep(0.1)
-            except:
-                pass
-         
-        #join all parts to make final string
-        return ''.join(total_data)[:-2]
+                n = self.s.recv_into(view[pos:],nbytes-pos)
+            except socket.timeout:
+                raise InstrumentTimeout('Block transfer did not complete within the timeout.')
+            if n == 0:
+                raise socket.error('Connection closed by the instrument.')
+            pos += n
+        return buf
+    
+    def read_block(self,timeout=def_timeout):
+        '''Reads an IEEE 488.2 definite-length block (#<n><length><data>) and returns 
+        its payload as a numpy array of type self.dtype. The payload is received straight 
+        into the array buffer, no string conversion takes place. The timeout is a deadline 
+        for the whole block.'''
+        deadline = time.monotonic() + timeout
+        head = self.recv_exact(2,timeout).tobytes()
+        if head[0:1] != b'#':
+            raise ValueError('Expected a definite-length block, got: '+repr(head))
+        ndigits = int(head[1:2])
+        if ndigits == 0:
+            raise ValueError('Indefinite-length blocks are not supported.')
+        nbytes = int(self.recv_exact(ndigits,deadline-time.monotonic()).tobytes())
+        buf = self.recv_exact(nbytes,deadline-time.monotonic())
+        self.read_message(deadline-time.monotonic()) # message terminator
+        return np.frombuffer(buf,dtype=self.dtype)
 #    def read(self,msg):
 #        self.s.send(''.join([msg,'\n']).encode('UTF-8'))
 #        #return self.s.recv(1024).split(':')[-1][:-1]
 #        return self.s.recv(1024)
     
-    def cmd(self,str1,arg):
-        self.s.send(''.join([str(str1),' ',str(arg),'\n']).encode('UTF-8'))
-        #return self.s.recv(1024)
-
-    def query(self,str1,timeout=0.5):
-        self.s.send(''.join([str(str1),'?','\n']).encode('UTF-8'))
-        return self.recv_timeout(timeout)
-        
-    def cmd_only(self,str1,arg):
-        if arg == '?':
-            raise ValueError('No queries allowed. This is only a command.')
-        else:
-            self.cmd(str1,arg)
+    def send(self,msg):
+        self.s.send(''.join([msg,'\n']).encode('UTF-8'))
     
-    def query_only(self,str1,arg='?'):
-        if arg == '?':
-            return (self.query(str1))
-        else:
-            raise ValueError('No arguments allowed. This is only a query.')
-        
-    def cmd_query(self,str1,arg='?'):
-        if arg == '?':
-            return self.query(str1)
-        else:
-            self.cmd(str1,arg)
+    def write(self,msg):
+        '''Sends one message, after any commands still queued by batch().'''
+        self.flush()
+        self.send(msg)
+    
+    def query(self,str1,timeout=def_timeout):
+        self.write(''.join([str(str1),'?']))
+        return self.recv_timeout(timeout)
     
     # Close connection
     def close(self):
+        self.flush()
+        self.shadow = {}
         self.s.close()
     
     
+    # DATA FORMAT settings
+    def data_format(self,fmt='?'): # fmt = ASCii,0|REAL,32|REAL,64
+        str1 = ':FORMat:DATA'
+        return self.cmd_query(str1,fmt)
+    
+    def byte_order(self,order='?'): # order = NORMal|SWAPped
+        str1 = ':FORMat:BORDer'
+        return self.cmd_query(str1,order)
+    
+    def binary_mode(self,bits=64,order='SWAPped'):
+        '''Switches trace and frequency transfers to binary blocks.
+        bits: 32 or 64 (REAL,32 | REAL,64)
+        order: NORMal (big-endian) or SWAPped (little-endian)'''
+        dtype = data_dtypes[(int(bits),order[:4].upper())]
+        self.data_format('REAL,'+str(int(bits)))
+        self.byte_order(order)
+        self.dtype = np.dtype(dtype)
+        self.transfer = (int(bits),order)
+    
+    def ascii_mode(self):
+        '''Switches trace and frequency transfers back to comma separated ASCII.'''
+        self.data_format('ASCii,0')
+        self.dtype = None
+        self.transfer = None
+    
+    def restore_transfer(self):
+        '''A reset puts the instrument back to ASCII transfers: reads expect ASCII until the 
+        binary format in use (if any) has been sent again.'''
+        self.dtype = None
+        if self.transfer is not None:
+            self.binary_mode(*self.transfer)
+    
     # Identification
     def identify(self):
         str1 = '*IDN'
@@ -114,6 +215,11 @@ class VNA(object):
         """ Turns RF output power on/off."""
         str1 = ':OUTPut'
         return self.cmd_query(str1,arg)
+    
+    def initiate_cont(self,arg='?'): # arg = ON|OFF|1|0
+        """ Continuous sweeping on/off. OFF holds the last measured trace."""
+        str1 = ':INITiate:CONTinuous'
+        return self.cmd_query(str1,arg)
         
         
     #POWER settings
@@ -146,6 +252,50 @@ class VNA(object):
                 return False
             else: 
                 return True
+    
+    def wait_for_average(self,timeout=None,channel=1,expected=0,method='poll',max_interval=1.):
+        '''Blocks until averaging on the channel has completed and returns the elapsed time in seconds.
+        timeout: deadline in seconds (default: ten times the expected time plus def_timeout),
+                 InstrumentTimeout is raised when it expires
+        expected: estimated measurement time in seconds (see sweep_time_estimate), no status 
+                  query is sent before it has elapsed
+        method: 'poll' checks the averaging status register with a backoff interval that starts 
+                at a fraction of the expected time and doubles up to max_interval.
+                'opc' switches the channel to a group of navg sweeps and waits on *OPC?, 
+                returning as soon as the instrument reports completion. The previous sweep mode 
+                is restored afterwards (HOLD if it was SINGle or GROups, which would sweep again).'''
+        if timeout is None:
+            timeout = 10*expected + def_timeout
+        begin = time.monotonic()
+        deadline = begin + timeout
+        
+        if method == 'opc':
+            count = int(float(self.average_count(channel=channel)))
+            str1 = ''.join([':SENSe',str(channel),':SWEep:MODE'])
+            previous = self.query(str1).strip()
+            if previous.upper().startswith(('SING','GRO')):
+                previous = 'HOLD'
+            try:
+                with self.batch(skip_unchanged=False):
+                    self.cmd(''.join([':SENSe',str(channel),':SWEep:GROups:COUNt']),count)
+                    self.cmd(str1,'GROups')
+                self.query('*OPC',timeout)
+            finally:
+                self.cmd(str1,previous)
+            return time.monotonic() - begin
+        
+        time.sleep(min(expected,timeout))
+        interval = max(0.01,expected/50.)
+        while not self.average_completed(channel):
+            if time.monotonic() + interval > deadline:
+                raise InstrumentTimeout('Averaging did not complete within '+str(timeout)+' s.')
+            time.sleep(interval)
+            interval = min(2*interval,max_interval)
+        return time.monotonic() - begin
+        
+    def sweep_time(self,channel=''):
+        str1 = ''.join([':SENSe',str(channel),':SWEep:TIME'])
+        return self.query_only(str1)
         
     # FREQUENCY sweep setting
     def freq_start(self,freq='?',channel=''):
@@ -173,13 +323,23 @@ class VNA(object):
         str1 = 'CALC:PAR:SEL'
         str2 = 'CALC:X'
         self.cmd(str1,'\''+MeasName+'\'')
+        if self.dtype is not None:
+            self.write(''.join([str2,'?']))
+            return self.read_block()
         return self.query(str2).split(',')
     
     def trace_read(self):
         #str1 = ''.join(['CALCulate',str(channel),':TRACe:DATA:FDATa'])
         str1 = ''.join(['CALC:DATA? FDATA'])
-        self.cmd(str1,'')
-        return self.recv_timeout(0.5).split(',')
+        self.write(str1)
+        if self.dtype is not None:
+            return self.read_block()
+        return self.recv_timeout().split(',')
+    
+    def trace_read_raw(self):
+        '''Reads the trace as the undecoded response bytes, see decode_trace.'''
+        self.write('CALC:DATA? FDATA')
+        return self.read_message()
         
         
     # Setting the IF bandwidth
@@ -196,18 +356,7 @@ class VNA(object):
         power = RF_out power in dB
         wait =  data collection time in seconds
         BW = IF bandwidth'''
-        self.IFBW(BW)
-        self.freq_npoints(npoints)    
-        self.freq_start(f_range[0])
-        self.freq_stop(f_range[1])
-        self.power(power)
-        if (navg==0):
-            self.average_state(0)
-        else:
-            self.average_state(1)
-            self.average_count(navg)
-            
-        self.average_reset()
+        self.configure(f_range,npoints,navg,power,BW)
         time.sleep(wait) # delay
         
         self.cmd('CALC'+str(Trace)+':PAR:EXT','\''+Name+'\', \''+Spar+'\'')        
@@ -227,21 +376,12 @@ class VNA(object):
         power = RF_out power in dB
         wait =  data collection time in seconds
         BW = IF bandwidth'''
-        self.IFBW(BW)
-        self.freq_npoints(npoints)    
-        self.freq_start(f_range[0])
-        self.freq_stop(f_range[1])
-        self.power(power)
+        self.configure(f_range,npoints,navg,power,BW)
+        
         if (navg==0):
-            self.average_state(0)
+            time.sleep(sweep_time_estimate(npoints,BW))
         else:
-            self.average_state(1)
-            self.average_count(navg)
-            
-        self.average_reset()
-        
-        while(self.average_completed() == False):
-            time.sleep(1)
+            self.wait_for_average(expected=sweep_time_estimate(npoints,BW,navg))
         
         self.cmd('CALC'+str(Trace)+':PAR:EXT','\''+Name+'\', \''+Spar+'\'')        
         
@@ -252,34 +392,11 @@ class VNA(object):
         dat.load_var(x,y)
         return dat
 
-    def collect_scan(self,f_range_mat,npoints_v=[1601],navg_v = [999],power_v=[-50],wait_v=[1],BW_v=[1e3]):
-        x = []
-        y = []
-        range_mat = np.array(f_range_mat)
-        len_loop = len(range_mat[:,0])
-
-        def vector_handling(vector):
-            if len(vector) == 1:
-                out = vector[0]*np.ones(len_loop)
-            else:
-                out = vector
-            return out            
-    
-        npoints = vector_handling(npoints_v)
-        navg = vector_handling(npoints_v)
-        power = vector_handling(power_v)
-        wait = vector_handling(wait_v)
-        BW = vector_handling(BW_v)
-    
-        for i in np.arange(len_loop):
-            f_range = range_mat[i,:]           
-            dat_tmp = self.collect_single(f_range,npoints[i],navg[i],power[i],wait[i],BW[i])   
-            x = np.hstack((x,dat_tmp.x))
-            y = np.hstack((y,dat_tmp.y)) 
-        
-        dat = dm.data_2d()  
-        dat.load_var(x,y)   
-        return dat
+    def collect_scan(self,f_range_mat,npoints_v=[1601],navg_v = [999],power_v=[-50],wait_v=[1],BW_v=[1e3],Name='CH1_S21',Trace=1,Spar='S21',views=False,callback=None):
+        '''Measures the frequency ranges in the rows of f_range_mat one after the other, see 
+        VNAModule.VNAbase.collect_scan.'''
+        return vm.VNAbase.collect_scan(self,f_range_mat,npoints_v,navg_v,power_v,wait_v,BW_v,views=views,callback=callback,
+                                       Name=Name,Trace=Trace,Spar=Spar)
 
     def collect_single_correct(self,f_range,name,npoints=1601,navg=999,power=-50,corr_power=-10,wait=10,corr_wait=1,BW=1e3):
             dat_cor = self.collect_single(f_range,name,npoints=npoints,navg=999,power=corr_power,wait=corr_wait,BW=1e3)   
@@ -301,10 +418,13 @@ class VNA(object):
             dat.load_var(dat_mes.x,dat_mes.y-dat_cor.y)
             return dat
 
-    def collect_scan_correct(self,f_range_mat,npoints_v=[1601],navg_v = [999],power_v=[-50],corr_power_v=[-10],wait_v=[10],corr_wait_v=[1],BW_v=[1e3]):
-            dat_cor = self.collect_scan(f_range_mat,npoints_v,navg_v,corr_power_v,corr_wait_v,BW_v)        
+    def collect_scan_correct(self,f_range_mat,npoints_v=[1601],navg_v = [999],power_v=[-50],corr_power_v=[-10],wait_v=[10],corr_wait_v=[1],BW_v=[1e3],Name='CH1_S21',Trace=1,Spar='S21',callback=None):
+            dat_cor = self.collect_scan(f_range_mat,npoints_v,navg_v,corr_power_v,corr_wait_v,BW_v,Name=Name,Trace=Trace,Spar=Spar)        
             
-            dat_mes = self.collect_scan(f_range_mat,npoints_v,navg_v,power_v,wait_v,BW_v)        
+            # the live view (callback) gets the corrected segments
+            seg = dat_cor.segments
+            corrected = None if callback is None else (lambda i,x,y: callback(i,x,y-dat_cor.y[seg['start'][i]:seg['stop'][i]]))
+            dat_mes = self.collect_scan(f_range_mat,npoints_v,navg_v,power_v,wait_v,BW_v,Name=Name,Trace=Trace,Spar=Spar,callback=corrected)        
         
             dat = dm.data_2d()
             dat.load_var(dat_mes.x,dat_mes.y-dat_cor.y)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:12:31 2026
+
+@author: Seyed Iman Mirzaei
+
+Resonator models for DataModule fits. Every model is vectorized over the frequency axis and
+carries its analytic Jacobian and a non-iterative initial guess, so it can be passed directly
+to data_2d.fit, data_3d.fit_rows or DataModule.fit_batch:
+
+import ResonatorModule as rm
+p,ss = d2.fit(rm.notch,None)                # S21 (complex) of a hanger resonator
+res = d3.fit_rows(rm.notch_db,None)          # |S21| in dB, one fit per row of zsel
+
+Parameters
+lorentzian: [f0, fwhm, offset, amplitude]
+complex models: [fr, Ql, Qc, phi, a, alpha]
+dB models: [fr, Ql, Qc, phi, a_dB]
+with S = a*exp(i*alpha)*(1 - k*(Ql/Qc)*exp(i*phi)/(1 + 2i*Ql*(f/fr - 1))), k = 1 for a notch
+(hanger) and k = 2 for a reflection resonator. Qint follows from 1/Qint = 1/Ql - cos(phi)/Qc.
+"""
+
+import numpy as np
+from scipy import ndimage, signal
+
+db_scale = 20/np.log(10)
+
+
+##############################################################################
+# Functions
+##############################################################################
+def lorentzian_func(p,x):
+    u = 2*(x-p[0])/p[1]
+    return p[2] + p[3]/(1+u**2)
+
+def lorentzian_jac(p,x):
+    u = 2*(x-p[0])/p[1]
+    L = 1/(1+u**2)
+    return np.column_stack((4*p[3]*u*L**2/p[1], 2*p[3]*u**2*L**2/p[1], np.ones_like(u), L))
+
+def resonance(p,x,k):
+    '''Returns the normalized response s (without a*exp(i*alpha)), g = k*Ql/Qc*exp(i*phi) and
+    the denominator D = 1 + 2i*Ql*(x/fr-1).'''
+    fr,Ql,Qc,phi = p[0],p[1],p[2],p[3]
+    g = k*Ql/Qc*np.exp(1j*phi)
+    D = 1 + 2j*Ql*(x/fr-1)
+    return 1 - g/D,g,D
+
+def resonance_jac(p,x,k):
+    '''Derivatives of s with respect to fr, Ql, Qc and phi, as columns.'''
+    fr,Ql,Qc = p[0],p[1],p[2]
+    s,g,D = resonance(p,x,k)
+    dfr = -2j*Ql*x/fr**2 * g/D**2
+    dQl = -(g/Ql)/D + g*2j*(x/fr-1)/D**2
+    dQc = (g/Qc)/D
+    dphi = -1j*g/D
+    return s,np.column_stack((dfr,dQl,dQc,dphi))
+
+def complex_func(p,x,k):
+    return p[4]*np.exp(1j*p[5])*resonance(p,x,k)[0]
+
+def complex_jac(p,x,k):
+    A = p[4]*np.exp(1j*p[5])
+    s,J = resonance_jac(p,x,k)
+    return np.column_stack((A*J, np.exp(1j*p[5])*s, 1j*A*s))
+
+def db_func(p,x,k):
+    return p[4] + db_scale*np.log(np.abs(resonance(p,x,k)[0]))
+
+def db_jac(p,x,k):
+    s,J = resonance_jac(p,x,k)
+    return np.column_stack((db_scale*np.real(J/s[:,None]), np.ones(len(s))))
+
+def peak_width(x,y,smooth=True):
+    '''Position and full width at half maximum of the most prominent peak of y (x evenly spaced 
+    or not).
+    With smooth, y is first smoothed with a Gaussian of about 1/8 of the peak width, found 
+    iteratively starting from a strong smoothing, so that noise spikes do not take the place 
+    of a shallow peak.'''
+    sigma = max(len(y)/50.,1.) if smooth else 0.
+    for it in range(8):
+        ys = ndimage.gaussian_filter1d(y,sigma,mode='nearest') if sigma else y
+        peaks,props = signal.find_peaks(ys,prominence=0)
+        i = int(peaks[np.argmax(props['prominences'])]) if len(peaks) else int(np.argmax(ys))
+        w,h,left,right = signal.peak_widths(ys,[i],rel_height=0.5)
+        if not smooth or abs(max(w[0]/8,1.)-sigma) < 0.25*sigma:
+            break
+        sigma = max(w[0]/8,1.)
+    idx = np.arange(len(x))
+    return x[i],abs(np.interp(right[0],idx,x)-np.interp(left[0],idx,x))
+
+def circle_fit(z):
+    '''Algebraic (Kasa) least-squares circle through the complex points z: (center, radius).'''
+    A = np.column_stack((z.real,z.imag,np.ones(len(z))))
+    b = -(z.real**2 + z.imag**2)
+    c = np.linalg.lstsq(A,b,rcond=None)[0]
+    zc = -(c[0]+1j*c[1])/2
+    return zc,np.sqrt(np.abs(zc)**2 - c[2])
+
+def edge_mean(y,nedge=None):
+    '''Mean of the first and last points of y (5% of the trace on each side by default).'''
+    nedge = max(1,len(y)//20) if nedge is None else nedge
+    return np.mean(np.concatenate((y[:nedge],y[-nedge:])))
+
+def lorentzian_guess(x,y):
+    offset = edge_mean(y)
+    sign = 1. if np.max(y-offset) > np.max(offset-y) else -1.
+    f0,fwhm = peak_width(x,sign*(y-offset))
+    amp = y[np.argmin(np.abs(x-f0))] - offset
+    return np.array([f0,fwhm,offset,amp])
+
+def complex_guess(x,y,k):
+    '''Environment from the trace edges (a, alpha), coupling and asymmetry from a circle fit of
+    the normalized trace, fr and Ql from the position and width of the dip of |1-s|^2.'''
+    env = edge_mean(y)
+    s = y/env
+    zc,r = circle_fit(s)
+    fr,fwhm = peak_width(x,np.abs(1-s)**2)
+    Ql = fr/fwhm
+    ratio = 2*np.abs(1-zc) # = k*Ql/|Qc|, diameter of the circle through 1
+    return np.array([fr,Ql,k*Ql/ratio,np.angle(1-zc),np.abs(env),np.angle(env)])
+
+def db_guess(x,y,k):
+    '''Magnitude-only version of complex_guess (phi = 0, under-coupled).'''
+    a = edge_mean(y)
+    mag2 = 10**((y-a)/10)
+    fr,fwhm = peak_width(x,1-mag2)
+    Ql = fr/fwhm
+    ratio = min(max(1-np.sqrt(np.min(mag2)),1e-3),0.999*k)
+    return np.array([fr,Ql,k*Ql/ratio,0.,a])
+
+
+##############################################################################
+# Classes
+##############################################################################
+class model(object):
+    '''Fit model: model(p,x) evaluates it, model.jac(p,x) returns the (len(x),len(p)) Jacobian
+    and model.guess(x,y) the initial parameters. The parameters with index in 'positive' (widths,
+    Ql) enter the model through their absolute value, so a fit cannot end on a negative one;
+    canonical(p) folds them and valid(p,x) checks a fit result. Instances are picklable and can
+    be used with the process pool of DataModule.fit_batch.'''
+    def __init__(self,name,params,func,jac,guess,k=None,positive=()):
+        self.name = name
+        self.params = params
+        self.f = func
+        self.j = jac
+        self.g = guess
+        self.k = k
+        self.positive = list(positive)
+
+    def __call__(self,p,x):
+        p = self.canonical(p)
+        return self.f(p,x) if self.k is None else self.f(p,x,self.k)
+
+    def jac(self,p,x):
+        J = self.j(self.canonical(p),x) if self.k is None else self.j(self.canonical(p),x,self.k)
+        J[:,self.positive] *= np.where(np.asarray(p)[self.positive] < 0,-1,1)
+        return J
+
+    def canonical(self,p):
+        p = np.array(p,dtype='float')
+        p[self.positive] = np.abs(p[self.positive])
+        return p
+
+    def valid(self,p,x):
+        '''Finite parameters, non-zero 'positive' ones and the resonance within the x range.'''
+        return bool(np.all(np.isfinite(p)) and np.all(p[self.positive] != 0) and np.min(x) <= p[0] <= np.max(x))
+
+    def guess(self,x,y):
+        x = np.asarray(x,dtype='float')
+        return self.g(x,np.asarray(y)) if self.k is None else self.g(x,np.asarray(y),self.k)
+
+    def __repr__(self):
+        return 'model(%s: %s)' % (self.name,', '.join(self.params))
+
+
+def qint(p):
+    '''Internal quality factor(s) from fitted notch/reflection parameters (rows of p).'''
+    p = np.asarray(p)
+    return 1/(1/p[...,1] - np.cos(p[...,3])/p[...,2])
+
+
+lorentzian = model('lorentzian',['f0','fwhm','offset','amplitude'],lorentzian_func,lorentzian_jac,lorentzian_guess,positive=[1])
+notch = model('notch',['fr','Ql','Qc','phi','a','alpha'],complex_func,complex_jac,complex_guess,k=1,positive=[1])
+reflection = model('reflection',['fr','Ql','Qc','phi','a','alpha'],complex_func,complex_jac,complex_guess,k=2,positive=[1])
+notch_db = model('notch_db',['fr','Ql','Qc','phi','a_dB'],db_func,db_jac,db_guess,k=1,positive=[1])
+reflection_db = model('reflection_db',['fr','Ql','Qc','phi','a_dB'],db_func,db_jac,db_guess,k=2,positive=[1])
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 10:12:31 2026
+
+@author: Seyed Iman Mirzaei
+
+Command handling shared by the VNA drivers (N5232A, E5071C): batching of SCPI commands into
+one program message, the optional instrument state cache and segmented scans. A driver derives
+its VNA class from VNAbase, calls init_cache in its constructor and provides
+    send(msg)          writes one program message (without terminator) to the instrument
+    query(str1)        sends str1+'?' (after flush()) and returns the response
+    collect_single     measures one trace (used by configure/collect_scan)
+and the setters used by configure (IFBW, freq_npoints, freq_start, ...).
+"""
+
+import numpy as np
+import DataModule as dm
+from contextlib import contextmanager
+
+
+###############################################################################################
+# Constants
+
+# one row per segment of collect_scan
+scan_segment_dtype = [('start','i8'),('stop','i8'),('f_start','f8'),('f_stop','f8'),('npoints','i8'),
+                      ('navg','i8'),('power','f8'),('wait','f8'),('BW','f8')]
+
+# commands after which the instrument state (settings and transfer format) is unknown
+state_resets = ('*RST','*RCL','SYST:PRES','SYSTEM:PRES')
+###############################################################################################
+
+
+def join_commands(cmds):
+    '''Joins SCPI commands into a single ';'-separated program message. Every command
+    after the first is rooted with ':' so that it does not inherit the previous path.'''
+    out = []
+    for c in cmds:
+        c = c.strip()
+        if out and not c.startswith((':','*')):
+            c = ':'+c
+        out.append(c)
+    return ';'.join(out)
+
+def related_settings(str1):
+    '''Returns the settings that the instrument changes as a side effect of writing str1:
+    start/stop move center/span of the same channel and vice versa.'''
+    pairs = {':FREQuency:STARt':(':FREQuency:CENTer',':FREQuency:SPAN'),
+             ':FREQuency:STOP':(':FREQuency:CENTer',':FREQuency:SPAN'),
+             ':FREQuency:CENTer':(':FREQuency:STARt',':FREQuency:STOP'),
+             ':FREQuency:SPAN':(':FREQuency:STARt',':FREQuency:STOP')}
+    for key in pairs:
+        if str1.endswith(key):
+            return [str1[:-len(key)]+other for other in pairs[key]]
+    return []
+
+def same_value(old,new):
+    '''Compares a cached setting with a new one, numerically when both parse as numbers.'''
+    if old is None:
+        return False
+    try:
+        return float(old) == float(new)
+    except ValueError:
+        return str(old).strip().upper() == str(new).strip().upper()
+
+
+class VNAbase(object):
+    def init_cache(self,cache=False):
+        # commands queued by batch(), None when not batching
+        self.pending = None
+        # set by batch(), None follows cache
+        self.skip_unchanged = None
+        # last value written to (or, with cache, read from) each setting through cmd_query
+        self.shadow = {}
+        # with cache, getters are answered from the shadow and unchanged writes are suppressed
+        self.cache = cache
+        self.cache_stats = {'hits':0,'misses':0,'suppressed':0}
+
+    def cmd(self,str1,arg):
+        msg = ''.join([str(str1),' ',str(arg)])
+        if self.pending is not None:
+            self.pending.append(msg)
+        else:
+            self.send(msg)
+        if msg.lstrip(':').upper().startswith(state_resets):
+            # after the reset, which would undo the settings sent again by refresh
+            self.refresh()
+
+    def flush(self):
+        '''Sends the commands queued by batch() as one program message.'''
+        if self.pending:
+            msg = join_commands(self.pending)
+            self.pending = []
+            self.send(msg)
+
+    @contextmanager
+    def batch(self,skip_unchanged=None):
+        '''Coalesces the commands issued inside the block into a single ';'-joined message,
+        sent on the first query or when the block exits. With skip_unchanged, settings that
+        already hold the value last written by this object are not sent again. The default
+        (None) skips them only when the state cache is on, False always sends them.
+
+        with vna.batch():
+            vna.IFBW(1e3)
+            vna.power(-50)
+        '''
+        if self.pending is not None: # nested batch, the outer one flushes
+            yield self
+            return
+        self.pending = []
+        self.skip_unchanged = skip_unchanged
+        try:
+            yield self
+        finally:
+            self.flush()
+            self.pending = None
+            self.skip_unchanged = None
+
+    def shadow_store(self,str1,value):
+        for key in related_settings(str1):
+            self.shadow.pop(key,None)
+        self.shadow[str1] = value
+
+    def cmd_only(self,str1,arg):
+        if arg == '?':
+            raise ValueError('No queries allowed. This is only a command.')
+        else:
+            self.cmd(str1,arg)
+
+    def query_only(self,str1,arg='?'):
+        if arg == '?':
+            return (self.query(str1))
+        else:
+            raise ValueError('No arguments allowed. This is only a query.')
+
+    def cmd_query(self,str1,arg='?'):
+        if arg == '?':
+            if not self.cache:
+                return self.query(str1)
+            if str1 in self.shadow:
+                self.cache_stats['hits'] += 1
+                return self.shadow[str1]
+            self.cache_stats['misses'] += 1
+            self.shadow[str1] = self.query(str1)
+            return self.shadow[str1]
+        else:
+            skip = self.cache if self.skip_unchanged is None else self.skip_unchanged
+            if skip and same_value(self.shadow.get(str1),arg):
+                self.cache_stats['suppressed'] += 1
+                return
+            self.cmd(str1,arg)
+            self.shadow_store(str1,str(arg))
+
+    def refresh(self):
+        '''Forgets the cached instrument state, the next getters go to the instrument again.
+        The transfer format the driver reads data in is sent again (restore_transfer), also 
+        when the instrument was reset from elsewhere.'''
+        self.shadow = {}
+        self.restore_transfer()
+
+    def restore_transfer(self):
+        '''Sends the data transfer settings of the driver again. Nothing to do for drivers that 
+        read the instrument's default format (ASCII).'''
+        pass
+
+    def reset(self):
+        '''Resets the instrument (*RST).'''
+        self.cmd('*RST','')
+
+    def configure(self,f_range,npoints=1601,navg=999,power=-50,BW=1e3):
+        '''Sets up the sweep (one message) and restarts averaging, see collect_single.'''
+        with self.batch():
+            self.IFBW(BW)
+            self.freq_npoints(npoints)
+            self.freq_start(f_range[0])
+            self.freq_stop(f_range[1])
+            self.power(power)
+            if (navg==0):
+                self.average_state(0)
+            else:
+                self.average_state(1)
+                self.average_count(navg)
+
+            self.average_reset()
+
+    def collect_scan(self,f_range_mat,npoints_v=[1601],navg_v = [999],power_v=[-50],wait_v=[1],BW_v=[1e3],views=False,callback=None,**single):
+        '''Measures the frequency ranges in the rows of f_range_mat one after the other and
+        returns them as one data_2d. The *_v settings hold either one value for all segments
+        or one value per segment. The output arrays are allocated once for the total number
+        of points and every segment is written in place.
+        The returned object carries a 'segments' table with one row per segment (start and
+        stop index, f_start, f_stop, npoints, navg, power, wait, BW). With views=True a list
+        of (x,y) views into the output, one per segment, is returned as well.
+        callback(i,x,y) is called with every segment as soon as it is measured, e.g.
+        DataModule.minfinder.callback or a live plot. Further keyword arguments go to
+        collect_single.'''
+        range_mat = np.array(f_range_mat,dtype='float')
+        len_loop = len(range_mat[:,0])
+
+        def vector_handling(vector):
+            if len(vector) == 1:
+                out = vector[0]*np.ones(len_loop)
+            else:
+                out = np.asarray(vector,dtype='float')
+            return out
+
+        npoints = vector_handling(npoints_v).astype(int)
+        navg = vector_handling(navg_v).astype(int)
+        power = vector_handling(power_v)
+        wait = vector_handling(wait_v)
+        BW = vector_handling(BW_v)
+
+        segments = np.zeros(len_loop,dtype=scan_segment_dtype)
+        segments['stop'] = np.cumsum(npoints)
+        segments['start'] = segments['stop'] - npoints
+        segments['f_start'] = range_mat[:,0]
+        segments['f_stop'] = range_mat[:,1]
+        segments['npoints'] = npoints
+        segments['navg'] = navg
+        segments['power'] = power
+        segments['wait'] = wait
+        segments['BW'] = BW
+
+        x = np.empty(segments['stop'][-1])
+        y = np.empty(segments['stop'][-1])
+        for i in np.arange(len_loop):
+            dat_tmp = self.collect_single(range_mat[i,:],npoints=npoints[i],navg=navg[i],power=power[i],wait=wait[i],BW=BW[i],**single)
+            if len(dat_tmp.x) != npoints[i]:
+                raise ValueError('Segment '+str(i)+' returned '+str(len(dat_tmp.x))+' points instead of '+str(npoints[i])+'.')
+            x[segments['start'][i]:segments['stop'][i]] = dat_tmp.x
+            y[segments['start'][i]:segments['stop'][i]] = dat_tmp.y
+            if callback is not None:
+                callback(i,x[segments['start'][i]:segments['stop'][i]],y[segments['start'][i]:segments['stop'][i]])
+
+        dat = dm.data_2d()
+        dat.load_var(x,y)
+        dat.segments = segments
+        if views:
+            return dat,[(x[a:b],y[a:b]) for a,b in zip(segments['start'],segments['stop'])]
+        return dat
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Cold import time of the instrument modules, each measured in a fresh interpreter. Fails
+(exit code 1) when a module takes longer than the budget, loads matplotlib, scipy or vxi11
+at import time, or does not import at all (e.g. because it opens a connection).
+
+    python benchmarks/bench_import.py [budget_seconds]
+"""
+
+import os
+import subprocess
+import sys
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+modules = ['DataModule', 'VNAModule', 'N5232A', 'E5071C', 'APSIN20G', 'E5173B', 'ExperimentModule']
+heavy = ['matplotlib', 'scipy', 'vxi11']
+
+probe = '''
+import sys, time
+t = time.perf_counter()
+import numpy
+t_np = time.perf_counter() - t
+t = time.perf_counter()
+import %s
+dt = time.perf_counter() - t
+print(t_np, dt, 'loaded=' + ','.join(m for m in %r if m in sys.modules))
+'''
+
+
+def measure(name):
+    out = subprocess.run([sys.executable, '-c', probe % (name, heavy)], cwd=root, capture_output=True,
+                         text=True, timeout=60)
+    if out.returncode != 0:
+        return None, None, out.stderr.strip().splitlines()[-1]
+    t_np, dt, loaded = out.stdout.strip().splitlines()[-1].split()
+    return float(t_np), float(dt), loaded[len('loaded='):]
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    failed = False
+    print('%-18s %10s %10s  %s' % ('module', 'numpy [s]', 'module [s]', 'heavy modules loaded'))
+    for name in modules:
+        t_np, dt, loaded = measure(name)
+        if dt is None:
+            print('%-18s import failed: %s' % (name, loaded))
+            failed = True
+            continue
+        print('%-18s %10.3f %10.3f  %s' % (name, t_np, dt, loaded or '-'))
+        failed |= dt > budget or bool(loaded)
+    print('budget %.3f s: %s' % (budget, 'FAILED' if failed else 'ok'))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
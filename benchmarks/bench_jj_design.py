@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Inverse design with JJObject.design: solves RnUnit, Area, N and Cs for a batch of target
+specifications (F0, Ej/Ec, L_array, first loaded mode) and checks the result with the
+forward model.
+
+    python benchmarks/bench_jj_design.py [nspecs]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import JJObject as jj
+
+Tc, T, CjUnit, Cground = 1.23, 20e-3, 50e-3, 30e-18
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = np.random.default_rng(0)
+    F0 = rng.uniform(15e9, 25e9, n)
+    EjEc = rng.uniform(50, 200, n)
+    Larray = rng.uniform(20e-9, 100e-9, n)
+    f1 = rng.uniform(1e9, 3e9, n)
+
+    t = time.perf_counter()
+    d = jj.design(Tc, T, CjUnit, Cground, F0=F0, EjEc=EjEc, Larray=Larray, f1=f1)
+    dt = time.perf_counter() - t
+    ok = np.isfinite(d['Cs'])
+    print('%d specs in %.4f s (%.0f specs/s), %d without a Cs solution' % (n, dt, n/dt, n - ok.sum()))
+
+    # forward check
+    j = jj.junction(Tc, T, d['Area'], d['RnUnit'], CjUnit, Cground)
+    print('F0      max rel. error %.1e' % np.max(np.abs(j.F0/F0-1)))
+    print('Ej/Ec   max rel. error %.1e' % np.max(np.abs(j.Ej/j.Ec/EjEc-1)))
+    print('L_array max rel. error %.1e (N rounded)' % np.max(np.abs(d['N']*j.Lj/Larray-1)))
+    m = min(n, 1000)
+    sub = jj.junction(Tc, T, d['Area'][:m], d['RnUnit'][:m], CjUnit, Cground)
+    t = time.perf_counter()
+    first = jj.array(sub, np.where(ok[:m], d['Cs'][:m], 1e-15), d['N'][:m]).loadedModes[..., 0]
+    dt = time.perf_counter() - t
+    print('f1      max rel. error %.1e (forward solve of %d arrays: %.3f s)'
+          % (np.max(np.abs(first[ok[:m]]/f1[:m][ok[:m]]-1)), m, dt))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps with JJObject: one object per grid point (loop) against a single object
+built on a broadcast grid (JJObject.grid).
+
+    python benchmarks/bench_jj_grid.py [npoints_per_axis]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import JJObject as jj
+
+Tc, RnUnit, CjUnit, Cground = 1.23, 1300e-12, 50e-3, 30e-18
+
+
+def timed(func):
+    t = time.perf_counter()
+    out = func()
+    return time.perf_counter() - t, out
+
+
+def report(name, t_loop, t_vec, err):
+    print('%-34s loop %8.3f s   grid %8.4f s   x%7.0f   max rel. diff %.1e' % (name, t_loop, t_vec, t_loop/t_vec, err))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    areas = np.linspace(1e-13, 1e-12, n)
+    temps = np.linspace(10e-3, 300e-3, n)
+    Ns = np.arange(10, 10+n)
+
+    # plasma frequency over Area x T
+    t_loop, F0_loop = timed(lambda: np.array([[jj.junction(Tc, T, A, RnUnit, CjUnit, Cground).F0 for T in temps] for A in areas]))
+    def vec():
+        A, T = jj.grid(areas, temps)
+        return jj.junction(Tc, T, A, RnUnit, CjUnit, Cground).F0
+    t_vec, F0_vec = timed(vec)
+    report('F0 (Area x T)', t_loop, t_vec, np.max(np.abs(F0_vec/F0_loop-1)))
+
+    # slip rate over N x Area (Ej/Ec follows the area)
+    def loop():
+        return np.array([[jj.array(jj.junction(Tc, 20e-3, A, RnUnit, CjUnit, Cground), 30e-15, N).slipRate
+                          for A in areas] for N in Ns])
+    t_loop, sr_loop = timed(loop)
+    def vec():
+        N, A = jj.grid(Ns, areas)
+        return jj.array(jj.junction(Tc, 20e-3, A, RnUnit, CjUnit, Cground), 30e-15, N).slipRate
+    t_vec, sr_vec = timed(vec)
+    report('slip rate (N x Area)', t_loop, t_vec, np.max(np.abs(sr_vec/sr_loop-1)))
+
+    # mode spectra over N x Cs
+    m = max(n//10, 2)
+    Cs = np.linspace(10e-15, 50e-15, m)
+    j = jj.junction(Tc, 20e-3, 4e-13, RnUnit, CjUnit, Cground)
+    t_loop, first_loop = timed(lambda: np.array([[jj.array(j, c, N).loadedModes[0] for c in Cs] for N in Ns[:m]]))
+    def vec():
+        N, C = jj.grid(Ns[:m], Cs)
+        return jj.array(j, C, N).loadedModes[..., 0]
+    t_vec, first_vec = timed(vec)
+    report('first loaded mode (N x Cs)', t_loop, t_vec, np.max(np.abs(first_vec/first_loop-1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Monte-Carlo fabrication spread with JJObject.fabricationSpread: one junction object per
+junction and one eigenproblem per realization (loop) against batched realizations, in this
+process and in a process pool. Checks that the pool gives the same statistics for the same
+seed.
+
+    python benchmarks/bench_jj_spread.py [samples] [N]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import scipy.linalg
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import JJObject as jj
+
+Tc, T, Area, RnUnit, CjUnit, Cground = 1.23, 20e-3, 4e-13, 1300e-12, 50e-3, 30e-18
+sA, sR = 0.03, 0.05
+
+
+def loop(samples, N, nmodes, seed):
+    rng = np.random.default_rng(seed)
+    slip, modes = [], []
+    for k in range(samples):
+        js = [jj.junction(Tc, T, Area*(1+sA*rng.standard_normal()), RnUnit*(1+sR*rng.standard_normal()),
+                          CjUnit, Cground) for i in range(N)]
+        arr = jj.array(js[0], 0., N)
+        slip.append(sum(arr.calcSlipRate(j.Ej, j.Ec, 1) for j in js))
+        g = np.array([1/j.Lj for j in js])
+        c = np.array([j.Cj for j in js])
+        K = np.diag(g[:-1]+g[1:]) - np.diag(g[1:-1], 1) - np.diag(g[1:-1], -1)
+        C = np.diag(c[:-1]+c[1:]+Cground) - np.diag(c[1:-1], 1) - np.diag(c[1:-1], -1)
+        modes.append(np.sqrt(scipy.linalg.eigh(K, C, eigvals_only=True)[:nmodes])/(2*np.pi))
+    return np.array(slip), np.array(modes)
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    N = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    j = jj.junction(Tc, T, Area, RnUnit, CjUnit, Cground)
+
+    m = max(samples//20, 1)
+    t = time.perf_counter()
+    slip, modes = loop(m, N, 10, 0)
+    t_loop = (time.perf_counter() - t)/m
+    print('loop                %8.0f realizations/s' % (1/t_loop))
+
+    results = {}
+    for processes in (1, max(os.cpu_count() or 1, 2)):
+        mc = jj.fabricationSpread(j, N, sA, sR)
+        t = time.perf_counter()
+        results[processes] = mc.run(samples, seed=1, processes=processes)
+        dt = time.perf_counter() - t
+        print('batched, %2d process %8.0f realizations/s   x%5.1f' % (processes, samples/dt, t_loop*samples/dt))
+    a, b = results[1], results[max(os.cpu_count() or 1, 2)]
+    same = all(np.array_equal(a[k].mean, b[k].mean) and np.array_equal(a[k].hist, b[k].hist) for k in a)
+    print('same statistics for any number of processes: %s' % same)
+    print('slip rate mean: loop %.3e  batched %.3e (+- %.1e)' % (slip.mean(), a['slipRate'].mean, a['slipRate'].std/np.sqrt(samples)))
+    print('mode 1 mean:    loop %.4e  batched %.4e (+- %.1e)' % (modes[:, 0].mean(), a['modes'].mean[0], a['modes'].std[0]/np.sqrt(samples)))
+    mc.spreadInfo()
+
+
+if __name__ == '__main__':
+    main()
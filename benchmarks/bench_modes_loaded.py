@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Compares JJObject.array.calcModesLoaded (all modes in one vectorized bracketed solve) with
+the former loop of one scipy.optimize.ridder call per mode.
+
+    python benchmarks/bench_modes_loaded.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import scipy.optimize as opt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import JJObject as jj
+
+
+def modes_loaded_loop(f0, n_vec, N, C_j, C_0, C_s, E_c, E_j, unloadedModes):
+    # JJObject.array.calcModesLoaded before vectorisation
+    sol = np.array([])
+    eps = 1e2
+    for n in n_vec:
+        if n % 2 == 0:
+            eq = lambda omega_l: -1020.0*np.sqrt(2)*C_s*omega_l*np.sqrt(E_c/(E_j*(-np.cos(np.pi*n/N) + 1)*(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1))) - np.tan(np.pi*n*omega_l/(2*f0*np.sqrt((-np.cos(np.pi*n/N) + 1)/(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1))))
+            sol = np.append(sol, opt.ridder(eq, unloadedModes[int(n)-1]*(1-1/n)+eps, unloadedModes[int(n)-1]-eps))
+        else:
+            eq = lambda omega_l: -np.tan(np.pi*n*omega_l/(2*f0*np.sqrt((-np.cos(np.pi*n/N) + 1)/(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1)))) + 0.000490196078431373*np.sqrt(2)/(C_s*omega_l*np.sqrt(E_c/(E_j*(-np.cos(np.pi*n/N) + 1)*(C_0/(2*C_j) - np.cos(np.pi*n/N) + 1))))
+            if n == 1:
+                sol = np.append(sol, opt.ridder(eq, eps, unloadedModes[int(n)-1]-eps))
+            else:
+                sol = np.append(sol, opt.ridder(eq, unloadedModes[int(n)-1]*(1-2/n)+eps, unloadedModes[int(n)-1]-eps))
+    return sol
+
+
+def main():
+    j = jj.junction(1.23, 20e-3, 4e-13, 1300e-12, 50e-3, 30e-18)
+    Cs = 30e-15
+    print('%8s %8s %12s %12s %8s %14s' % ('N', 'modes', 'ridder [s]', 'vector [s]', 'speedup', 'max rel. diff'))
+    for N in (100, 1000, 3000, 10000):
+        a = jj.array(j, Cs, N)
+        n = np.arange(1, np.floor(N/2))
+        args = (j.F0, n, N, j.Cj, j.Cground, Cs, j.Ec, j.Ej, a.unloadedModes)
+        t = time.perf_counter()
+        ref = modes_loaded_loop(*args)
+        t_loop = time.perf_counter() - t
+        t = time.perf_counter()
+        new = a.calcModesLoaded(*args)
+        t_vec = time.perf_counter() - t
+        print('%8d %8d %12.4f %12.4f %8.0f %14.1e' % (N, len(n), t_loop, t_vec, t_loop/t_vec, np.max(np.abs(new/ref-1))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Fits of synthetic notch resonances: the former path (hand-written model, generic start
+values, finite-difference Jacobian) against ResonatorModule.notch (analytic Jacobian and
+circle-fit initial guess). Reports function evaluations and wall time per fit, and the
+accuracy of the converged fits for deep and for shallow (Qc >> Ql) dips.
+
+    python benchmarks/bench_resonator_fit.py [ntraces]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import DataModule as dm
+import ResonatorModule as rm
+
+
+def notch_plain(p, x):
+    # what a user writes for data_2d.fit without the model library
+    return p[4]*np.exp(1j*p[5])*(1 - p[1]/p[2]*np.exp(1j*p[3])/(1 + 2j*p[1]*(x/p[0]-1)))
+
+
+def traces(ntraces, npoints=1601, noise=0.01, seed=0, Qc=(2e4, 8e4)):
+    rng = np.random.default_rng(seed)
+    x = np.linspace(6.998e9, 7.002e9, npoints)
+    p = np.column_stack((rng.uniform(6.9995e9, 7.0005e9, ntraces), rng.uniform(1e4, 5e4, ntraces),
+                         rng.uniform(Qc[0], Qc[1], ntraces), rng.uniform(-0.5, 0.5, ntraces),
+                         rng.uniform(0.5, 1.5, ntraces), rng.uniform(-np.pi, np.pi, ntraces)))
+    Y = np.array([rm.notch(pi, x) for pi in p])
+    Y += noise*(rng.standard_normal(Y.shape) + 1j*rng.standard_normal(Y.shape))
+    return x, p, Y
+
+
+def run(name, fits):
+    t = time.perf_counter()
+    out = [f() for f in fits]
+    dt = time.perf_counter() - t
+    nfev = np.array([o[3] for o in out])
+    ok = np.array([o[4] for o in out])
+    print('%-34s %8.2f ms/fit  %6.1f nfev/fit  %3d/%d converged' % (name, 1e3*dt/len(fits), nfev.mean(), ok.sum(), len(ok)))
+    return np.array([o[0] for o in out]), ok
+
+
+def accuracy(p, pf, ok):
+    e = np.abs(pf[ok]/p[ok]-1)
+    print('converged fits: max relative error of fr %.2e, of Ql %.2e, negative Ql: %d'
+          % (e[:, 0].max(), e[:, 1].max(), np.sum(pf[:, 1] <= 0)))
+
+
+def main():
+    ntraces = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    x, p, Y = traces(ntraces)
+    p_generic = [x.mean(), 1e4, 1e4, 0., 1., 0.]
+
+    run('finite differences, generic start', [lambda y=y: dm.fit_trace(notch_plain, p_generic, x, y) for y in Y])
+    run('finite differences, model guess', [lambda y=y: dm.fit_trace(notch_plain, rm.notch.guess(x, y), x, y) for y in Y])
+    pf, ok = run('analytic Jacobian, model guess', [lambda y=y: dm.fit_trace(rm.notch, None, x, y) for y in Y])
+    accuracy(p, pf, ok)
+
+    xs, ps, Ys = traces(ntraces, seed=1, Qc=(1e5, 5e5))
+    pf, ok = run('shallow dips, model guess', [lambda y=y: dm.fit_trace(rm.notch, None, xs, y) for y in Ys])
+    accuracy(ps, pf, ok)
+
+    t = time.perf_counter()
+    dm.fit_batch(rm.notch, None, x, Y, warm_start=False, processes=1)  # unrelated traces
+    print('%-34s %8.2f ms/fit' % ('fit_batch (guess per row)', 1e3*(time.perf_counter()-t)/ntraces))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Compares DataModule.smooth / smooth_vec with the former per-point loops.
+
+    python benchmarks/bench_smooth.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import DataModule as dm
+
+
+def smooth_loop(x, y, nnb):
+    # DataModule.smooth before vectorisation
+    def lo_lim(i):
+        return i if i > 0 else 0
+    def hi_lim(i):
+        return i+1 if i < len(x)-1 else len(x)
+    yy = np.zeros(np.shape(y))
+    for i in np.arange(len(x)):
+        msk = np.arange(lo_lim(i-nnb), hi_lim(i+nnb))
+        yy[i] = np.mean(y[msk])
+    return yy
+
+
+def smooth_vec_loop(x, y, nnb):
+    # DataModule.smooth_vec before vectorisation
+    def lo_lim(i):
+        return i if i > 0 else 0
+    def hi_lim(i):
+        return i+1 if i < len(x)-1 else len(x)
+    yy = np.zeros(np.shape(y))
+    for i in np.arange(len(x)):
+        msk = np.arange(lo_lim(i-nnb), hi_lim(i+nnb))
+        yy[:, i] = np.mean(y[:, msk], axis=1)
+    return yy
+
+
+def timed(func, *args):
+    t = time.perf_counter()
+    out = func(*args)
+    return time.perf_counter() - t, out
+
+
+if __name__ == '__main__':
+    print('1-D smooth')
+    for n in [1601, 16001, 160001]:
+        for nnb in [2, 10, 100]:
+            x = np.arange(n)
+            y = np.random.randn(n)
+            t_old, y_old = timed(smooth_loop, x, y, nnb)
+            t_new, y_new = timed(dm.smooth, x, y, nnb)
+            assert np.allclose(y_old, y_new)
+            print('n = %7d  nnb = %4d   loop: %9.2f ms   vectorized: %7.2f ms   speedup: %7.1f x'
+                  % (n, nnb, 1e3*t_old, 1e3*t_new, t_old/t_new))
+
+    print('2-D smooth_vec (rows x columns)')
+    for shape in [(200, 1601), (2000, 1601)]:
+        for nnb in [2, 10]:
+            z = np.random.randn(*shape)
+            x = np.arange(shape[1])
+            t_old, z_old = timed(smooth_vec_loop, x, z, nnb)
+            t_new, z_new = timed(dm.smooth_vec, x, z, nnb)
+            assert np.allclose(z_old, z_new)
+            print('%12s  nnb = %4d   loop: %9.2f ms   vectorized: %7.2f ms   speedup: %7.1f x'
+                  % (shape, nnb, 1e3*t_old, 1e3*t_new, t_old/t_new))
+
+    print('kernels / edge modes, 2000 x 1601, nnb = 10')
+    z = np.random.randn(2000, 1601)
+    for kernel in ['box', 'gaussian', 'savgol']:
+        for mode in ['shrink', 'reflect', 'nearest', 'valid']:
+            t, out = timed(dm.smooth_window, z, 10, -1, mode, kernel)
+            print('%9s %8s  %7.2f ms  %s' % (kernel, mode, 1e3*t, out.shape))
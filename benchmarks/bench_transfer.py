@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Compares ASCII and binary block trace transfers of N5232A.VNA against the local
+fake instrument.
+
+    python benchmarks/bench_transfer.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import N5232A
+from fake_n5232a import FakeN5232A
+
+
+def bench(vna, nrep):
+    t = []
+    for i in range(nrep):
+        t0 = time.perf_counter()
+        y = np.asarray(vna.trace_read(), dtype='float')
+        t.append(time.perf_counter() - t0)
+    return np.median(t), len(y)
+
+
+if __name__ == '__main__':
+    for npoints in [1601, 10001, 100001]:
+        srv = FakeN5232A(npoints=npoints).start()
+        vna = N5232A.VNA('127.0.0.1', srv.port)
+        t_ascii, n = bench(vna, 3)
+        for bits in [32, 64]:
+            vna.binary_mode(bits)
+            t_bin, n_bin = bench(vna, 10)
+            assert n_bin == n
+            print('npoints = %6d   ASCII: %8.2f ms   REAL,%d: %8.2f ms   speedup: %6.1f x'
+                  % (n, 1e3*t_ascii, bits, 1e3*t_bin, t_ascii/t_bin))
+        vna.close()
+        srv.stop()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Local fake N5232A: a tiny SCPI socket server that answers the commands used by
+N5232A.VNA, so transfers can be exercised and benchmarked without an instrument.
+
+    srv = FakeN5232A(npoints=1601)
+    srv.start()
+    vna = N5232A.VNA('127.0.0.1', srv.port)
+    ...
+    srv.stop()
+"""
+
+import re
+import socket
+import threading
+import numpy as np
+
+
+def short_form(header):
+    '''Reduces a SCPI header to its short form, e.g. ":SENSe1:SWEep:POINts" -> "SENS1:SWE:POIN".'''
+    nodes = []
+    for node in header.strip().lstrip(':').split(':'):
+        m = re.match(r'([A-Z*]*)[a-z]*(\d*)', node)
+        nodes.append(m.group(1)+m.group(2) if m.group(1) else node.upper())
+    return ':'.join(nodes)
+
+
+class FakeN5232A(object):
+    def __init__(self, npoints=1601, f_range=(4e9, 8e9), port=0):
+        self.state = {'SENS:SWE:POIN': str(npoints),
+                      'SENS:FREQ:STAR': str(f_range[0]), 'SENS:FREQ:STOP': str(f_range[1])}
+        # every program message received, as sent (before splitting at ';')
+        self.log = []
+        self.reset()
+        self.srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.srv.bind(('127.0.0.1', port))
+        self.srv.listen(1)
+        self.port = self.srv.getsockname()[1]
+        self.thread = None
+        
+    def reset(self):
+        self.state.update({'FORM:DATA': 'ASC,+0', 'FORM:BORD': 'NORM', 'SENS:SWE:MODE': 'CONT'})
+        
+    def start(self):
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self
+        
+    def stop(self):
+        self.srv.close()
+    
+    def serve(self):
+        while True:
+            try:
+                conn, addr = self.srv.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+    
+    def handle(self, conn):
+        buf = b''
+        with conn:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                buf += data
+                while b'\n' in buf:
+                    line, buf = buf.split(b'\n', 1)
+                    self.log.append(line.decode())
+                    for msg in line.decode().split(';'):
+                        reply = self.respond(msg.strip())
+                        if reply is not None:
+                            conn.sendall(reply)
+    
+    # data generation
+    def npoints(self):
+        return int(float(self.state['SENS:SWE:POIN']))
+    
+    def xaxis(self):
+        return np.linspace(float(self.state['SENS:FREQ:STAR']), float(self.state['SENS:FREQ:STOP']), self.npoints())
+    
+    def trace(self):
+        x = self.xaxis()
+        f0 = x.mean()
+        return -20*np.log10(np.abs(1 - 0.9/(1 + 2j*1e4*(x - f0)/f0))) + 1e-3*np.random.randn(len(x))
+    
+    def encode(self, values):
+        fmt = self.state['FORM:DATA'].upper()
+        if fmt.startswith('REAL'):
+            bits = 32 if '32' in fmt else 64
+            order = '<' if self.state['FORM:BORD'].upper().startswith('SWAP') else '>'
+            payload = np.asarray(values, dtype=order+'f'+str(bits//8)).tobytes()
+            length = str(len(payload)).encode()
+            return b'#' + str(len(length)).encode() + length + payload + b'\n'
+        return (','.join('%+.12E' % v for v in values) + '\n').encode()
+    
+    def respond(self, msg):
+        if not msg:
+            return None
+        header, _, arg = msg.partition(' ')
+        query = header.endswith('?')
+        key = short_form(header.rstrip('?'))
+        arg = arg.strip()
+        if key in ('*RST', 'SYST:PRES'):
+            self.reset()
+            return None
+        if key == '*IDN':
+            return b'Keysight Technologies,N5232A,FAKE,A.00.00\n'
+        if key == 'CALC:X':
+            return self.encode(self.xaxis())
+        if key == 'CALC:DATA':
+            return self.encode(self.trace())
+        if key == 'STAT:OPER:AVER1:COND':
+            return b'+2\n'
+        key = re.sub(r'(SENS|SOUR|CALC)1', r'\1', key)
+        if query:
+            return (self.state.get(key, '0') + '\n').encode()
+        if arg:
+            self.state[key] = arg
+        return None
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import DataModule as dm
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_append_read_append(tmp_path, compress):
+    fname = str(tmp_path/'map.dset')
+    x = np.linspace(0, 1, 3)
+    z = np.arange(30, dtype='float').reshape(10, 3)
+    ds = dm.dataset(fname, 'w', x=x, chunk_rows=4, compress=compress)
+    for k in range(3):
+        ds.append(z[k], k)
+    # a read in between writes the partial chunk
+    assert np.array_equal(ds.read()[2], z[:3])
+    for k in range(3, 7):
+        ds.append(z[k], k)
+    xr, yr, zr = ds.read()
+    assert np.array_equal(yr, np.arange(7))
+    assert np.array_equal(zr, z[:7])
+    for k in range(7, 10):
+        ds.append(z[k], k)
+    ds.close()
+
+    xr, yr, zr = dm.dataset(fname).read()
+    assert np.array_equal(yr, np.arange(10))
+    assert np.array_equal(zr, z)
+    assert np.array_equal(dm.dataset(fname).read(rows=slice(2, 9))[2], z[2:9])
+
+    ds = dm.dataset(fname, 'a')
+    ds.append(z[0], 10)
+    ds.close()
+    xr, yr, zr = dm.dataset(fname).read()
+    assert np.array_equal(zr, np.vstack((z, z[:1])))
+    assert len(yr) == 11
+
+
+def test_overwrite(tmp_path):
+    fname = str(tmp_path/'map.dset')
+    dm.dataset(fname, 'w', x=np.arange(3.)).close()
+    with pytest.raises(IOError):
+        dm.dataset(fname, 'w', x=np.arange(3.))
+    ds = dm.dataset(fname, 'w', x=np.arange(2.), overwrite=True)
+    ds.append([1, 2], 5)
+    ds.close()
+    xr, yr, zr = dm.dataset(fname).read()
+    assert np.array_equal(xr, [0, 1]) and np.array_equal(yr, [5]) and np.array_equal(zr, [[1, 2]])
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_read_while_writing(tmp_path, compress):
+    # a second reader sees the flushed rows, meta.json is only written by close()
+    fname = str(tmp_path/'map.dset')
+    ds = dm.dataset(fname, 'w', x=np.arange(3.), chunk_rows=2, compress=compress)
+    for k in range(5):
+        ds.append(np.full(3, k), 10+k)
+    xr, yr, zr = dm.dataset(fname).read()
+    assert np.array_equal(yr, [10, 11, 12, 13])
+    assert np.array_equal(zr[:, 0], [0, 1, 2, 3])
+    with open(str(tmp_path/'map.dset'/'meta.json')) as f:
+        assert '"nrows": 0' in f.read()
+    ds.close()
+    with open(str(tmp_path/'map.dset'/'meta.json')) as f:
+        assert '"nrows": 5' in f.read()
+    assert len(dm.dataset(fname).read()[1]) == 5
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import DataModule as dm
+
+
+def gauss(p, x):
+    return p[0]*np.exp(-(x-p[1])**2/(2*p[2]**2))
+
+
+def gauss_jac(p, x):
+    g = np.exp(-(x-p[1])**2/(2*p[2]**2))
+    return np.column_stack((g, p[0]*g*(x-p[1])/p[2]**2, p[0]*g*(x-p[1])**2/p[2]**3))
+
+
+def rows(n=6, noise=1e-3):
+    rng = np.random.default_rng(1)
+    x = np.linspace(-1, 1, 201)
+    p = np.column_stack((np.linspace(1, 2, n), np.linspace(-0.2, 0.2, n), np.linspace(0.1, 0.3, n)))
+    Y = np.array([gauss(pi, x) for pi in p]) + noise*rng.standard_normal((n, len(x)))
+    return x, p, Y
+
+
+@pytest.mark.parametrize('jac', [None, gauss_jac])
+def test_fit_batch_recovers_rows(jac):
+    x, p, Y = rows()
+    res = dm.fit_batch(gauss, [1, 0, 0.2], x, Y, jac=jac)
+    assert res['success'].all()
+    assert np.allclose(res['params'], p, rtol=1e-2, atol=1e-3)
+    assert res['cov'].shape == (6, 3, 3) and res['residual'].shape == (6,)
+
+
+def test_fit_batch_p0_per_row_and_callable():
+    x, p, Y = rows()
+    a = dm.fit_batch(gauss, p*1.05, x, Y, warm_start=False)
+    b = dm.fit_batch(gauss, lambda x, y: [y.max(), x[np.argmax(y)], 0.2], x, Y)
+    assert np.allclose(a['params'], p, rtol=1e-2, atol=1e-3)
+    assert np.allclose(b['params'], a['params'], rtol=1e-6, atol=1e-9)
+
+
+def test_fit_batch_processes():
+    x, p, Y = rows()
+    serial = dm.fit_batch(gauss, [1, 0, 0.2], x, Y, jac=gauss_jac)
+    pool = dm.fit_batch(gauss, [1, 0, 0.2], x, Y, jac=gauss_jac, processes=2)
+    assert np.allclose(pool['params'], serial['params'], rtol=1e-6, atol=1e-9)
+    assert pool['success'].all()
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+import DataModule as dm
+
+
+@pytest.mark.parametrize('kind', ['nearest', 'linear', 'cubic'])
+def test_data_2d_interp_outside_is_nan(kind):
+    d = dm.data_2d()
+    d.load_var(np.linspace(0, 1, 11), np.linspace(0, 2, 11))
+    d.interp(np.array([-0.1, 0, 0.55, 1, 1.1]), kind)
+    assert np.isnan(d.ysel[[0, -1]]).all()
+    assert np.allclose(d.ysel[1:-1], [0, 1.0 if kind == 'nearest' else 1.1, 2])
+
+
+def test_data_2d_interp_extrapolate():
+    d = dm.data_2d()
+    d.load_var(np.linspace(0, 1, 11), np.linspace(0, 2, 11))
+    d.interp(np.array([-0.1, 1.1]), fill_value=None)
+    assert np.allclose(d.ysel, [-0.2, 2.2])
+
+
+@pytest.mark.parametrize('kind', ['nearest', 'linear', 'cubic'])
+def test_data_3d_interp_outside_is_nan(kind):
+    d = dm.data_3d()
+    d.x, d.y = np.linspace(0, 1, 6), np.linspace(0, 1, 5)
+    d.z = np.add.outer(d.y, d.x)
+    d.select([0, 1], [0, 1])
+    d.interp(np.array([-0.5, 0.5]), np.array([0.5, 2]), kind)
+    assert np.isnan(d.zsel[1]).all() and np.isnan(d.zsel[:, 0]).all()
+    assert np.isfinite(d.zsel[0, 1])
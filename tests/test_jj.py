@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from scipy import optimize
+
+import JJObject as jj
+
+nominal = dict(Tc=1.23, T=20e-3, Area=4e-13, RnUnit=1300e-12, CjUnit=50e-3, Cground=30e-18)
+
+
+def junction(**kw):
+    p = dict(nominal)
+    p.update(kw)
+    return jj.junction(p['Tc'], p['T'], p['Area'], p['RnUnit'], p['CjUnit'], p['Cground'])
+
+
+def test_junction_broadcasts_like_scalars():
+    Area, T = jj.grid([2e-13, 4e-13, 8e-13], [20e-3, 300e-3])
+    j = junction(Area=Area, T=T)
+    assert j.F0.shape == (3, 2) and j.Ej.shape == (3, 2)
+    for a in range(3):
+        for t in range(2):
+            js = junction(Area=Area[a, 0], T=T[0, t])
+            for name in ('Delta', 'Rn', 'Cj', 'Ic', 'Ej', 'Ec', 'Lj', 'F0'):
+                value = np.broadcast_to(getattr(j, name), (3, 2))[a, t]
+                assert np.isclose(value, getattr(js, name), rtol=1e-12, atol=0), name
+
+
+def test_array_modes_broadcast_over_N():
+    N = np.array([10., 21.])
+    arr = jj.array(junction(), 20e-15, N)
+    modes = arr.unloadedModes
+    assert modes.shape == (2, 9)
+    for k, n in enumerate(N):
+        single = jj.array(junction(), 20e-15, n)
+        m = len(single.unloadedModes)
+        assert np.allclose(modes[k, :m], single.unloadedModes, rtol=1e-12)
+        assert np.isnan(modes[k, m:]).all()
+        assert np.isclose(arr.slipRate[k], single.slipRate, rtol=1e-12)
+
+
+def test_chandrupatla_matches_brentq():
+    c = np.array([0.5, 2., 7., 30.])
+    k = np.array([0.1, 1., 3., 10.])
+    for f, hi in ((lambda x: x**3 - c, 10.), (lambda x: np.cos(x) - k*x, np.pi/2)):
+        root = jj.chandrupatla(f, np.zeros(4), np.full(4, hi))
+        for i in range(4):
+            ref = optimize.brentq(lambda x: f(np.full(4, x))[i], 0., hi, xtol=2e-12)
+            assert abs(root[i] - ref) < 1e-10
+    assert np.isnan(jj.chandrupatla(lambda x: x - 1, np.array([0., np.nan]), np.array([2., 2.]))[1])
+
+
+def test_loaded_modes_solve_the_mode_equations():
+    arr = jj.array(junction(), 20e-15, 40.)
+    j = arr.j
+    modes = arr.loadedModes
+    n = np.arange(1., len(modes)+1)
+    assert np.all(modes < arr.unloadedModes)
+    a, r = arr.modeCoefficients(j.F0, n, arr.N, j.Cj, j.Cground, j.Ec, j.Ej)
+    b = np.where(n % 2 == 0, jj.load_even*arr.Cs*r, jj.load_odd/(arr.Cs*r))
+    eq = lambda w: np.where(n % 2 == 0, -b*w, b/w) - np.tan(a*w)
+    # every mode is a sign change of its equation
+    assert np.all(np.sign(eq(modes*(1-1e-9))) != np.sign(eq(modes*(1+1e-9))))
+
+
+def test_derived_quantities_follow_their_inputs():
+    j = junction(Area=np.array([2e-13, 4e-13]))
+    arr = jj.array(j, 20e-15, 40.)
+    F0, Ej, modes = j.F0, j.Ej, arr.unloadedModes
+    assert j.F0 is F0 and arr.unloadedModes is modes  # kept, not recomputed
+    j.update(Cground=60e-18)
+    assert j.Ej is Ej  # does not depend on Cground
+    assert j.F0 is F0
+    assert arr.unloadedModes is not modes
+    assert np.all(arr.unloadedModes[:, 0] < modes[:, 0])
+    j.update(T=300e-3)
+    assert np.all(j.Ej < Ej) and np.allclose(arr.slipRate, jj.array(junction(Area=j.Area, T=300e-3), 0., 40.).slipRate)
+
+
+def test_design_round_trip():
+    F0 = np.array([15e9, 20e9, 25e9])
+    d = jj.design(1.23, 20e-3, 50e-3, 30e-18, F0=F0, EjEc=100, Larray=50e-9, f1=5e9)
+    j = jj.junction(1.23, 20e-3, d['Area'], d['RnUnit'], 50e-3, 30e-18)
+    assert np.allclose(j.F0, F0, rtol=1e-9)
+    assert np.allclose(j.Ej/j.Ec, 100, rtol=1e-9)
+    assert np.all(d['N'] == np.rint(d['N'])) and np.allclose(d['N']*j.Lj, 50e-9, rtol=1/d['N'])
+    arr = jj.array(j, d['Cs'], d['N'])
+    assert np.allclose(arr.loadedModes[:, 0], 5e9, rtol=1e-6)
+
+    d2 = jj.design(1.23, 20e-3, 50e-3, 30e-18, RnUnit=d['RnUnit'], Area=d['Area'], slipRate=arr.slipRate)
+    assert np.array_equal(d2['N'], d['N']) and d2['Cs'] is None
+    with pytest.raises(ValueError):
+        jj.design(1.23, 20e-3, 50e-3, 30e-18, F0=F0, RnUnit=1e-9, EjEc=100, N=10)
+
+
+def test_running_stats_match_numpy():
+    rng = np.random.default_rng(2)
+    values = np.exp(0.1*rng.standard_normal((1000, 3)))*[1., 2., 5.]
+    s = jj.runningStats([1., 2., 5.], 1., nbins=400)
+    for block in np.array_split(values, 7):
+        s.push(block)
+    assert s.count == 1000
+    assert np.allclose(s.mean, values.mean(0), rtol=1e-12)
+    assert np.allclose(s.std, values.std(0, ddof=1), rtol=1e-10)
+    # percentiles within a bin (2*span/nbins in log) of numpy's
+    assert np.allclose(np.log(s.percentile([5, 50, 95])/np.percentile(values, [5, 50, 95], axis=0)), 0, atol=2/400)
+    halves = [jj.runningStats([1., 2., 5.], 1., nbins=400) for k in range(2)]
+    halves[0].push(values[:300])
+    halves[1].push(values[300:])
+    merged = halves[0].merge(halves[1])
+    assert np.allclose(merged.mean, s.mean) and np.allclose(merged.std, s.std) and np.array_equal(merged.hist, s.hist)
+    s.push([[np.nan, 1., 1.]])
+    assert s.count == 1000 and list(s.nonfinite) == [1, 0, 0]
+
+
+def test_fabrication_spread_reproducible():
+    mc = jj.fabricationSpread(junction(), 20, 0.03, 0.05, nmodes=4)
+    a = mc.run(60, seed=3, batch=16)
+    b = jj.fabricationSpread(junction(), 20, 0.03, 0.05, nmodes=4).run(60, seed=3, batch=16, processes=2)
+    for k in a:
+        assert a[k].count == 60
+        assert np.allclose(a[k].mean, b[k].mean, rtol=1e-12) and np.array_equal(a[k].hist, b[k].hist)
+    ideal = jj.fabricationSpread(junction(), 20, 0., 0., nmodes=4).run(8)
+    assert np.allclose(ideal['modes'].mean, jj.array(junction(), 0., 20.).unloadedModes[:4], rtol=1e-6)
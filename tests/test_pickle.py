@@ -0,0 +1,51 @@
+import pickle
+
+import numpy as np
+
+import DataModule as dm
+
+
+def old_pickle(cls, state):
+    # object as written by save_OBJ before the attributes were added
+    obj = object.__new__(cls)
+    obj.__dict__.update(state)
+    return pickle.dumps(obj)
+
+
+def test_load_old_data_3d():
+    x, y = np.arange(4.), np.arange(3.)
+    z = np.outer(y, x)
+    d = pickle.loads(old_pickle(dm.data_3d, {'x': x, 'y': y, 'z': z, 'comments': '',
+                                             'xsel': x, 'ysel': y, 'zsel': z}))
+    assert 'zsel' not in d.__dict__
+    assert np.array_equal(d.zsel, z)
+    d.select([1, 2], [0, 1])
+    assert np.array_equal(d.zsel, z[:2, 1:3])
+
+
+def test_load_old_data_2d():
+    x = np.arange(5.)
+    d = pickle.loads(old_pickle(dm.data_2d, {'x': x, 'y': 2*x, 'comments': '',
+                                             'xsel': x, 'ysel': 2*x}))
+    d.select([1, 3])
+    assert np.array_equal(d.ysel, [2, 4, 6])
+
+
+def test_pickle_drops_caches(tmp_path):
+    d = dm.data_3d()
+    for k in range(5):
+        d.append_row(np.arange(4.)*k, k)
+    d.store = dm.dataset(str(tmp_path/'map.dset'), 'w', x=np.arange(4.))
+    d.select([1, 2], [1, 3])
+    d.interpolator('linear')
+    d.image_pyramid()
+    state = d.__getstate__()
+    for key in d.transient:
+        assert key not in state
+    e = pickle.loads(pickle.dumps(d))
+    assert e.sort_cache == {} and e.resampler_cache is None and e.pyramid_cache is None
+    assert e.store is None
+    assert np.array_equal(e.zsel, d.zsel)
+    e.append_row(np.ones(4), 5)
+    assert np.array_equal(e.y, np.arange(6))
+    d.store.close()
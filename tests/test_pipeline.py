@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import DataModule as dm
+import ExperimentModule as em
+
+
+class StubVNA(object):
+    '''Answers the calls of ExperimentModule.vna_measure, every trace holds its sweep index.'''
+    def __init__(self, npoints=5, fail_at=None):
+        self.npoints = npoints
+        self.fail_at = fail_at
+        self.sweep = -1
+
+    def configure(self, f_range, npoints, navg, power, BW):
+        self.sweep += 1
+
+    def initiate_cont(self, arg):
+        pass
+
+    def freq_read(self):
+        return np.linspace(4e9, 8e9, self.npoints)
+
+    def trace_read_raw(self):
+        if self.sweep == self.fail_at:
+            raise IOError('transfer failed')
+        return ','.join([str(self.sweep)+',0']*self.npoints).encode()
+
+
+def test_rows_in_sweep_order():
+    dat = em.AcquisitionPipeline(StubVNA(), nworkers=3, maxsize=2).run(30, f_range=[4e9, 8e9], wait=0)
+    assert np.array_equal(dat.y, np.arange(30))
+    assert np.array_equal(dat.z, np.repeat(np.arange(30.)[:, None], 5, axis=1))
+    assert np.array_equal(dat.x, np.linspace(4e9, 8e9, 5))
+
+
+def test_store_dataset(tmp_path):
+    fname = str(tmp_path/'scan.dset')
+    pipe = em.AcquisitionPipeline(StubVNA(), fname)
+    assert pipe.run(12, f_range=[4e9, 8e9], npoints=5, wait=0) == 12
+    ds = dm.dataset(fname)
+    x, y, z = ds.read()
+    assert np.array_equal(z[:, 0], np.arange(12))
+    assert np.array_equal(y, np.arange(12))
+    assert ds.meta['settings']['npoints'] == 5
+
+
+def test_error_propagates():
+    pipe = em.AcquisitionPipeline(StubVNA(fail_at=3))
+    with pytest.raises(IOError, match='transfer failed'):
+        pipe.run(10, f_range=[4e9, 8e9], wait=0)
+    assert pipe.stats['writer']['items'] <= 3
+
+
+def test_no_sweeps():
+    dat = em.AcquisitionPipeline(StubVNA()).run(0, f_range=[4e9, 8e9], wait=0)
+    assert dat.z.shape == (0, 0)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import DataModule as dm
+import ResonatorModule as rm
+
+fr, Ql = 6e9, 1e4
+x = np.linspace(fr*(1-3/Ql), fr*(1+3/Ql), 301)
+params = {'lorentzian': [fr, fr/Ql, 0.1, 2.],
+          'notch': [fr, Ql, 2e4, 0.1, 0.9, 0.3],
+          'reflection': [fr, Ql, 3e4, -0.2, 1.1, -0.5],
+          'notch_db': [fr, Ql, 2e4, 0.1, -3.],
+          'reflection_db': [fr, Ql, 3e4, -0.2, 1.]}
+
+
+@pytest.mark.parametrize('sign', [1, -1])
+@pytest.mark.parametrize('name', sorted(params))
+def test_jacobian_matches_finite_differences(name, sign):
+    model = getattr(rm, name)
+    p = np.array(params[name])
+    p[1] *= sign  # the 'positive' parameter enters through its absolute value
+    J = model.jac(p, x)
+    assert J.shape == (len(x), len(p))
+    for i in range(len(p)):
+        # the resonance frequency moves on the scale of the linewidth
+        h = 1e-5*fr/Ql if i == 0 else 1e-6*max(abs(p[i]), 1)
+        dp = np.zeros(len(p))
+        dp[i] = h
+        fd = (model(p+dp, x) - model(p-dp, x))/(2*h)
+        assert np.abs(J[:, i] - fd).max() < 1e-5*np.abs(fd).max(), model.params[i]
+
+
+@pytest.mark.parametrize('name', ['notch', 'reflection', 'notch_db'])
+def test_guess_and_fit(name):
+    model = getattr(rm, name)
+    p = np.array(params[name])
+    y = model(p, x)
+    p_fit, cov, ss, nfev, success = dm.fit_trace(model, None, x, y)
+    assert success
+    assert np.allclose(p_fit, p, rtol=1e-6, atol=1e-8)
+    assert np.isclose(rm.qint(p_fit), rm.qint(p), rtol=1e-6)
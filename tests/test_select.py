@@ -0,0 +1,37 @@
+import numpy as np
+
+import DataModule as dm
+
+
+def test_select_after_edit():
+    d = dm.data_2d()
+    d.x = np.random.default_rng(0).permutation(np.arange(11.))
+    d.y = 2*d.x
+    d.select([0, 10])
+    assert len(d.xsel) == 11
+    d.x *= 10
+    d.select([0, 100])
+    assert len(d.xsel) == 11
+    assert np.array_equal(d.ysel, d.x/5)
+    d.x = np.arange(11.)[::-1]
+    d.select([2, 5])
+    assert np.array_equal(d.xsel, [5, 4, 3, 2])
+    # in-place changes are not seen until invalidate()
+    d.x[:] = np.arange(11.)
+    d.invalidate()
+    d.select([2, 5])
+    assert np.array_equal(d.xsel, [2, 3, 4, 5])
+
+
+def test_select_3d_after_in_place_edit():
+    d = dm.data_3d()
+    d.x = np.array([3., 1., 2.])
+    d.y = np.arange(4.)
+    d.z = np.arange(12.).reshape(4, 3)
+    d.select([1, 2], [1, 2])
+    assert np.array_equal(d.xsel, [1, 2])
+    assert np.array_equal(d.zsel, [[4, 5], [7, 8]])
+    d.x.sort()
+    d.invalidate()
+    d.select([1, 2], [1, 2])
+    assert np.array_equal(d.zsel, [[3, 4], [6, 7]])
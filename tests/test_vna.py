@@ -0,0 +1,86 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import N5232A
+import VNAModule as vm
+from fake_n5232a import FakeN5232A
+
+
+@pytest.fixture
+def fake():
+    srv = FakeN5232A(npoints=11).start()
+    vna = N5232A.VNA('127.0.0.1', srv.port)
+    yield srv, vna
+    vna.close()
+    srv.stop()
+
+
+def test_join_commands():
+    assert vm.join_commands([':SENSe1:BWID 1000', 'SOUR:POW -50 ', '*CLS']) == ':SENSe1:BWID 1000;:SOUR:POW -50;*CLS'
+
+
+def test_batch_flushes_on_query(fake):
+    srv, vna = fake
+    with vna.batch():
+        vna.IFBW(1e3)
+        vna.power(-50)
+        vna.freq_npoints()
+    assert srv.log == [':SENSe:BANDwidth:RESolution 1000.0;:SOURce:POWer:LEVel:IMMediate:AMPLitude -50',
+                       ':SENSe:SWEep:POINts?']
+
+
+@pytest.mark.parametrize('cache, skip_unchanged, sent', [(False, None, 2), (True, None, 1),
+                                                         (False, True, 1), (True, False, 2)])
+def test_batch_skip_unchanged(fake, cache, skip_unchanged, sent):
+    srv, vna = fake
+    vna.cache = cache
+    for k in range(2):
+        with vna.batch(skip_unchanged=skip_unchanged):
+            vna.power(-50)
+    vna.identify()
+    assert sum('POWer' in msg for msg in srv.log) == sent
+
+
+@pytest.mark.parametrize('before, after', [('CONT', 'CONT'), ('HOLD', 'HOLD'), ('GRO', 'HOLD')])
+def test_wait_for_average_opc_restores_sweep_mode(fake, before, after):
+    srv, vna = fake
+    srv.state['SENS:SWE:MODE'] = before
+    vna.wait_for_average(method='opc')
+    vna.identify()  # the restore is a plain write, wait until the server has seen it
+    assert any(msg.endswith('MODE GROups') for msg in srv.log)
+    assert srv.state['SENS:SWE:MODE'] == after
+
+
+@pytest.mark.parametrize('command', ['*RST', ':SYSTem:PRESet'])
+def test_reset_drops_cache_and_restores_binary_transfer(fake, command):
+    srv, vna = fake
+    vna.cache = True
+    vna.binary_mode(64)
+    vna.power(-50)
+    assert float(vna.power()) == -50
+    assert vna.cache_stats['hits'] == 1
+    vna.cmd(command, '')
+    vna.power()
+    assert vna.cache_stats['misses'] == 1
+    assert srv.log[-1].endswith('AMPLitude?')
+    assert srv.state['FORM:DATA'] == 'REAL,64'
+    assert len(vna.trace_read()) == 11
+
+
+def test_collect_scan_segments(fake):
+    srv, vna = fake
+    seen = []
+    dat, views = vna.collect_scan([[4e9, 5e9], [6e9, 8e9]], npoints_v=[11, 21], navg_v=[0], wait_v=[0],
+                                  views=True, callback=lambda i, x, y: seen.append((i, len(x))))
+    seg = dat.segments
+    assert list(seg['start']) == [0, 11] and list(seg['stop']) == [11, 32]
+    assert list(seg['npoints']) == [11, 21] and list(seg['f_stop']) == [5e9, 8e9]
+    assert len(dat.x) == 32
+    assert dat.x[0] == 4e9 and dat.x[10] == 5e9 and dat.x[11] == 6e9 and dat.x[-1] == 8e9
+    assert seen == [(0, 11), (1, 21)]
+    for (x, y), a, b in zip(views, seg['start'], seg['stop']):
+        assert np.shares_memory(x, dat.x) and np.array_equal(y, dat.y[a:b])